@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
 
-from .models import Ad, ExchangeProposal
+from .models import (
+    Ad, ArchivedAd, ArchivedExchangeProposal, ExchangeProposal
+)
 
 
 @admin.register(Ad)
@@ -18,5 +20,19 @@ class ExchangeProposalAdmin(admin.ModelAdmin):
     empty_value_display = 'Нет Информации'
 
 
+@admin.register(ArchivedAd)
+class ArchivedAdAdmin(admin.ModelAdmin):
+    """Админ.панель архивных объявлений."""
+
+    empty_value_display = 'Нет Информации'
+
+
+@admin.register(ArchivedExchangeProposal)
+class ArchivedExchangeProposalAdmin(admin.ModelAdmin):
+    """Админ.панель архивных предложений обмена."""
+
+    empty_value_display = 'Нет Информации'
+
+
 admin.site.unregister(Group)
 admin.site.empty_value_display = 'Не задано'
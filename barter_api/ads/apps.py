@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
@@ -6,3 +7,9 @@ class ApiConfig(AppConfig):
     name = 'ads'
     verbose_name = 'Объявление и предложение обмена'
     verbose_name_plural = 'Объявления и предложения обмена'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .search import ensure_search_index
+
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,113 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .constants import ARCHIVE_AGE_DAYS, ARCHIVE_BATCH_SIZE
+from .models import (
+    Ad, ArchivedAd, ArchivedExchangeProposal, ExchangeProposal
+)
+
+
+AD_ARCHIVE_FIELDS = (
+    'id', 'user_id', 'title', 'description', 'image_url', 'category',
+    'condition', 'created_at', 'updated_at', *Ad.image_fields
+)
+PROPOSAL_ARCHIVE_FIELDS = (
+    'id', 'ad_sender_id', 'ad_receiver_id', 'comment', 'status',
+    'created_at'
+)
+
+
+def get_archive_config():
+    config = getattr(settings, 'ADS_ARCHIVE', {})
+    return {
+        'age': timedelta(days=config.get('AGE_DAYS', ARCHIVE_AGE_DAYS)),
+        'batch_size': config.get('BATCH_SIZE', ARCHIVE_BATCH_SIZE),
+    }
+
+
+def get_cutoff(age=None):
+    """Граница: архивируются объявления, измененные раньше нее."""
+    if age is None:
+        age = get_archive_config()['age']
+    return timezone.now() - age
+
+
+def archivable_ads(cutoff, using=DEFAULT_DB_ALIAS):
+    """Неактивные с cutoff объявления без ожидающих предложений.
+
+    Ожидающее предложение еще может быть отменено или отклонено,
+    поэтому такие объявления остаются в основной таблице.
+    """
+    pending = ExchangeProposal.objects.using(using).filter(
+        status='pending'
+    )
+    return Ad.objects.using(using).filter(
+        is_active=False, updated_at__lt=cutoff
+    ).exclude(
+        id__in=pending.values('ad_sender_id')
+    ).exclude(
+        id__in=pending.values('ad_receiver_id')
+    )
+
+
+def archive_batch(ids, cutoff, using=DEFAULT_DB_ALIAS):
+    """Перенос объявлений ids и их предложений в одной транзакции.
+
+    Условия отбора проверяются повторно под блокировкой строк: между
+    выборкой id и переносом объявление могли снова активировать.
+    Возвращает число перенесенных объявлений и предложений.
+    """
+    with transaction.atomic(using=using):
+        ads = list(
+            archivable_ads(cutoff, using).filter(
+                id__in=ids
+            ).select_for_update().order_by('id').values(*AD_ARCHIVE_FIELDS)
+        )
+        if not ads:
+            return 0, 0
+        ids = [ad['id'] for ad in ads]
+        proposals = ExchangeProposal.objects.using(using).filter(
+            Q(ad_sender_id__in=ids) | Q(ad_receiver_id__in=ids)
+        )
+        proposal_rows = list(
+            proposals.order_by('id').values(*PROPOSAL_ARCHIVE_FIELDS)
+        )
+        ArchivedAd.objects.using(using).bulk_create(
+            [ArchivedAd(**row) for row in ads]
+        )
+        ArchivedExchangeProposal.objects.using(using).bulk_create(
+            [ArchivedExchangeProposal(**row) for row in proposal_rows]
+        )
+        proposals.delete()
+        Ad.objects.using(using).filter(id__in=ids).delete()
+    return len(ads), len(proposal_rows)
+
+
+def archive_inactive_ads(age=None, batch_size=None, using=DEFAULT_DB_ALIAS,
+                         pause=0):
+    """Перенос старых неактивных объявлений в архив пачками.
+
+    Каждая пачка - отдельная короткая транзакция, между пачками
+    можно сделать паузу, чтобы не мешать живому трафику. Генератор
+    отдает число объявлений и предложений в каждой пачке.
+    """
+    cutoff = get_cutoff(age)
+    batch_size = batch_size or get_archive_config()['batch_size']
+    while True:
+        ids = list(
+            archivable_ads(cutoff, using).order_by(
+                'updated_at', 'id'
+            ).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        archived = archive_batch(ids, cutoff, using)
+        if archived[0]:
+            yield archived
+        if pause:
+            time.sleep(pause)
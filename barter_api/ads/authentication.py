@@ -0,0 +1,224 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from .constants import (
+    ADS_CACHE_PREFIX, AUTH_CACHE_FIELDS, AUTH_CACHE_LOCAL_TIMEOUT,
+    AUTH_CACHE_MAX_SIZE, AUTH_CACHE_TIMEOUT
+)
+
+
+def get_auth_cache_config():
+    config = getattr(settings, 'ADS_AUTH_CACHE', {})
+    return {
+        'MAX_SIZE': AUTH_CACHE_MAX_SIZE,
+        'LOCAL_TIMEOUT': AUTH_CACHE_LOCAL_TIMEOUT,
+        'TIMEOUT': AUTH_CACHE_TIMEOUT,
+        'SHARED_ALIAS': None,
+        **config,
+    }
+
+
+class TokenCache:
+    """Кэш пользователей по токену из двух уровней.
+
+    Первый уровень - LRU в памяти процесса на MAX_SIZE записей с
+    таймаутом LOCAL_TIMEOUT. Второй, необязательный, - кэш Django
+    SHARED_ALIAS, общий для процессов, с таймаутом TIMEOUT. Ключи
+    второго уровня содержат хэш токена, а не сам токен.
+
+    Кэшируются только поля AUTH_CACHE_FIELDS, без хэша пароля и
+    личных данных; остальные поля объекта отложены и читаются из
+    базы при обращении. Каждый запрос получает свой объект. Запись
+    в общем кэше хранит версию токена, и попадание в первый уровень
+    сверяет ее: удаление токена и изменение пользователя меняют
+    версию и сбрасывают запись во всех процессах. Без SHARED_ALIAS
+    сброс виден только своему процессу.
+
+    Сброс идет по сигналам моделей: QuerySet.update() и delete() их
+    не отправляют, после них нужно вызвать invalidate() с ключами
+    затронутых токенов.
+    """
+
+    def __init__(self, max_size=None, local_timeout=None, timeout=None,
+                 shared_alias=None):
+        self.options = {
+            'MAX_SIZE': max_size,
+            'LOCAL_TIMEOUT': local_timeout,
+            'TIMEOUT': timeout,
+            'SHARED_ALIAS': shared_alias,
+        }
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        """Очистка первого уровня и перечитывание настроек."""
+        config = get_auth_cache_config()
+        config.update({
+            name: value for name, value in self.options.items()
+            if value is not None
+        })
+        with self.lock:
+            self.config = config
+            self.entries = OrderedDict()
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
+
+    @property
+    def shared(self):
+        alias = self.config['SHARED_ALIAS']
+        return None if alias is None else caches[alias]
+
+    def shared_key(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return f'{ADS_CACHE_PREFIX}:token:{digest}'
+
+    def version_key(self, key):
+        return f'{self.shared_key(key)}:version'
+
+    def get_version(self, key):
+        """Версия токена в общем кэше; None без общего кэша."""
+        if self.shared is None:
+            return None
+        version_key = self.version_key(key)
+        version = self.shared.get(version_key)
+        if version is None:
+            version = time.time_ns()
+            if not self.shared.add(
+                version_key, version, self.config['TIMEOUT']
+            ):
+                version = self.shared.get(version_key, version)
+        return version
+
+    def current_version(self, key):
+        """Версия токена и номер последнего сброса в процессе."""
+        with self.lock:
+            generation = self.generation
+        return self.get_version(key), generation
+
+    def pack(self, user):
+        """Значения полей AUTH_CACHE_FIELDS для кэша."""
+        return user._state.db, tuple(
+            getattr(user, name) for name in AUTH_CACHE_FIELDS
+        )
+
+    def unpack(self, data):
+        """Новый объект пользователя с отложенными прочими полями."""
+        db, values = data
+        return get_user_model().from_db(db, AUTH_CACHE_FIELDS, values)
+
+    def get(self, key):
+        """Пользователь по токену или None."""
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """Пользователь по токену или None и версия для set().
+
+        Версия берется до чтения из базы: если запись сбросили, пока
+        шло чтение, set() с этой версией ее не восстановит.
+        """
+        now = time.monotonic()
+        version = self.current_version(key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, entry_version, data = entry
+                if expires > now and entry_version == version[0]:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self.unpack(data), version
+                del self.entries[key]
+        data = None
+        if self.shared is not None:
+            data = self.shared.get(f'{self.shared_key(key)}:{version[0]}')
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                return None, version
+            self.shared_hits += 1
+        self.set_local(key, version, data)
+        return self.unpack(data), version
+
+    def set_local(self, key, version, data):
+        """Запись первого уровня, если после чтения не было сброса."""
+        shared_version, generation = version
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (
+                time.monotonic() + self.config['LOCAL_TIMEOUT'],
+                shared_version, data
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.config['MAX_SIZE']:
+                self.entries.popitem(last=False)
+
+    def set(self, key, user, version=None):
+        """Запись пользователя под версией, полученной из lookup()."""
+        if version is None:
+            version = self.current_version(key)
+        data = self.pack(user)
+        self.set_local(key, version, data)
+        if self.shared is not None:
+            self.shared.set(
+                f'{self.shared_key(key)}:{version[0]}', data,
+                self.config['TIMEOUT']
+            )
+
+    def invalidate(self, *keys):
+        """Сброс записей; смена версии сбрасывает их во всех процессах."""
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self.entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete_many([self.version_key(key) for key in keys])
+
+    def invalidate_on_commit(self, *keys):
+        """Сброс сразу и повторно после фиксации транзакции.
+
+        Повторный сброс убирает запись, закэшированную конкурентным
+        запросом, который успел прочитать токен до фиксации.
+        """
+        self.invalidate(*keys)
+        transaction.on_commit(lambda: self.invalidate(*keys))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем пользователя по токену.
+
+    Попадание в кэш обходится без запроса токена и пользователя к
+    базе; request.auth тогда - несохраненный объект токена с тем же
+    ключом. Неизвестные и неактивные токены не кэшируются.
+    """
+
+    cache = token_cache
+
+    def authenticate_credentials(self, key):
+        user, version = self.cache.lookup(key)
+        if user is not None:
+            return user, self.get_model()(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        self.cache.set(key, user, version)
+        return user, token
@@ -0,0 +1,499 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path
+from rest_framework.test import APIClient
+
+from .cache import ad_cache
+from .constants import (
+    BENCH_BATCH_SIZE, BENCH_USER_PREFIX, BENCH_WORDS,
+    CATEGORY_CHOICES, CONDITION_CHOICES, PAGE_SIZE
+)
+from .counters import reconcile_counters
+from .matching import matching_engine
+from .models import Ad, ExchangeProposal
+from .recommendations import recommendation_engine
+
+
+User = get_user_model()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def generate_data(users, ads, proposals, batch_size=BENCH_BATCH_SIZE,
+                  seed=0, log=None):
+    """Заполнение базы синтетическими данными через bulk_create.
+
+    bulk_create не отправляет сигналы моделей, поэтому после вставки
+    счетчики пересчитываются, а кэш ленты и движки сбрасываются.
+    Возвращает число созданных пользователей, объявлений и предложений.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    start = User.objects.filter(
+        username__startswith=BENCH_USER_PREFIX
+    ).count()
+    user_ids = []
+    for batch in batched(range(start, start + users), batch_size):
+        created = User.objects.bulk_create([
+            User(username=f'{BENCH_USER_PREFIX}{index}', password='!')
+            for index in batch
+        ])
+        user_ids.extend(user.pk for user in created)
+        log(f'Пользователи: {len(user_ids)}/{users}')
+
+    categories = [value for value, _ in CATEGORY_CHOICES]
+    conditions = [value for value, _ in CONDITION_CHOICES]
+
+    def make_ad():
+        words = rng.sample(BENCH_WORDS, 3)
+        return Ad(
+            user_id=rng.choice(user_ids),
+            title=' '.join(words).capitalize(),
+            description=(
+                f'{" ".join(rng.sample(BENCH_WORDS, 6))} '
+                f'в хорошем состоянии, обмен на {rng.choice(BENCH_WORDS)}'
+            ),
+            category=rng.choice(categories),
+            condition=rng.choice(conditions)
+        )
+
+    ad_ids, owners = [], {}
+    for batch in batched(range(ads), batch_size):
+        created = Ad.objects.bulk_create([make_ad() for _ in batch])
+        ad_ids.extend(ad.pk for ad in created)
+        owners.update((ad.pk, ad.user_id) for ad in created)
+        log(f'Объявления: {len(ad_ids)}/{ads}')
+
+    created_proposals = 0
+    for batch in batched(range(proposals), batch_size):
+        pairs = set()
+        for _ in batch:
+            sender, receiver = rng.sample(ad_ids, 2)
+            pairs.add((sender, receiver))
+        ExchangeProposal.objects.bulk_create(
+            [
+                ExchangeProposal(
+                    ad_sender_id=sender,
+                    ad_receiver_id=receiver,
+                    sender_user_id=owners[sender],
+                    receiver_user_id=owners[receiver]
+                )
+                for sender, receiver in pairs
+            ],
+            ignore_conflicts=True
+        )
+        created_proposals += len(pairs)
+        log(f'Предложения: {created_proposals}/{proposals}')
+
+    reconcile_counters()
+    ad_cache.invalidate()
+    for engine in (matching_engine, recommendation_engine):
+        engine.reset()
+        engine.note_write()
+    return {
+        'users': len(user_ids),
+        'ads': len(ad_ids),
+        'proposals': created_proposals,
+    }
+
+
+@dataclass
+class BenchRequest:
+    method: str
+    path: str
+    params: dict = field(default_factory=dict)
+    data: dict = None
+    auth: bool = False
+    cached: bool = False
+
+
+class Scenarios:
+    """Сценарии нагрузки: каждый возвращает очередной запрос.
+
+    Перед каждым запросом кэш ленты и карточек сбрасывается, и
+    замеряется чтение из базы. Сценарии *_cached повторяют один и тот
+    же запрос без сброса и замеряют попадания в кэш.
+    """
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.pages = max(Ad.objects.active().count() // PAGE_SIZE, 1)
+        bench_user = User.objects.filter(
+            username__startswith=BENCH_USER_PREFIX, ads__is_active=True
+        ).first()
+        self.user = bench_user
+        self.user_ad_id = (
+            bench_user.ads.filter(is_active=True).values_list(
+                'id', flat=True
+            ).first()
+            if bench_user else None
+        )
+        self.ad_ids = list(
+            Ad.objects.active().values_list('id', flat=True)[:1000]
+        )
+
+    def feed(self):
+        return BenchRequest('get', '/api/ads/', {
+            'page': self.rng.randint(1, min(self.pages, 100))
+        })
+
+    def feed_cached(self):
+        return BenchRequest('get', '/api/ads/', cached=True)
+
+    def detail(self):
+        return BenchRequest(
+            'get', f'/api/ads/{self.rng.choice(self.ad_ids)}/'
+        )
+
+    def detail_cached(self):
+        return BenchRequest('get', f'/api/ads/{self.ad_ids[0]}/', cached=True)
+
+    def feed_cursor(self):
+        return BenchRequest('get', '/api/ads/', {'pagination': 'cursor'})
+
+    def search(self):
+        return BenchRequest('get', '/api/ads/', {
+            'search': self.rng.choice(BENCH_WORDS)
+        })
+
+    def filtered(self):
+        return BenchRequest('get', '/api/ads/', {
+            'category': self.rng.choice(CATEGORY_CHOICES)[0],
+            'condition': self.rng.choice(CONDITION_CHOICES)[0],
+        })
+
+    def proposal_create(self):
+        return BenchRequest('post', '/api/proposals/', data={
+            'ad_sender_id': self.user_ad_id,
+            'ad_receiver_id': self.rng.choice(self.ad_ids),
+            'comment': 'Предлагаю обмен',
+        }, auth=True)
+
+    def my_proposals(self):
+        return BenchRequest('get', '/api/my-proposals/', auth=True)
+
+    def my_proposals_cursor(self):
+        return BenchRequest('get', '/api/my-proposals/', {
+            'pagination': 'cursor'
+        }, auth=True)
+
+    # Сценарии, которым нужны данные generate_data.
+    data_names = {
+        'detail', 'detail_cached', 'proposal_create', 'my_proposals',
+        'my_proposals_cursor'
+    }
+
+    @classmethod
+    def names(cls):
+        return [
+            'feed', 'feed_cached', 'feed_cursor', 'search', 'filtered',
+            'detail', 'detail_cached', 'proposal_create', 'my_proposals',
+            'my_proposals_cursor'
+        ]
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    throughput_rps: float
+    queries_per_request: float = None
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(name, timings, errors, elapsed, queries=None):
+    return ScenarioResult(
+        scenario=name,
+        requests=len(timings),
+        errors=errors,
+        p50_ms=round(statistics.median(timings) * 1000, 3),
+        p95_ms=round(percentile(timings, 0.95) * 1000, 3),
+        p99_ms=round(percentile(timings, 0.99) * 1000, 3),
+        throughput_rps=round(len(timings) / elapsed, 1),
+        queries_per_request=(
+            round(sum(queries) / len(queries), 2) if queries else None
+        )
+    )
+
+
+class InProcessRunner:
+    """Запросы через тестовый клиент DRF в текущем процессе.
+
+    Лимиты запросов на время прогона отключаются: замеряется
+    обработка запроса, а не ответ 429.
+    """
+
+    def __init__(self, user=None):
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.user = user
+
+    def run(self, name, make_request, count):
+        with override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}
+        }):
+            return self.run_requests(name, make_request, count)
+
+    def run_requests(self, name, make_request, count):
+        timings, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(count):
+            request = make_request()
+            if not request.cached:
+                ad_cache.invalidate()
+            self.client.force_authenticate(
+                user=self.user if request.auth else None
+            )
+            with CaptureQueriesContext(connection) as context:
+                begin = time.perf_counter()
+                if request.method == 'get':
+                    response = self.client.get(request.path, request.params)
+                else:
+                    response = self.client.post(
+                        request.path, request.data, format='json'
+                    )
+                timings.append(time.perf_counter() - begin)
+            queries.append(len(context))
+            errors += response.status_code >= 500
+        return summarize(
+            name, timings, errors, time.perf_counter() - started, queries
+        )
+
+
+class HttpRunner:
+    """Запросы к запущенному серверу по HTTP в несколько потоков.
+
+    Кэш ленты сбрасывается перед запросом, только если сервер
+    использует тот же общий кэш, что и прогон.
+    """
+
+    def __init__(self, base_url, token=None, concurrency=1):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.concurrency = concurrency
+
+    def send(self, request):
+        url = self.base_url + request.path
+        if request.params:
+            url += '?' + urllib.parse.urlencode(request.params)
+        body = None
+        headers = {'Accept': 'application/json'}
+        if request.data is not None:
+            body = json.dumps(request.data).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if request.auth and self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        if not request.cached:
+            ad_cache.invalidate()
+        begin = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(
+                url, data=body, headers=headers, method=request.method.upper()
+            )) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        return time.perf_counter() - begin, status
+
+    def run(self, name, make_request, count):
+        requests = [make_request() for _ in range(count)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            results = list(pool.map(self.send, requests))
+        return summarize(
+            name,
+            [timing for timing, _ in results],
+            sum(status >= 500 for _, status in results),
+            time.perf_counter() - started
+        )
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Список регрессий относительно сохраненного прогона."""
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.scenario)
+        if previous is None:
+            continue
+        if result.p95_ms > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{result.scenario}: p95 {result.p95_ms} мс "
+                f"против {previous['p95_ms']} мс"
+            )
+        if result.throughput_rps < previous['throughput_rps'] * (
+            1 - tolerance
+        ):
+            regressions.append(
+                f"{result.scenario}: {result.throughput_rps} запросов/с "
+                f"против {previous['throughput_rps']}"
+            )
+        if (
+            result.queries_per_request is not None
+            and previous.get('queries_per_request') is not None
+            and result.queries_per_request > previous['queries_per_request']
+        ):
+            regressions.append(
+                f"{result.scenario}: {result.queries_per_request} "
+                f"запросов к БД против {previous['queries_per_request']}"
+            )
+    return regressions
+
+
+def results_to_baseline(results):
+    return {result.scenario: asdict(result) for result in results}
+
+
+class SlowClientBench:
+    """Много медленных клиентов против WSGI- и ASGI-обработчика.
+
+    Каждый клиент тратит latency секунд на отправку запроса и на прием
+    ответа. WSGI-воркер при этом занят весь запрос, поэтому пропускная
+    способность ограничена числом воркеров; ASGI ждет клиентов в цикле
+    событий. Режим asgi-sync обслуживает синхронные view через ASGI,
+    asgi-async - их async-версии.
+    """
+
+    modes = ('wsgi', 'asgi-sync', 'asgi-async')
+
+    def __init__(self, path, clients, requests_per_client, latency,
+                 workers):
+        self.path, _, self.query = path.partition('?')
+        self.clients = clients
+        self.requests_per_client = requests_per_client
+        self.latency = latency
+        self.workers = workers
+
+    def get_urlconf(self, async_views):
+        from .urls import get_urlpatterns
+
+        class Urls:
+            urlpatterns = [
+                path('api/', include(get_urlpatterns(async_views)))
+            ]
+
+        return Urls
+
+    def run(self, mode):
+        with override_settings(
+            ROOT_URLCONF=self.get_urlconf(mode == 'asgi-async')
+        ):
+            started = time.perf_counter()
+            if mode == 'wsgi':
+                timings, errors = self.run_wsgi()
+            else:
+                timings, errors = asyncio.run(self.run_asgi())
+            return summarize(
+                mode, timings, errors, time.perf_counter() - started
+            )
+
+    def run_wsgi(self):
+        handler = WSGIHandler()
+        workers = threading.BoundedSemaphore(self.workers)
+        timings, statuses = [], []
+
+        def request():
+            begin = time.perf_counter()
+            with workers:
+                time.sleep(self.latency)
+                body = handler({
+                    'REQUEST_METHOD': 'GET',
+                    'PATH_INFO': self.path,
+                    'QUERY_STRING': self.query,
+                    'SERVER_NAME': 'localhost',
+                    'SERVER_PORT': '80',
+                    'HTTP_HOST': 'localhost',
+                    'HTTP_ACCEPT': 'application/json',
+                    'wsgi.input': BytesIO(),
+                    'wsgi.url_scheme': 'http',
+                }, lambda status, headers: statuses.append(int(status[:3])))
+                for _ in body:
+                    pass
+                body.close()
+                time.sleep(self.latency)
+            timings.append(time.perf_counter() - begin)
+
+        def client(_):
+            for _ in range(self.requests_per_client):
+                request()
+
+        with ThreadPoolExecutor(self.clients) as pool:
+            list(pool.map(client, range(self.clients)))
+        return timings, sum(status >= 500 for status in statuses)
+
+    async def run_asgi(self):
+        handler = ASGIHandler()
+        timings, statuses = [], []
+
+        async def request():
+            done = asyncio.Event()
+            received = False
+
+            async def receive():
+                nonlocal received
+                if received:
+                    await done.wait()
+                    return {'type': 'http.disconnect'}
+                received = True
+                await asyncio.sleep(self.latency)
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif not message.get('more_body'):
+                    await asyncio.sleep(self.latency)
+                    done.set()
+
+            begin = time.perf_counter()
+            await handler({
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': self.path,
+                'query_string': self.query.encode(),
+                'headers': [
+                    (b'host', b'localhost'),
+                    (b'accept', b'application/json'),
+                ],
+                'server': ('localhost', 80),
+            }, receive, send)
+            timings.append(time.perf_counter() - begin)
+
+        async def client():
+            for _ in range(self.requests_per_client):
+                await request()
+
+        await asyncio.gather(*(client() for _ in range(self.clients)))
+        return timings, sum(status >= 500 for status in statuses)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .constants import (
+    ADS_CACHE_ALIAS, ADS_CACHE_PREFIX, ADS_CACHE_TIMEOUT
+)
+from .routing import replica_cache_timeout
+
+
+class AdCache:
+    """Read-through кэш сериализованных объявлений и страниц ленты.
+
+    Фасеты ленты кэшируются по параметрам фильтров и версии ленты.
+    Ключи содержат версию: у ленты общая, у каждого объявления своя.
+    Инвалидация удаляет ключ версии, после чего старые записи
+    становятся недостижимыми и вытесняются по таймауту. Сброс виден
+    другим процессам, только если кэш ALIAS общий для них.
+    """
+
+    def __init__(self, alias=None, timeout=None):
+        config = getattr(settings, 'ADS_CACHE', {})
+        self.alias = alias or config.get('ALIAS', ADS_CACHE_ALIAS)
+        self.timeout = timeout or config.get('TIMEOUT', ADS_CACHE_TIMEOUT)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_version(self, key):
+        """Текущая версия; новая начинается с метки времени."""
+        version = self.cache.get(key)
+        if version is None:
+            version = time.time_ns()
+            if not self.cache.add(key, version, timeout=None):
+                version = self.cache.get(key, version)
+        return version
+
+    def list_version_key(self):
+        return f'{ADS_CACHE_PREFIX}:list:version'
+
+    def detail_version_key(self, pk):
+        return f'{ADS_CACHE_PREFIX}:detail:{pk}:version'
+
+    def list_key(self, request):
+        """Ключ страницы ленты по хосту, пути и параметрам фильтров."""
+        signature = json.dumps(
+            [request.get_host(), request.path,
+             sorted(request.query_params.lists())],
+            ensure_ascii=False
+        )
+        digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+        version = self.get_version(self.list_version_key())
+        return f'{ADS_CACHE_PREFIX}:list:{version}:{digest}'
+
+    def facets_key(self, signature):
+        """Ключ фасетов по параметрам фильтров, без пагинации."""
+        digest = hashlib.md5(
+            json.dumps(signature, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        version = self.get_version(self.list_version_key())
+        return f'{ADS_CACHE_PREFIX}:facets:{version}:{digest}'
+
+    def detail_key(self, pk):
+        version = self.get_version(self.detail_version_key(pk))
+        return f'{ADS_CACHE_PREFIX}:detail:{pk}:{version}'
+
+    def get(self, key):
+        data = self.cache.get(key)
+        with self.lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        """Сохраняет запись под ключом, полученным до чтения из базы.
+
+        Ключ не пересчитывается: если версию сбросили, пока шло
+        чтение, запись ляжет под старую версию и не будет прочитана.
+        """
+        self.cache.set(key, data, replica_cache_timeout(self.timeout))
+
+    def invalidate(self, *pks):
+        """Сбрасывает ленту и карточки указанных объявлений."""
+        self.cache.delete_many(
+            [self.list_version_key()]
+            + [self.detail_version_key(pk) for pk in pks]
+        )
+
+    def invalidate_on_commit(self, *pks):
+        """Сброс сразу и повторно после фиксации транзакции.
+
+        Повторный сброс убирает страницы, закэшированные конкурентным
+        чтением между записью и фиксацией.
+        """
+        self.invalidate(*pks)
+        transaction.on_commit(lambda: self.invalidate(*pks))
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+
+ad_cache = AdCache()
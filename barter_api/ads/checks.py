@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .routing import get_routing_config
+
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_replica_cache(app_configs, **kwargs):
+    """Метка read-your-writes должна храниться в общем кэше.
+
+    В кэше процесса ее не видят другие процессы, и пользователь,
+    записавший через один из них, читает из отстающей реплики
+    через другой.
+    """
+    config = get_routing_config()
+    if not config['REPLICAS']:
+        return []
+    alias = config['CACHE_ALIAS']
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Error(
+        f"Кэш '{alias}' для маршрутизации по репликам не общий для "
+        "процессов.",
+        hint=(
+            "Задайте REDIS_URL или CACHE_DIR либо укажите общий кэш в "
+            "ADS_DATABASE_ROUTING['CACHE_ALIAS']."
+        ),
+        id='ads.E001',
+    )]
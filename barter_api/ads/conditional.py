@@ -0,0 +1,76 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def get_value(item, name):
+    """Значение поля для объекта модели или строки .values()."""
+    if isinstance(item, dict):
+        return item[name]
+    return getattr(item, name)
+
+
+def timestamp_us(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def ad_validators(ad):
+    """ETag и Last-Modified карточки по id и датам создания и изменения."""
+    updated_at = get_value(ad, 'updated_at')
+    return {
+        'etag': 'W/"ad-{}-{}-{}"'.format(
+            get_value(ad, 'id'),
+            timestamp_us(get_value(ad, 'created_at')),
+            timestamp_us(updated_at)
+        ),
+        'last_modified': int(updated_at.timestamp()),
+    }
+
+
+def page_validators(state, rows):
+    """ETag страницы по состоянию пагинации и версиям ее строк.
+
+    state - то, что кроме строк влияет на ответ (число записей
+    фильтра или наличие соседних страниц). Last-Modified для
+    страниц не отдается: после удаления записи максимум дат
+    изменения может уменьшиться.
+    """
+    signature = json.dumps([
+        state,
+        [
+            [get_value(row, 'id'), timestamp_us(get_value(row, 'updated_at'))]
+            for row in rows
+        ],
+    ])
+    digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+    return {'etag': f'W/"ads-{digest}"', 'last_modified': None}
+
+
+def set_validators(response, validators):
+    response['ETag'] = validators['etag']
+    if validators['last_modified'] is not None:
+        response['Last-Modified'] = http_date(validators['last_modified'])
+    return response
+
+
+def not_modified(request, validators):
+    """Ответ 304 (или 412), если условия запроса выполнены, иначе None."""
+    response = get_conditional_response(
+        request,
+        etag=validators['etag'],
+        last_modified=validators['last_modified']
+    )
+    if response is None:
+        return None
+    return set_validators(response, validators)
+
+
+def cached_response(request, entry):
+    """Ответ по записи кэша с данными и валидаторами."""
+    response = not_modified(request, entry)
+    if response is None:
+        response = set_validators(Response(entry['data']), entry)
+    return response
@@ -1,3 +1,26 @@
+ADS_CACHE_ALIAS = 'default'
+ADS_CACHE_PREFIX = 'ads:v2'
+ADS_CACHE_TIMEOUT = 300
+AUTH_CACHE_FIELDS = (
+    'id', 'username', 'is_active', 'is_staff', 'is_superuser'
+)
+AUTH_CACHE_LOCAL_TIMEOUT = 30
+AUTH_CACHE_MAX_SIZE = 10_000
+AUTH_CACHE_TIMEOUT = 300
+BENCH_BATCH_SIZE = 5000
+BENCH_TOLERANCE = 0.2
+BENCH_USER_PREFIX = 'bench_'
+BENCH_WORDS = [
+    'велосипед', 'книга', 'куртка', 'наушники', 'телефон', 'ноутбук',
+    'лампа', 'стул', 'стол', 'чайник', 'пальто', 'ботинки', 'часы',
+    'гитара', 'палатка', 'рюкзак', 'самокат', 'коляска', 'диван',
+    'пылесос', 'планшет', 'фотоаппарат', 'удочка', 'лыжи', 'коньки',
+    'свитер', 'платье', 'шкаф', 'ковер', 'зеркало',
+]
+ARCHIVE_AGE_DAYS = 90
+ARCHIVE_BATCH_SIZE = 500
+BULK_BATCH_SIZE = 500
+BULK_SIZE_MAX = 1000
 CONDITION_CHOICES = [
     ('new', 'Новый'),
     ('used', 'Б/у'),
@@ -10,12 +33,78 @@ CATEGORY_CHOICES = [
     ('home', 'Дом и сад'),
     ('other', 'Другое'),
 ]
+CURSOR_QUERY_PARAM = 'cursor'
 DESC_LENGHT_MIN = 20
+ENGINE_CHECK_INTERVAL = 1
+ENGINE_MAX_AGE = 600
+ENGINE_RELOAD_INTERVAL = 10
+EVENTS_BACKEND_DEFAULT = 'ads.events.LocalEventBackend'
+EVENTS_HEARTBEAT = 15
+EVENTS_HISTORY_MAX = 1000
+EVENTS_HISTORY_TTL = 3600
+EVENTS_LAST_ID_QUERY_PARAM = 'last_event_id'
+EVENTS_QUEUE_MAX = 100
+EVENTS_RETRY_MS = 3000
+EXPLAIN_FULL_SCAN_PATTERNS = {
+    'sqlite': {
+        'scan': r'SCAN ads_ad$',
+        'sort': r'USE TEMP B-TREE FOR ORDER BY',
+    },
+    'postgresql': {
+        'scan': r'Seq Scan on ads_ad\b',
+        'sort': r'Sort\b.*(?:\n.*)*?\n\s*->  Seq Scan on ads_ad\b',
+    },
+}
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMAT_DEFAULT = 'ndjson'
+EXPORT_FORMAT_QUERY_PARAM = 'export_format'
+FACETS_QUERY_PARAM = 'facets'
+IMAGE_STATUS_CHOICES = [
+    ('ready', 'Готово'),
+    ('invalid', 'Не изображение'),
+]
 LENGHT_MAX = 50
+MATCH_CYCLES_MAX = 50
+MATCH_DEPTH_MAX = 4
+MATCH_SUGGESTIONS_MAX = 20
 PAGE_SIZE = 10
+PERF_HISTOGRAM_BUCKETS_MS = (
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000
+)
+PERF_INSTRUMENTATION_DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.01,
+    'SERVER_TIMING': True,
+    'LOG': False,
+}
 PAGE_SIZE_QUERY_PARAM = 'page_size'
 PAGE_SIZE_MAX = 100
 PAGE_QUERY_PARAM = 'page'
+PAGINATION_QUERY_PARAM = 'pagination'
+PAGINATION_CURSOR = 'cursor'
+PROPOSAL_DIRECTIONS = {
+    'incoming': 'receiver_user',
+    'outgoing': 'sender_user',
+}
+RECOMMEND_CACHE_SECONDS = 60
+RECOMMEND_CANDIDATES = 100
+RECOMMEND_LIMIT = 20
+RECOMMEND_LIMIT_MAX = 100
+RECOMMEND_RECENCY_DAYS = 14
+RECOMMEND_WEIGHTS = {
+    'own': 0.5,
+    'proposed': 2.0,
+    'received': 1.0,
+    'accepted': 3.0,
+    'rejected': -2.0,
+    'affinity': 1.0,
+    'recency': 0.5,
+    'interest': 0.5,
+}
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+REPLICA_STICKY_SECONDS = 5
+SEARCH_CONFIG = 'russian'
+SEARCH_STEM_MIN = 3
 STATUS_LENGHT_MAX = 20
 STATUS_CHOICES = [
     ('pending', 'Ожидает'),
@@ -23,5 +112,24 @@ STATUS_CHOICES = [
     ('rejected', 'Отклонена'),
     ('canceled', 'Отменена'),
 ]
+STATUS_RECEIVER_ACTIONS = ('accepted', 'rejected')
+STATUS_SENDER_ACTIONS = ('canceled',)
+STATUS_TRANSITIONS = {
+    'pending': ('accepted', 'rejected', 'canceled'),
+}
+THROTTLE_KEYS_MAX = 100_000
+THROTTLE_RETRY_AFTER = 1
+THROTTLE_STORE_DEFAULT = 'ads.throttling.LocalRateStore'
+THROTTLE_WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+THUMBNAIL_CACHE_TIMEOUT = 60 * 60 * 24
+THUMBNAIL_FETCH_TIMEOUT = 5
+THUMBNAIL_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+THUMBNAIL_PIXELS_MAX = 40_000_000
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_QUEUE_MAX = 1000
+THUMBNAIL_REDIRECTS_MAX = 5
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_SOURCE_BYTES_MAX = 10 * 1024 * 1024
+THUMBNAIL_WORKERS = 4
 TITLE_LENGHT_MAX = 200
 TITLE_LENGHT_MIN = 5
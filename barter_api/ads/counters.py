@@ -0,0 +1,125 @@
+from collections import Counter, defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Count
+
+from .models import Ad, CategoryCounter, ExchangeProposal, UserCounter
+
+
+class CounterDeltas:
+    """Приращения счетчиков, накопленные одной операцией записи."""
+
+    def __init__(self):
+        self.categories = defaultdict(Counter)
+        self.users = defaultdict(Counter)
+
+    def add_ad(self, user_id, category, sign=1):
+        self.categories[category]['active_ads'] += sign
+        self.users[user_id]['active_ads'] += sign
+
+    def add_proposal(self, sender_user_id, receiver_user_id, sign=1):
+        self.users[sender_user_id]['pending_outgoing'] += sign
+        self.users[receiver_user_id]['pending_incoming'] += sign
+
+    def apply(self, using=None):
+        """Запись приращений в текущей транзакции."""
+        CategoryCounter.objects.using(using).apply(self.categories)
+        UserCounter.objects.using(using).apply(self.users)
+
+
+def compute_counters(using=None):
+    """Точные значения счетчиков, посчитанные GROUP BY по таблицам."""
+    ads = Ad.objects.using(using).active().order_by()
+    pending = ExchangeProposal.objects.using(using).filter(
+        status='pending'
+    ).order_by()
+    categories = defaultdict(Counter)
+    users = defaultdict(Counter)
+    for category, count in ads.values_list('category').annotate(
+        Count('id')
+    ):
+        categories[category]['active_ads'] = count
+    for field, lookup in (
+        ('active_ads', None),
+        ('pending_incoming', 'receiver_user_id'),
+        ('pending_outgoing', 'sender_user_id'),
+    ):
+        queryset = ads.values_list('user_id') if lookup is None else (
+            pending.values_list(lookup)
+        )
+        for user_id, count in queryset.annotate(Count('id')):
+            users[user_id][field] = count
+    return {CategoryCounter: categories, UserCounter: users}
+
+
+def lock_counter_tables(using):
+    """Блокировка исходных таблиц и таблиц счетчиков до конца транзакции.
+
+    Записи объявлений и предложений меняют счетчики в своей
+    транзакции, поэтому, пока таблицы заблокированы, ни GROUP BY, ни
+    строки счетчиков не меняются. PostgreSQL блокирует исходные
+    таблицы в режиме SHARE, таблицы счетчиков - EXCLUSIVE; SQLite
+    пустым UPDATE сразу берет блокировку записи на всю базу.
+    """
+    connection = connections[using]
+    sources = [Ad, ExchangeProposal]
+    counters = [CategoryCounter, UserCounter]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for group, mode in ((sources, 'SHARE'), (counters, 'EXCLUSIVE')):
+                tables = ', '.join(
+                    quote(model._meta.db_table) for model in group
+                )
+                cursor.execute(f'LOCK TABLE {tables} IN {mode} MODE')
+        else:
+            for model in counters:
+                field = quote(model.counter_fields[0])
+                cursor.execute(
+                    f'UPDATE {quote(model._meta.db_table)} '
+                    f'SET {field} = {field} WHERE 1 = 0'
+                )
+
+
+def reconcile_counters(using=None, dry_run=False):
+    """Пересчет всех счетчиков с отчетом о расхождениях.
+
+    Таблицы блокируются до пересчета, и записываются только строки
+    с расхождениями - одним upsert на таблицу.
+    Возвращает список (модель, ключ, поле, было, стало).
+    """
+    using = using or router.db_for_write(CategoryCounter)
+    drift = []
+    with transaction.atomic(using=using):
+        lock_counter_tables(using)
+        for model, expected in compute_counters(using).items():
+            queryset = model.objects.using(using)
+            stored = {
+                row[model.key_field]: row
+                for row in queryset.values(
+                    model.key_field, *model.counter_fields
+                )
+            }
+            changed = set()
+            for key in sorted(set(stored) | set(expected), key=str):
+                for field in model.counter_fields:
+                    was = stored.get(key, {}).get(field, 0)
+                    value = expected.get(key, {}).get(field, 0)
+                    if was != value:
+                        drift.append((model, key, field, was, value))
+                        changed.add(key)
+            if dry_run or not changed:
+                continue
+            queryset.bulk_create(
+                [
+                    model(**{model.key_field: key}, **{
+                        field: expected.get(key, {}).get(field, 0)
+                        for field in model.counter_fields
+                    })
+                    for key in sorted(changed, key=str)
+                ],
+                update_conflicts=True,
+                update_fields=model.counter_fields,
+                unique_fields=[model._meta.pk.name]
+            )
+    return drift
@@ -0,0 +1,215 @@
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from .constants import (
+    ADS_CACHE_ALIAS, ADS_CACHE_PREFIX, ENGINE_CHECK_INTERVAL,
+    ENGINE_MAX_AGE, ENGINE_RELOAD_INTERVAL
+)
+
+
+logger = logging.getLogger('ads.engines')
+
+
+def get_engines_config():
+    config = getattr(settings, 'ADS_ENGINES', {})
+    return {
+        'CACHE_ALIAS': getattr(settings, 'ADS_CACHE', {}).get(
+            'ALIAS', ADS_CACHE_ALIAS
+        ),
+        'CHECK_INTERVAL': ENGINE_CHECK_INTERVAL,
+        'RELOAD_INTERVAL': ENGINE_RELOAD_INTERVAL,
+        'MAX_AGE': ENGINE_MAX_AGE,
+        'WARM_ON_START': False,
+        **config,
+    }
+
+
+class Generation:
+    """Счетчик записей движка в общем кэше.
+
+    Каждая запись увеличивает счетчик, поэтому процесс, загрузивший
+    данные при другом значении, знает, что пропустил чужие записи.
+    Без имени счетчик живет в памяти экземпляра.
+    """
+
+    def __init__(self, name=None):
+        self.key = name and f'{ADS_CACHE_PREFIX}:generation:{name}'
+        self.value = 0
+
+    @property
+    def cache(self):
+        return caches[get_engines_config()['CACHE_ALIAS']]
+
+    def get(self):
+        if self.key is None:
+            return self.value
+        return self.cache.get(self.key, 0)
+
+    def bump(self):
+        if self.key is None:
+            self.value += 1
+            return self.value
+        try:
+            return self.cache.incr(self.key)
+        except ValueError:
+            if self.cache.add(self.key, 1, timeout=None):
+                return 1
+            return self.cache.incr(self.key)
+
+
+def shared_write(method):
+    """Запись в движок с отметкой в общем счетчике."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.note_write()
+    return wrapper
+
+
+class SharedStateEngine:
+    """Движок с данными в памяти процесса и общим счетчиком записей.
+
+    Первое обращение загружает данные синхронно, если их не успел
+    прогреть warm(). Дальше не чаще CHECK_INTERVAL сверяется счетчик:
+    если другой процесс записал что-то после загрузки или данные
+    старше MAX_AGE, они перезагружаются в фоне, но не чаще
+    RELOAD_INTERVAL. Перезагрузка строит новый экземпляр без
+    блокировки чтения и подменяет поля state_fields под lock.
+    """
+
+    state_fields = ()
+
+    def __init__(self, name=None):
+        self.lock = threading.RLock()
+        self.load_lock = threading.RLock()
+        self.generation = Generation(name)
+        self.reloading = False
+        self.reset()
+
+    def reset(self):
+        """Сброс данных; следующее обращение загрузит их из базы."""
+        with self.lock:
+            self.loaded = False
+            self.seen = None
+            self.loaded_at = 0.0
+            self.checked_at = 0.0
+            self.clear()
+
+    def clear(self):
+        raise NotImplementedError
+
+    def fill(self):
+        """Загрузка данных из базы в пустой экземпляр."""
+        raise NotImplementedError
+
+    def spawn(self):
+        """Пустой экземпляр с теми же настройками."""
+        return type(self)()
+
+    def mark_loaded(self, generation):
+        with self.lock:
+            self.loaded = True
+            self.seen = generation
+            self.loaded_at = self.checked_at = time.monotonic()
+
+    def load(self):
+        """Полная загрузка из базы с подменой данных."""
+        with self.load_lock:
+            with self.lock:
+                self.reloading = True
+            try:
+                # Счетчик читается до загрузки: запись, попавшая
+                # между ними, вызовет еще одну перезагрузку.
+                generation = self.generation.get()
+                staging = self.spawn()
+                staging.fill()
+                with self.lock:
+                    for name in self.state_fields:
+                        setattr(self, name, getattr(staging, name))
+                    self.mark_loaded(generation)
+            finally:
+                with self.lock:
+                    self.reloading = False
+
+    def reload(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception('Ошибка загрузки %s', type(self).__name__)
+        finally:
+            connections.close_all()
+
+    def reload_in_background(self):
+        """Фоновая перезагрузка; None, если она уже идет."""
+        with self.lock:
+            if self.reloading:
+                return None
+            self.reloading = True
+        thread = threading.Thread(
+            target=self.reload, name=f'{type(self).__name__}-reload',
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def warm(self):
+        """Фоновая загрузка при старте процесса."""
+        if not self.loaded:
+            return self.reload_in_background()
+        return None
+
+    def is_stale(self, now):
+        config = get_engines_config()
+        if self.reloading or now - self.loaded_at < (
+            config['RELOAD_INTERVAL']
+        ):
+            return False
+        return (
+            now - self.loaded_at > config['MAX_AGE']
+            or self.generation.get() != self.seen
+        )
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.load_lock:
+                if not self.loaded:
+                    self.load()
+            return
+        now = time.monotonic()
+        if now - self.checked_at < get_engines_config()['CHECK_INTERVAL']:
+            return
+        self.checked_at = now
+        if self.is_stale(now):
+            self.reload_in_background()
+
+    def note_write(self):
+        """Отметка записи в общем счетчике.
+
+        Если до нее счетчик не менялся с загрузки, данные процесса
+        остаются актуальными и перезагрузка не нужна.
+        """
+        generation = self.generation.bump()
+        with self.lock:
+            if self.loaded and not self.reloading and (
+                generation == self.seen + 1
+            ):
+                self.seen = generation
+
+
+def warm_engines():
+    """Прогрев движков в фоне при старте процесса."""
+    if not get_engines_config()['WARM_ON_START']:
+        return
+    from .matching import matching_engine
+    from .recommendations import recommendation_engine
+
+    for engine in (matching_engine, recommendation_engine):
+        engine.warm()
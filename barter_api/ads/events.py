@@ -0,0 +1,272 @@
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .constants import (
+    EVENTS_BACKEND_DEFAULT, EVENTS_HEARTBEAT, EVENTS_HISTORY_MAX,
+    EVENTS_HISTORY_TTL, EVENTS_QUEUE_MAX, EVENTS_RETRY_MS
+)
+
+
+Event = namedtuple('Event', ['id', 'type', 'data', 'users'])
+
+
+def encode_event(event):
+    """Событие в формате text/event-stream."""
+    data = json.dumps(event.data, ensure_ascii=False)
+    return f'id: {event.id}\nevent: {event.type}\ndata: {data}\n\n'
+
+
+RESYNC = 'event: resync\ndata: {}\n\n'
+KEEPALIVE = ': keepalive\n\n'
+
+
+class Subscription:
+    """Очередь событий одного подключения.
+
+    Очередь ограничена: если клиент не успевает читать, лишние
+    события отбрасываются, а флаг overflowed говорит потоку
+    дочитать их из истории.
+    """
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_MAX)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def deliver(self, event):
+        """Передача события из любого потока в цикл подписчика."""
+        self.loop.call_soon_threadsafe(self.put, event)
+
+    async def get(self, timeout):
+        """Следующее событие или None, если за timeout событий не было."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalEventBackend:
+    """Бэкенд в памяти процесса: история и доставка без брокера.
+
+    Подходит для одного процесса и тестов. Бэкенд для нескольких
+    процессов должен так же хранить историю для возобновления и
+    вызывать hub.deliver() для событий, полученных от брокера.
+
+    Идентификаторы событий растут монотонно и начинаются с метки
+    времени в микросекундах, поэтому Last-Event-ID, выданный до
+    перезапуска, не совпадет с новыми событиями.
+
+    История пользователя без подписчиков, не получавшего событий
+    дольше ttl секунд, удаляется целиком. Возобновление с id старше
+    удаленных событий считается неполным.
+    """
+
+    def __init__(self, hub, history=EVENTS_HISTORY_MAX,
+                 ttl=EVENTS_HISTORY_TTL):
+        self.hub = hub
+        self.history_size = history
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.history = defaultdict(deque)
+        self.evicted = {}
+        self.touched = {}
+        self.pruned = 0
+        self.pruned_at = time.monotonic()
+
+    def next_id(self):
+        self.last_id = max(self.last_id + 1, time.time_ns() // 1000)
+        return self.last_id
+
+    def publish(self, event_type, data, users):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.pruned_at >= self.ttl:
+                self._prune(now)
+            event = Event(self.next_id(), event_type, data, tuple(users))
+            for user_id in event.users:
+                if user_id not in self.history and self.pruned:
+                    # История могла быть удалена раньше.
+                    self.evicted[user_id] = self.pruned
+                events = self.history[user_id]
+                events.append(event)
+                if len(events) > self.history_size:
+                    self.evicted[user_id] = events.popleft().id
+                self.touched[user_id] = now
+        self.hub.deliver(event)
+        return event
+
+    def prune(self, now=None):
+        """Удаление устаревшей истории пользователей без подписчиков."""
+        with self.lock:
+            self._prune(time.monotonic() if now is None else now)
+
+    def _prune(self, now):
+        self.pruned_at = now
+        stale = [
+            user_id for user_id, touched in self.touched.items()
+            if now - touched > self.ttl
+            and not self.hub.has_subscribers(user_id)
+        ]
+        for user_id in stale:
+            del self.touched[user_id]
+            self.evicted.pop(user_id, None)
+            self.pruned = max(
+                self.pruned, self.history.pop(user_id)[-1].id
+            )
+
+    def get_last_id(self):
+        with self.lock:
+            return self.last_id
+
+    def get_history(self, user_id, after):
+        """События пользователя после after и полнота этого списка.
+
+        Список неполон, если часть событий после after уже вытеснена.
+        """
+        with self.lock:
+            if user_id in self.history:
+                complete = after >= self.evicted.get(user_id, 0)
+            else:
+                complete = after >= self.pruned
+            events = [
+                event for event in self.history.get(user_id, ())
+                if event.id > after
+            ]
+        return events, complete
+
+
+class EventHub:
+    """Pub/sub событий предложений с рассылкой по пользователям.
+
+    Публикация идет через бэкенд из настройки ADS_EVENTS['BACKEND'],
+    а бэкенд отдает события обратно в deliver() для подписчиков
+    этого процесса. Публиковать можно из любого потока.
+    """
+
+    def __init__(self, backend=None, history=None, ttl=None):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        self.backend_path = backend
+        self.history = history
+        self.ttl = ttl
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = getattr(settings, 'ADS_EVENTS', {})
+            backend_class = import_string(
+                self.backend_path
+                or config.get('BACKEND', EVENTS_BACKEND_DEFAULT)
+            )
+            self._backend = backend_class(
+                self,
+                history=self.history
+                or config.get('HISTORY', EVENTS_HISTORY_MAX),
+                ttl=self.ttl
+                or config.get('HISTORY_TTL', EVENTS_HISTORY_TTL)
+            )
+        return self._backend
+
+    def reset(self):
+        """Новый бэкенд с пустой историей; подписки сохраняются."""
+        self._backend = None
+
+    def publish(self, event_type, data, users):
+        return self.backend.publish(event_type, data, set(users))
+
+    def get_history(self, user_id, after):
+        return self.backend.get_history(user_id, after)
+
+    def get_last_id(self):
+        return self.backend.get_last_id()
+
+    def subscribe(self, user_id):
+        """Подписка на события пользователя в текущем цикле событий."""
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.user_id]
+
+    def deliver(self, event):
+        """Рассылка события подписчикам этого процесса."""
+        with self.lock:
+            subscriptions = [
+                subscription
+                for user_id in event.users
+                for subscription in self.subscriptions.get(user_id, ())
+            ]
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    def has_subscribers(self, user_id):
+        with self.lock:
+            return user_id in self.subscriptions
+
+    def subscriber_count(self):
+        with self.lock:
+            return sum(map(len, self.subscriptions.values()))
+
+
+event_hub = EventHub()
+
+
+async def stream_events(user_id, last_event_id=None, hub=event_hub,
+                        heartbeat=EVENTS_HEARTBEAT):
+    """Поток text/event-stream с событиями пользователя.
+
+    Подписка оформляется до чтения истории, поэтому события между
+    ними не теряются, а повторы отсекаются по id. Без last_event_id
+    поток начинается с событий, опубликованных после подключения. Если с
+    last_event_id часть событий вытеснена из истории, клиент получает
+    событие resync и должен перечитать свои предложения.
+    """
+    last_id = hub.get_last_id() if last_event_id is None else last_event_id
+    subscription = hub.subscribe(user_id)
+    # Возобновление читает историю так же, как после переполнения.
+    subscription.overflowed = last_event_id is not None
+    try:
+        yield f'retry: {EVENTS_RETRY_MS}\n\n'
+        while True:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                events, complete = hub.get_history(user_id, last_id)
+                if not complete:
+                    yield RESYNC
+                for event in events:
+                    last_id = event.id
+                    yield encode_event(event)
+            event = await subscription.get(heartbeat)
+            if event is None:
+                yield KEEPALIVE
+            elif event.id > last_id:
+                last_id = event.id
+                yield encode_event(event)
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,10 @@
+from rest_framework.exceptions import APIException
+from rest_framework.status import HTTP_409_CONFLICT
+
+
+class Conflict(APIException):
+    """Запрос противоречит текущему состоянию ресурса."""
+
+    status_code = HTTP_409_CONFLICT
+    default_detail = 'Конфликт с текущим состоянием.'
+    default_code = 'conflict'
@@ -0,0 +1,79 @@
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .constants import EXPORT_CHUNK_SIZE
+
+
+AD_EXPORT_FIELDS = (
+    'id', 'user_id', 'title', 'description', 'image_url',
+    'category', 'condition', 'created_at', 'is_active'
+)
+PROPOSAL_EXPORT_FIELDS = (
+    'id', 'ad_sender_id', 'ad_receiver_id', 'comment', 'status',
+    'created_at'
+)
+
+
+class Echo:
+    """Псевдофайл: csv.writer возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки выгрузки порциями через серверный курсор."""
+    return queryset.order_by('pk').values(*fields).iterator(
+        chunk_size=chunk_size
+    )
+
+
+def iter_ndjson(rows, fields):
+    """Одна JSON-строка на запись."""
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False)
+        yield '\n'
+
+
+def iter_csv(rows, fields):
+    """CSV с заголовком из имен полей."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            row[field].isoformat()
+            if isinstance(row[field], datetime) else row[field]
+            for field in fields
+        ])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
+
+
+def export(queryset, fields, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Генератор фрагментов выгрузки в указанном формате."""
+    writer, _ = EXPORT_FORMATS[export_format]
+    return writer(iter_rows(queryset, fields, chunk_size), fields)
+
+
+async def aexport(queryset, fields, export_format,
+                  chunk_size=EXPORT_CHUNK_SIZE):
+    """Асинхронная выгрузка для ASGI порциями по chunk_size фрагментов.
+
+    Синхронный итератор ASGI-обработчик Django читает целиком в
+    память до отправки. Здесь каждая порция читается в потоке
+    sync_to_async; поток один и тот же, поэтому серверный курсор
+    остается в своем соединении.
+    """
+    fragments = export(queryset, fields, export_format, chunk_size)
+    take = sync_to_async(lambda: ''.join(islice(fragments, chunk_size)))
+    while chunk := await take():
+        yield chunk
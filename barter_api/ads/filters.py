@@ -1,7 +1,8 @@
+from django.db.models import Count
 from django_filters import CharFilter, DateFilter, FilterSet
-from django.db import models
 
-from .models import Ad
+from .models import Ad, ExchangeProposal
+from .search import get_search_backend
 
 
 class AdFilter(FilterSet):
@@ -30,9 +31,63 @@ class AdFilter(FilterSet):
             'user': ['exact'],
         }
 
+    facet_fields = ('category', 'condition')
+
     def filter_search(self, queryset, name, value):
-        """Фильтрация по поисковому запросу в заголовке и описании."""
-        return queryset.filter(
-            models.Q(title__icontains=value) |
-            models.Q(description__icontains=value)
+        """Полнотекстовый поиск по заголовку и описанию."""
+        return get_search_backend(queryset.db).search(queryset, value)
+
+    def get_facet_signature(self):
+        """Параметры фильтров запроса, от которых зависят фасеты."""
+        return [
+            [name, self.data.getlist(name)]
+            for name in sorted(self.filters) if name in self.data
+        ]
+
+    def facet_counts(self):
+        """Число объявлений по значениям category и condition.
+
+        Один запрос группирует объявления по обоим полям с учетом всех
+        фильтров, кроме самих фасетов. Счетчик значения учитывает
+        выбранные значения других фасетов, но не своего, то есть
+        показывает, сколько объявлений будет при выборе этого значения.
+        Значения вне choices поля в фасеты не попадают.
+        """
+        data = self.data.copy()
+        for name in self.facet_fields:
+            data.pop(name, None)
+        queryset = self.__class__(
+            data=data, queryset=self.queryset, request=self.request
+        ).qs
+        rows = queryset.order_by().values_list(*self.facet_fields).annotate(
+            count=Count('id')
         )
+        selected = {
+            name: self.form.cleaned_data.get(name)
+            for name in self.facet_fields
+        }
+        counts = {
+            name: dict.fromkeys(
+                (value for value, _ in Ad._meta.get_field(name).choices), 0
+            )
+            for name in self.facet_fields
+        }
+        for *values, count in rows:
+            row = dict(zip(self.facet_fields, values))
+            for name in self.facet_fields:
+                if row[name] in counts[name] and all(
+                    not selected[other] or selected[other] == row[other]
+                    for other in self.facet_fields if other != name
+                ):
+                    counts[name][row[name]] += count
+        return counts
+
+
+class ExchangeProposalFilter(FilterSet):
+    """Фильтр для предложений обмена."""
+
+    class Meta:
+        model = ExchangeProposal
+        fields = {
+            'status': ['exact'],
+        }
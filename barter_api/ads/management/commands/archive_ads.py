@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ads.archive import archivable_ads, archive_inactive_ads, get_cutoff
+
+
+class Command(BaseCommand):
+    """Перенос старых неактивных объявлений в архив."""
+
+    help = (
+        'Переносит объявления, неактивные дольше заданного срока, и их '
+        'завершенные предложения в архивные таблицы пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            help='Срок неактивности в днях, по умолчанию из ADS_ARCHIVE.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Объявлений в одной транзакции.'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Пауза между пачками в секундах.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать объявления для переноса.'
+        )
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Алиас базы данных.'
+        )
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        age = timedelta(days=days) if days is not None else None
+        if options['dry_run']:
+            count = archivable_ads(
+                get_cutoff(age), options['database']
+            ).count()
+            self.stdout.write(f'К переносу: {count}')
+            return
+        ads = proposals = 0
+        for batch_ads, batch_proposals in archive_inactive_ads(
+            age=age,
+            batch_size=options['batch_size'],
+            using=options['database'],
+            pause=options['pause']
+        ):
+            ads += batch_ads
+            proposals += batch_proposals
+            self.stdout.write(
+                f'Пачка: объявлений {batch_ads}, предложений {batch_proposals}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено объявлений: {ads}, предложений: {proposals}'
+        ))
@@ -0,0 +1,94 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.benchmark import (
+    HttpRunner, InProcessRunner, Scenarios,
+    compare_with_baseline, results_to_baseline
+)
+from ads.constants import BENCH_TOLERANCE
+
+
+class Command(BaseCommand):
+    """Нагрузочный прогон сценариев API с проверкой по базовой линии."""
+
+    help = (
+        'Прогоняет сценарии ленты, карточки, поиска, фильтров, создания '
+        'предложений и my-proposals в процессе или против запущенного '
+        'сервера (кэш ленты сбрасывается, кроме сценариев *_cached) и '
+        'печатает p50/p95/p99, пропускную способность и число запросов к БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=Scenarios.names(),
+            help='Сценарий; по умолчанию все.'
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--url',
+            help='Адрес сервера, например http://localhost:8000. '
+                 'Без него запросы идут через тестовый клиент.'
+        )
+        parser.add_argument('--token', help='Токен для HTTP-прогона.')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--baseline', help='JSON с базовой линией.')
+        parser.add_argument(
+            '--save-baseline', help='Сохранить результаты в JSON.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=BENCH_TOLERANCE
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        scenarios = Scenarios(seed=options['seed'])
+        if options['url']:
+            runner = HttpRunner(
+                options['url'], options['token'], options['concurrency']
+            )
+        else:
+            runner = InProcessRunner(scenarios.user)
+        names = options['scenario'] or Scenarios.names()
+        results = []
+        for name in names:
+            make_request = getattr(scenarios, name)
+            if name in Scenarios.data_names and scenarios.user is None:
+                self.stdout.write(self.style.WARNING(
+                    f'{name}: нет данных, запустите generate_data'
+                ))
+                continue
+            if options['warmup']:
+                runner.run(name, make_request, options['warmup'])
+            result = runner.run(name, make_request, options['requests'])
+            results.append(result)
+            queries = (
+                f', {result.queries_per_request} запросов к БД'
+                if result.queries_per_request is not None else ''
+            )
+            self.stdout.write(
+                f'{name}: p50 {result.p50_ms} мс, p95 {result.p95_ms} мс, '
+                f'p99 {result.p99_ms} мс, {result.throughput_rps} запросов/с'
+                f'{queries}, ошибок {result.errors}'
+            )
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(
+                json.dumps(results_to_baseline(results), indent=2),
+                encoding='utf-8'
+            )
+        if options['baseline']:
+            baseline = json.loads(
+                Path(options['baseline']).read_text(encoding='utf-8')
+            )
+            regressions = compare_with_baseline(
+                results, baseline, options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессии производительности:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
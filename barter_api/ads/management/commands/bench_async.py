@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from ads.benchmark import SlowClientBench
+
+
+class Command(BaseCommand):
+    """Пропускная способность при множестве медленных клиентов."""
+
+    help = (
+        'Сравнивает WSGI с пулом потоков, ASGI с синхронными view и ASGI '
+        'с async-view на одном endpoint при медленных клиентах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/ads/')
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=5)
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.05,
+            help='Задержка клиента на запрос и на ответ, секунды.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Число потоков WSGI-сервера.'
+        )
+        parser.add_argument(
+            '--mode',
+            action='append',
+            choices=SlowClientBench.modes,
+            help='Режим; по умолчанию все.'
+        )
+
+    def handle(self, *args, **options):
+        bench = SlowClientBench(
+            options['path'], options['clients'], options['requests'],
+            options['latency'], options['workers']
+        )
+        for mode in options['mode'] or SlowClientBench.modes:
+            result = bench.run(mode)
+            self.stdout.write(
+                f'{result.scenario}: {result.throughput_rps} запросов/с, '
+                f'p50 {result.p50_ms} мс, p95 {result.p95_ms} мс, '
+                f'p99 {result.p99_ms} мс, ошибок {result.errors}'
+            )
@@ -0,0 +1,68 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from ads.authentication import token_cache
+from ads.constants import BENCH_USER_PREFIX
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Бенчмарк кэша аутентификации по токену."""
+
+    help = (
+        'Прогоняет запросы с заголовком Authorization: Token с пустым '
+        'кэшем аутентификации перед каждым запросом и с прогретым кэшем '
+        'и печатает время и число запросов к БД на запрос.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', action='append',
+            help='Путь API; по умолчанию /api/my-proposals/ и /api/ads/.'
+        )
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(
+            username=f'{BENCH_USER_PREFIX}auth'
+        )
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        for path in options['path'] or ['/api/my-proposals/', '/api/ads/']:
+            results = {
+                mode: self.run(client, path, options['requests'], cold)
+                for mode, cold in (('без кэша', True), ('с кэшем', False))
+            }
+            for mode, (timings, queries) in results.items():
+                self.stdout.write(
+                    f'{path} {mode}: p50 '
+                    f'{statistics.median(timings) * 1000:.2f} мс, '
+                    f'{queries:.2f} запросов к БД'
+                )
+            saved = results['без кэша'][1] - results['с кэшем'][1]
+            self.stdout.write(f'{path}: экономия {saved:.2f} запросов к БД')
+        token_cache.reset()
+
+    def run(self, client, path, count, cold):
+        token_cache.reset()
+        client.get(path)
+        timings, queries = [], 0
+        for _ in range(count):
+            if cold:
+                token_cache.reset()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                client.get(path)
+                timings.append(time.perf_counter() - started)
+            queries += len(context)
+        return timings, queries / count
@@ -0,0 +1,73 @@
+import statistics
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from ads.models import Ad
+from ads.parsers import FastJSONParser
+from ads.renderers import FastJSONRenderer, orjson
+from ads.serializers import AdReadSerializer
+
+
+class AsciiJSONRenderer(JSONRenderer):
+    """Стандартный рендерер с экранированием не-ASCII символов."""
+
+    ensure_ascii = True
+
+
+class Command(BaseCommand):
+    """Сравнение рендереров JSON на страницах объявлений."""
+
+    help = (
+        'Кодирует и разбирает страницы ленты объявлений стандартным '
+        'и быстрым рендерером и печатает размер ответа и время.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = AdReadSerializer.prepare_queryset(
+            Ad.objects.active().order_by('-created_at')
+        )[:options['page_size']]
+        page = {
+            'count': options['page_size'],
+            'next': None,
+            'previous': None,
+            'results': AdReadSerializer(rows, many=True).data,
+        }
+        if not page['results']:
+            raise CommandError('Нет объявлений, запустите generate_data.')
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен, быстрый рендерер использует json.'
+            ))
+        iterations = options['iterations']
+        renderers = (
+            ('json, ensure_ascii', AsciiJSONRenderer(), JSONParser()),
+            ('json', JSONRenderer(), JSONParser()),
+            ('fast', FastJSONRenderer(), FastJSONParser()),
+        )
+        for name, renderer, parser in renderers:
+            body = renderer.render(page)
+            encode = self.measure(lambda: renderer.render(page), iterations)
+            decode = self.measure(
+                lambda: parser.parse(BytesIO(body)), iterations
+            )
+            self.stdout.write(
+                f'{name}: {len(body)} байт, '
+                f'кодирование {encode * 1e6:.1f} мкс, '
+                f'разбор {decode * 1e6:.1f} мкс'
+            )
+
+    def measure(self, function, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from ads.constants import CATEGORY_CHOICES, CONDITION_CHOICES, MATCH_DEPTH_MAX
+from ads.matching import MatchingEngine
+
+
+class SyntheticMatchingEngine(MatchingEngine):
+    """Граф без базы: перезагружать его из базы в фоне нельзя."""
+
+    def is_stale(self, now):
+        return False
+
+
+class Command(BaseCommand):
+    """Бенчмарк движка обменов на синтетическом графе."""
+
+    help = (
+        'Строит граф из случайных предложений в памяти и измеряет '
+        'время загрузки, инкрементальных обновлений и поиска циклов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proposals', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=200_000)
+        parser.add_argument('--depth', type=int, default=MATCH_DEPTH_MAX)
+        parser.add_argument('--samples', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = options['users']
+        keys = [
+            (category, condition)
+            for category, _ in CATEGORY_CHOICES
+            for condition, _ in CONDITION_CHOICES
+        ]
+        engine = SyntheticMatchingEngine()
+        engine.mark_loaded(engine.generation.get())
+
+        started = time.perf_counter()
+        for ad_id in range(users):
+            engine._set_ad(ad_id, ad_id, rng.choice(keys))
+        for pk in range(options['proposals']):
+            sender = rng.randrange(users)
+            receiver = rng.randrange(users)
+            if sender != receiver:
+                engine._add_proposal(pk, sender, receiver, rng.choice(keys))
+        build = time.perf_counter() - started
+        self.stdout.write(
+            f"Граф: {len(engine.proposals)} предложений, "
+            f"{users} пользователей, построение {build:.2f} с"
+        )
+
+        updates = min(10_000, options['proposals'])
+        started = time.perf_counter()
+        for pk in rng.sample(range(options['proposals']), updates):
+            engine.update_proposal(pk, 0, 1, keys[0], 'rejected')
+        update = (time.perf_counter() - started) / max(updates, 1)
+        self.stdout.write(f"Обновление ребра: {update * 1e6:.1f} мкс")
+
+        cycle_timings, suggest_timings = [], []
+        found = 0
+        for _ in range(options['samples']):
+            user = rng.randrange(users)
+            started = time.perf_counter()
+            found += len(engine.find_cycles(user, options['depth']))
+            cycle_timings.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            engine.suggest(user)
+            suggest_timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f"Циклы (глубина {options['depth']}): "
+            f"{self.format_timings(cycle_timings)}, найдено {found}"
+        )
+        self.stdout.write(
+            f"Встречные подсказки: {self.format_timings(suggest_timings)}"
+        )
+
+    def format_timings(self, timings):
+        timings = sorted(timings)
+        p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+        return (
+            f"p50 {statistics.median(timings) * 1000:.2f} мс, "
+            f"p99 {p99 * 1000:.2f} мс"
+        )
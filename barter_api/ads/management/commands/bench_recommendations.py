@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from ads.constants import CATEGORY_CHOICES, CONDITION_CHOICES, STATUS_CHOICES
+from ads.recommendations import RecommendationEngine
+
+
+class SyntheticRecommendationEngine(RecommendationEngine):
+    """Массивы без базы: перезагружать их из базы в фоне нельзя."""
+
+    def is_stale(self, now):
+        return False
+
+
+class Command(BaseCommand):
+    """Бенчмарк ленты рекомендаций на синтетических данных."""
+
+    help = (
+        'Строит массивы рекомендаций из случайных объявлений и '
+        'предложений в памяти и измеряет время полного пересчета '
+        'выдачи и ее инкрементального обновления.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=200_000)
+        parser.add_argument('--proposals', type=int, default=1_000_000)
+        parser.add_argument('--samples', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = options['users']
+        categories = [value for value, _ in CATEGORY_CHOICES]
+        conditions = [value for value, _ in CONDITION_CHOICES]
+        statuses = [value for value, _ in STATUS_CHOICES]
+        now = time.time()
+        ads = [
+            (
+                ad_id, rng.randrange(users), rng.choice(categories),
+                rng.choice(conditions), now - rng.random() * 90 * 86400
+            )
+            for ad_id in range(options['ads'])
+        ]
+        proposals = [
+            (
+                rng.choice(statuses), rng.randrange(users),
+                rng.randrange(users), rng.randrange(options['ads']),
+                rng.choice(categories), rng.choice(conditions),
+                rng.choice(categories), rng.choice(conditions)
+            )
+            for _ in range(options['proposals'])
+        ]
+        engine = SyntheticRecommendationEngine()
+
+        started = time.perf_counter()
+        engine.load_rows(ads, proposals)
+        build = time.perf_counter() - started
+        self.stdout.write(
+            f"Массивы: {engine.size} объявлений, {users} пользователей, "
+            f"построение {build:.2f} с"
+        )
+
+        cold_timings, warm_timings = [], []
+        next_id = options['ads']
+        for _ in range(options['samples']):
+            user = rng.randrange(users)
+            started = time.perf_counter()
+            engine.recommend(user)
+            cold_timings.append(time.perf_counter() - started)
+            for _ in range(10):
+                engine.update_ad(
+                    next_id, rng.randrange(users),
+                    (rng.choice(categories), rng.choice(conditions)),
+                    datetime.now(timezone.utc), True
+                )
+                next_id += 1
+            started = time.perf_counter()
+            engine.recommend(user)
+            warm_timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f"Полный пересчет: {self.format_timings(cold_timings)}"
+        )
+        self.stdout.write(
+            f"Из кэша с 10 новыми объявлениями: "
+            f"{self.format_timings(warm_timings)}"
+        )
+
+    def format_timings(self, timings):
+        timings = sorted(timings)
+        p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+        return (
+            f"p50 {statistics.median(timings) * 1000:.2f} мс, "
+            f"p99 {p99 * 1000:.2f} мс"
+        )
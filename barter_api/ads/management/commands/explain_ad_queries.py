@@ -0,0 +1,114 @@
+import re
+from datetime import timedelta
+from itertools import combinations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from ads.constants import (
+    BENCH_WORDS, CATEGORY_CHOICES, CONDITION_CHOICES,
+    EXPLAIN_FULL_SCAN_PATTERNS, PAGE_SIZE
+)
+from ads.filters import AdFilter
+from ads.models import Ad
+from ads.views import AdListCreateView
+
+
+class Command(BaseCommand):
+    """Печать планов запросов ленты для всех фильтров и сортировок."""
+
+    help = (
+        'Выводит EXPLAIN для каждой комбинации фильтров AdFilter '
+        'и сортировок ленты объявлений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Завершиться с ошибкой, если план содержит полный скан.'
+        )
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Алиас базы данных.'
+        )
+
+    def get_filter_values(self):
+        """Образцы значений для каждого фильтра ленты."""
+        user_id = Ad.objects.values_list('user_id', flat=True).first()
+        today = timezone.localdate()
+        return {
+            'category': CATEGORY_CHOICES[0][0],
+            'condition': CONDITION_CHOICES[0][0],
+            'user': user_id or 1,
+            'search': BENCH_WORDS[0],
+            'min_date': (today - timedelta(days=30)).isoformat(),
+            'max_date': today.isoformat(),
+        }
+
+    def get_orderings(self):
+        """Все сортировки, которые принимает OrderingFilter."""
+        orderings = []
+        for field in AdListCreateView.ordering_fields:
+            orderings.extend([f'-{field}', field])
+        return orderings
+
+    def is_sort_expected(self, data, ordering):
+        """Порядок, который индекс дать не может.
+
+        Результаты полнотекстового поиска и выборка по диапазону дат
+        при сортировке не по дате упорядочиваются после фильтрации.
+        """
+        return 'search' in data or ordering.lstrip('-') != 'created_at' and (
+            'min_date' in data or 'max_date' in data
+        )
+
+    def iter_query_shapes(self):
+        values = self.get_filter_values()
+        names = list(values)
+        for size in range(len(names) + 1):
+            for selected in combinations(names, size):
+                data = {name: values[name] for name in selected}
+                for ordering in self.get_orderings():
+                    yield data, ordering
+
+    def handle(self, *args, **options):
+        using = options['database']
+        vendor = connections[using].vendor
+        patterns = EXPLAIN_FULL_SCAN_PATTERNS.get(vendor, {})
+        regressions = []
+        for data, ordering in self.iter_query_shapes():
+            queryset = AdFilter(
+                data,
+                queryset=AdListCreateView.queryset.using(using)
+            ).qs
+            prefix = '-' if ordering.startswith('-') else ''
+            queryset = queryset.order_by(ordering, f'{prefix}id')
+            plan = queryset[:PAGE_SIZE].explain()
+            label = ', '.join(
+                f'{name}={value}' for name, value in data.items()
+            ) or 'без фильтров'
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{label}; ordering={ordering}'
+            ))
+            self.stdout.write(plan)
+            self.stdout.write('')
+            checks = [
+                pattern for name, pattern in patterns.items()
+                if name != 'sort' or not self.is_sort_expected(
+                    data, ordering
+                )
+            ]
+            if any(
+                re.search(pattern, plan, re.MULTILINE) for pattern in checks
+            ):
+                regressions.append(f'{label}; ordering={ordering}')
+        if regressions:
+            message = 'Полный скан или сортировка без индекса:\n' + (
+                '\n'.join(regressions)
+            )
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
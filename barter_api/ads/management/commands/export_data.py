@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.constants import EXPORT_CHUNK_SIZE, EXPORT_FORMAT_DEFAULT
+from ads.export import (
+    AD_EXPORT_FIELDS, EXPORT_FORMATS, PROPOSAL_EXPORT_FIELDS, export
+)
+from ads.filters import AdFilter, ExchangeProposalFilter
+from ads.models import Ad, ExchangeProposal
+
+
+EXPORT_SOURCES = {
+    'ads': (Ad.objects.active, AdFilter, AD_EXPORT_FIELDS),
+    'proposals': (
+        ExchangeProposal.objects.all,
+        ExchangeProposalFilter,
+        PROPOSAL_EXPORT_FIELDS
+    ),
+}
+
+
+class Command(BaseCommand):
+    """Потоковая выгрузка объявлений или предложений обмена."""
+
+    help = (
+        'Выгружает активные объявления или предложения обмена в NDJSON '
+        'или CSV порциями, не загружая таблицу в память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=list(EXPORT_SOURCES))
+        parser.add_argument(
+            '--export-format',
+            choices=list(EXPORT_FORMATS),
+            default=EXPORT_FORMAT_DEFAULT
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE
+        )
+        parser.add_argument(
+            '--filter',
+            action='append',
+            default=[],
+            metavar='NAME=VALUE',
+            help='Фильтр в терминах AdFilter, например category=books.'
+        )
+
+    def handle(self, *args, **options):
+        get_queryset, filterset_class, fields = EXPORT_SOURCES[
+            options['source']
+        ]
+        try:
+            data = dict(item.split('=', 1) for item in options['filter'])
+        except ValueError:
+            raise CommandError('Фильтр задается как NAME=VALUE')
+        filterset = filterset_class(data, queryset=get_queryset())
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+        chunks = export(
+            filterset.qs, fields, options['export_format'],
+            options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8',
+                      newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from ads.benchmark import generate_data
+from ads.constants import BENCH_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    """Генерация синтетических данных для нагрузочных тестов."""
+
+    help = (
+        'Создает пользователей, объявления и предложения обмена '
+        'пакетами через bulk_create (масштаб 10^4 - 10^7).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--ads', type=int, default=10_000)
+        parser.add_argument('--proposals', type=int, default=10_000)
+        parser.add_argument(
+            '--batch-size', type=int, default=BENCH_BATCH_SIZE
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        created = generate_data(
+            options['users'], options['ads'], options['proposals'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write if options['verbosity'] > 1 else None
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: пользователей {created['users']}, "
+            f"объявлений {created['ads']}, "
+            f"предложений {created['proposals']}"
+        ))
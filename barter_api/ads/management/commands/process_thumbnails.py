@@ -0,0 +1,44 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ads.models import Ad
+from ads.thumbnails import thumbnail_pipeline
+
+
+class Command(BaseCommand):
+    """Построение недостающих миниатюр."""
+
+    help = (
+        'Ставит в очередь миниатюр объявления с изображением, которое '
+        'еще не обработано, и ждет завершения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-invalid',
+            action='store_true',
+            help='Повторить изображения, которые не удалось разобрать.'
+        )
+
+    def handle(self, *args, **options):
+        statuses = Q(image_status__isnull=True)
+        if options['retry_invalid']:
+            statuses |= Q(image_status='invalid')
+        ads = Ad.objects.filter(statuses, image_url__isnull=False).exclude(
+            image_url=''
+        ).values_list('id', 'image_url')
+        urls = defaultdict(list)
+        for ad_id, url in ads.iterator():
+            urls[url].append(ad_id)
+        queue_max = thumbnail_pipeline.configure()['QUEUE_MAX']
+        for index, (url, ad_ids) in enumerate(urls.items(), 1):
+            thumbnail_pipeline.submit(url, ad_ids)
+            if index % queue_max == 0:
+                thumbnail_pipeline.wait()
+        thumbnail_pipeline.wait()
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(urls)}, объявлений: '
+            f'{sum(map(len, urls.values()))}'
+        ))
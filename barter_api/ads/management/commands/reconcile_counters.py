@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from ads.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """Пересчет таблиц счетчиков."""
+
+    help = (
+        'Пересчитывает счетчики объявлений и предложений запросами '
+        'GROUP BY, исправляет расходящиеся строки и печатает расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения.'
+        )
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Алиас базы данных.'
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters(
+            using=options['database'], dry_run=options['dry_run']
+        )
+        for model, key, field, was, value in drift:
+            self.stdout.write(
+                f'{model._meta.model_name} {key} {field}: {was} -> {value}'
+            )
+        message = f'Расхождений: {len(drift)}'
+        if drift:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
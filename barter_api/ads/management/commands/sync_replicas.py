@@ -0,0 +1,38 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from ads.routing import get_routing_config
+
+
+class Command(BaseCommand):
+    """Копирование основной базы SQLite в файлы реплик."""
+
+    help = (
+        'Для локальной проверки маршрутизации чтений: копирует файл '
+        'основной базы SQLite в файлы реплик из DB_REPLICAS через '
+        'backup API. Между запусками реплики отстают от основной базы.'
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replicas = get_routing_config()['REPLICAS']
+        if not replicas:
+            raise CommandError('Реплики не настроены, задайте DB_REPLICAS')
+        for alias in replicas:
+            replica = connections[alias].settings_dict
+            if 'sqlite3' not in replica['ENGINE']:
+                raise CommandError(f'{alias}: поддерживается только SQLite')
+            connections[alias].close()
+            source = sqlite3.connect(primary['NAME'])
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(f"{alias}: {replica['NAME']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Реплик обновлено: {len(replicas)}'
+        ))
@@ -0,0 +1,242 @@
+from collections import Counter, defaultdict, deque
+
+from .constants import MATCH_CYCLES_MAX, MATCH_DEPTH_MAX, MATCH_SUGGESTIONS_MAX
+from .engines import SharedStateEngine, shared_write
+
+
+class MatchingEngine(SharedStateEngine):
+    """Поиск обменов по графу ожидающих предложений.
+
+    Вершины графа - пользователи, ребро u -> v означает, что u
+    предложил обмен на объявление v, то есть хочет вещь v. Цикл
+    u -> v -> ... -> u дает обмен, в котором каждый получает то,
+    что хотел. Дополнительно хранятся "желания" пользователей по
+    (категория, состояние) и предложения активных объявлений для
+    подсказок встречного обмена.
+
+    Граф строится из базы при первом обращении и дальше обновляется
+    по событиям изменения предложений и объявлений, а после записей
+    других процессов перестраивается в фоне.
+    """
+
+    state_fields = (
+        'edges', 'reverse_edges', 'proposals', 'wants', 'wanted_by', 'ads',
+        'offers', 'offered_by'
+    )
+
+    def clear(self):
+        with self.lock:
+            self.edges = defaultdict(lambda: defaultdict(set))
+            self.reverse_edges = defaultdict(Counter)
+            self.proposals = {}
+            self.wants = defaultdict(Counter)
+            self.wanted_by = defaultdict(Counter)
+            self.ads = {}
+            self.offers = defaultdict(Counter)
+            self.offered_by = defaultdict(Counter)
+
+    def fill(self):
+        """Построение графа из базы."""
+        from .models import Ad, ExchangeProposal
+
+        with self.lock:
+            ads = Ad.objects.active().values_list(
+                'id', 'user_id', 'category', 'condition'
+            )
+            for ad_id, user_id, category, condition in ads.iterator():
+                self._set_ad(ad_id, user_id, (category, condition))
+            proposals = ExchangeProposal.objects.filter(
+                status='pending'
+            ).values_list(
+                'id', 'sender_user_id', 'receiver_user_id',
+                'ad_receiver__category', 'ad_receiver__condition'
+            )
+            for pk, sender, receiver, category, condition in (
+                proposals.iterator()
+            ):
+                self._add_proposal(pk, sender, receiver, (category, condition))
+
+    def _add_proposal(self, pk, sender, receiver, key):
+        if pk in self.proposals:
+            self._remove_proposal(pk)
+        self.proposals[pk] = (sender, receiver, key)
+        self.edges[sender][receiver].add(pk)
+        self.reverse_edges[receiver][sender] += 1
+        self.wants[sender][key] += 1
+        self.wanted_by[key][sender] += 1
+
+    def _remove_proposal(self, pk):
+        sender, receiver, key = self.proposals.pop(pk)
+        targets = self.edges[sender]
+        targets[receiver].discard(pk)
+        if not targets[receiver]:
+            del targets[receiver]
+        if not targets:
+            del self.edges[sender]
+        self.reverse_edges[receiver][sender] -= 1
+        if self.reverse_edges[receiver][sender] <= 0:
+            del self.reverse_edges[receiver][sender]
+        self.wants[sender][key] -= 1
+        self.wanted_by[key][sender] -= 1
+        if self.wants[sender][key] <= 0:
+            del self.wants[sender][key]
+            del self.wanted_by[key][sender]
+
+    def _set_ad(self, ad_id, user_id, key):
+        self._unset_ad(ad_id)
+        self.ads[ad_id] = (user_id, key)
+        self.offers[user_id][key] += 1
+        self.offered_by[key][user_id] += 1
+
+    def _unset_ad(self, ad_id):
+        if ad_id not in self.ads:
+            return
+        user_id, key = self.ads.pop(ad_id)
+        self.offers[user_id][key] -= 1
+        self.offered_by[key][user_id] -= 1
+        if self.offers[user_id][key] <= 0:
+            del self.offers[user_id][key]
+            del self.offered_by[key][user_id]
+
+    @shared_write
+    def update_proposal(self, pk, sender, receiver, key, status):
+        """Учет создания или смены статуса предложения."""
+        with self.lock:
+            if not self.loaded:
+                return
+            if status == 'pending':
+                self._add_proposal(pk, sender, receiver, key)
+            elif pk in self.proposals:
+                self._remove_proposal(pk)
+
+    @shared_write
+    def remove_proposals(self, pks):
+        """Удаление предложений, вышедших из статуса ожидания."""
+        with self.lock:
+            if not self.loaded:
+                return
+            for pk in pks:
+                if pk in self.proposals:
+                    self._remove_proposal(pk)
+
+    def update_ad(self, ad_id, user_id, key, is_active):
+        """Учет создания, изменения или удаления объявления."""
+        self.update_ads([(ad_id, user_id, key, is_active)])
+
+    @shared_write
+    def update_ads(self, rows):
+        """Учет пачки объявлений: (id, автор, ключ, активность)."""
+        with self.lock:
+            if not self.loaded:
+                return
+            for ad_id, user_id, key, is_active in rows:
+                if is_active:
+                    self._set_ad(ad_id, user_id, key)
+                else:
+                    self._unset_ad(ad_id)
+
+    @shared_write
+    def deactivate_ads(self, ad_ids):
+        with self.lock:
+            if not self.loaded:
+                return
+            for ad_id in ad_ids:
+                self._unset_ad(ad_id)
+
+    def _distances_to(self, user, max_depth):
+        """Расстояния до user по обратным ребрам, не дальше max_depth."""
+        distances = {user: 0}
+        queue = deque([user])
+        while queue:
+            node = queue.popleft()
+            distance = distances[node] + 1
+            if distance > max_depth:
+                continue
+            for source in self.reverse_edges.get(node, ()):
+                if source not in distances:
+                    distances[source] = distance
+                    queue.append(source)
+        return distances
+
+    def find_cycles(self, user, max_depth=MATCH_DEPTH_MAX,
+                    limit=MATCH_CYCLES_MAX):
+        """Циклы обмена через user длиной от 2 до max_depth.
+
+        Обход в глубину отсекает вершины, из которых user недостижим
+        за оставшееся число шагов, поэтому стоимость зависит от
+        окрестности пользователя, а не от размера графа.
+        """
+        self.ensure_loaded()
+        with self.lock:
+            distances = self._distances_to(user, max_depth)
+            cycles = []
+            path = [user]
+            on_path = {user}
+
+            def visit(node, depth):
+                for target, pks in self.edges.get(node, {}).items():
+                    if len(cycles) >= limit:
+                        return
+                    if target == user and depth >= 2:
+                        cycles.append(self._build_cycle(path))
+                        continue
+                    if target in on_path:
+                        continue
+                    if distances.get(target, max_depth + 1) + depth > (
+                        max_depth
+                    ):
+                        continue
+                    path.append(target)
+                    on_path.add(target)
+                    visit(target, depth + 1)
+                    path.pop()
+                    on_path.discard(target)
+
+            visit(user, 1)
+            return cycles
+
+    def _build_cycle(self, path):
+        users = list(path)
+        proposals = [
+            min(self.edges[source][target])
+            for source, target in zip(users, users[1:] + users[:1])
+        ]
+        return {'users': users, 'proposals': proposals}
+
+    def suggest(self, user, limit=MATCH_SUGGESTIONS_MAX):
+        """Пользователи, с которыми возможен встречный обмен.
+
+        Подходит тот, кто предлагает вещь из желаемых user
+        (категория, состояние) и сам хочет что-то из предложенного user.
+        """
+        self.ensure_loaded()
+        with self.lock:
+            candidates = Counter()
+            gives_back = {}
+            for key in self.offers.get(user, ()):
+                for other, count in self.wanted_by.get(key, {}).items():
+                    if other != user:
+                        candidates[other] += count
+                        gives_back.setdefault(other, key)
+            suggestions = []
+            for other, score in candidates.most_common():
+                matched = [
+                    key for key in self.wants.get(user, ())
+                    if key in self.offers.get(other, ())
+                ]
+                if not matched:
+                    continue
+                suggestions.append({
+                    'user': other,
+                    'gives': dict(zip(('category', 'condition'), matched[0])),
+                    'wants': dict(zip(
+                        ('category', 'condition'), gives_back[other]
+                    )),
+                    'score': score * len(matched),
+                })
+                if len(suggestions) >= limit:
+                    break
+            return suggestions
+
+
+matching_engine = MatchingEngine(name='matching')
@@ -0,0 +1,70 @@
+import bisect
+import threading
+from collections import defaultdict
+
+from .constants import PERF_HISTOGRAM_BUCKETS_MS
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин."""
+
+    def __init__(self, buckets=PERF_HISTOGRAM_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        cumulative, buckets = 0, {}
+        for bound, count in zip(
+            [*map(str, self.buckets), '+Inf'], self.counts
+        ):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': buckets,
+        }
+
+
+class MetricsRegistry:
+    """Метрики запросов в памяти процесса, сгруппированные по view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = defaultdict(lambda: defaultdict(Histogram))
+            self.counters = defaultdict(lambda: defaultdict(int))
+
+    def record(self, view, timings, counters):
+        """timings - длительности в мс, counters - накапливаемые числа."""
+        with self.lock:
+            for name, value in timings.items():
+                self.histograms[view][name].observe(value)
+            for name, value in counters.items():
+                self.counters[view][name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                view: {
+                    'timings_ms': {
+                        name: histogram.as_dict()
+                        for name, histogram in histograms.items()
+                    },
+                    'counters': dict(self.counters[view]),
+                }
+                for view, histograms in self.histograms.items()
+            }
+
+
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,298 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from .constants import (
+    PERF_INSTRUMENTATION_DEFAULTS, THROTTLE_RETRY_AFTER,
+    THROTTLE_WRITE_METHODS
+)
+from .metrics import metrics_registry
+from .routing import get_routing_config, pin_to_primary
+from .throttling import get_throttling_config, write_admission
+
+
+logger = logging.getLogger('ads.performance')
+
+
+class RequestStats:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.db_time = 0.0
+        self.view_db_time = 0.0
+        self.queries = Counter()
+        self.view_started = None
+        self.view_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[(sql, repr(params))] += 1
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_queries(self):
+        """Повторы одинакового SQL с одинаковыми параметрами."""
+        return sum(count - 1 for count in self.queries.values())
+
+    @property
+    def similar_queries(self):
+        """Повторы одного SQL с разными параметрами (признак N+1)."""
+        by_sql = Counter()
+        for (sql, _), count in self.queries.items():
+            by_sql[sql] += count
+        return sum(count - 1 for count in by_sql.values())
+
+
+class PerformanceMiddleware:
+    """Замер времени запроса по частям: БД, сериализация, рендеринг.
+
+    Сериализацией считается время работы view за вычетом запросов
+    к БД: в generic view DRF оно уходит в основном на сериализаторы.
+    Результат отдается в заголовке Server-Timing, в лог
+    ``ads.performance`` и в гистограммы для endpoint метрик.
+    В выборку попадает доля запросов SAMPLE_RATE.
+
+    Работает и в синхронной, и в асинхронной цепочке middleware. В
+    асинхронной обертки запросов ставятся из потока sync_to_async:
+    соединения с базой у каждого потока свои.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = {
+            **PERF_INSTRUMENTATION_DEFAULTS,
+            **getattr(settings, 'PERF_INSTRUMENTATION', {}),
+        }
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = self.start(request)
+        if stats is None:
+            return self.get_response(request)
+        with ExitStack() as stack:
+            self.wrap_connections(stack, stats)
+            response = self.get_response(request)
+        if stats.view is not None:
+            self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = self.start(request)
+        if stats is None:
+            return await self.get_response(request)
+        stack = ExitStack()
+        await sync_to_async(self.wrap_connections)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        if stats.view is not None:
+            self.finish(request, response, stats)
+        return response
+
+    def start(self, request):
+        """Замеры запроса, если он попал в выборку."""
+        if not self.config['ENABLED'] or (
+            random.random() >= self.config['SAMPLE_RATE']
+        ):
+            return None
+        stats = RequestStats()
+        request.perf_stats = stats
+        return stats
+
+    def wrap_connections(self, stack, stats):
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(stats.record_query)
+            )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(request, 'perf_stats', None)
+        if stats is None:
+            return None
+        view_class = getattr(view_func, 'view_class', None)
+        stats.view = (view_class or view_func).__name__
+        stats.view_started = time.perf_counter()
+        stats.view_db_time = stats.db_time
+        return None
+
+    def process_template_response(self, request, response):
+        stats = getattr(request, 'perf_stats', None)
+        if stats is None or stats.view_started is None:
+            return response
+        self.end_view(stats)
+        stats.render_started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: self.end_render(stats)
+        )
+        return response
+
+    def end_view(self, stats):
+        stats.view_time = time.perf_counter() - stats.view_started
+        stats.view_db_time = stats.db_time - stats.view_db_time
+
+    def end_render(self, stats):
+        stats.render_time = time.perf_counter() - stats.render_started
+
+    def finish(self, request, response, stats):
+        if stats.render_started is None:
+            self.end_view(stats)
+        total = time.perf_counter() - stats.started
+        timings = {
+            'total': total * 1000,
+            'db': stats.db_time * 1000,
+            'serialize': max(stats.view_time - stats.view_db_time, 0) * 1000,
+            'render': stats.render_time * 1000,
+        }
+        size = 0 if response.streaming else len(response.content)
+        counters = {
+            'requests': 1,
+            'queries': stats.query_count,
+            'duplicate_queries': stats.duplicate_queries,
+            'similar_queries': stats.similar_queries,
+            'response_bytes': size,
+        }
+        metrics_registry.record(stats.view, timings, counters)
+        if self.config['SERVER_TIMING']:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={value:.2f}' + (
+                    f';desc="{stats.query_count} queries"'
+                    if name == 'db' else ''
+                )
+                for name, value in timings.items()
+            )
+        if self.config['LOG']:
+            logger.info(json.dumps({
+                'view': stats.view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'timings_ms': {
+                    name: round(value, 3) for name, value in timings.items()
+                },
+                **counters,
+            }, ensure_ascii=False))
+
+
+class WriteAdmissionMiddleware:
+    """Сброс изменяющих запросов сверх ADS_THROTTLING['WRITE_CONCURRENCY'].
+
+    Стоит перед сессиями и аутентификацией: лишний запрос получает
+    503 с Retry-After, не дойдя до базы. При лимите None не действует.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limit = get_throttling_config()['WRITE_CONCURRENCY']
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.applies(request):
+            return self.get_response(request)
+        if not write_admission.try_acquire(self.limit):
+            return self.reject()
+        try:
+            return self.get_response(request)
+        finally:
+            write_admission.release()
+
+    async def __acall__(self, request):
+        if not self.applies(request):
+            return await self.get_response(request)
+        if not write_admission.try_acquire(self.limit):
+            return self.reject()
+        try:
+            return await self.get_response(request)
+        finally:
+            write_admission.release()
+
+    def applies(self, request):
+        return (
+            self.limit is not None
+            and request.method in THROTTLE_WRITE_METHODS
+        )
+
+    def reject(self):
+        response = JsonResponse(
+            {'detail': 'Сервер перегружен, повторите запрос позже.'},
+            status=503,
+            json_dumps_params={'ensure_ascii': False}
+        )
+        response['Retry-After'] = str(THROTTLE_RETRY_AFTER)
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """Закрепление пользователя за основной базой после записи.
+
+    Успешный изменяющий запрос аутентифицированного пользователя
+    переводит его чтения в основную базу, пока реплики не догонят
+    запись. Пользователя выставляет DRF при аутентификации во view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        await sync_to_async(self.pin)(request, response)
+        return response
+
+    def pin(self, request, response):
+        if (
+            request.method not in THROTTLE_WRITE_METHODS
+            or response.status_code >= 400
+            or not get_routing_config()['REPLICAS']
+        ):
+            return
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
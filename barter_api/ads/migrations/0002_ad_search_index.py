@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from ads.search import get_search_backend
+
+
+def install_search_index(apps, schema_editor):
+    get_search_backend(schema_editor.connection.alias).install(schema_editor)
+
+
+def remove_search_index(apps, schema_editor):
+    get_search_backend(schema_editor.connection.alias).uninstall(
+        schema_editor
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0002_ad_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ad',
+            name='ads_ad_created_9f5b83_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ad',
+            name='ads_ad_categor_aafbda_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='ad_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['title', 'id'], name='ad_active_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-created_at', '-id'], name='ad_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['condition', '-created_at', '-id'], name='ad_active_condition_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'condition', '-created_at', '-id'], name='ad_active_cat_cond_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-created_at', '-id'], name='ad_active_user_idx'),
+        ),
+    ]
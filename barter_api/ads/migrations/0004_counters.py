@@ -0,0 +1,73 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    """Начальные значения счетчиков по существующим данным."""
+    using = schema_editor.connection.alias
+    Ad = apps.get_model('ads', 'Ad')
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    CategoryCounter = apps.get_model('ads', 'CategoryCounter')
+    UserCounter = apps.get_model('ads', 'UserCounter')
+    ads = Ad.objects.using(using).filter(is_active=True).order_by()
+    pending = ExchangeProposal.objects.using(using).filter(
+        status='pending'
+    ).order_by()
+    CategoryCounter.objects.using(using).bulk_create([
+        CategoryCounter(category=category, active_ads=count)
+        for category, count in ads.values_list('category').annotate(
+            Count('id')
+        )
+    ])
+    users = {}
+    for field, queryset in (
+        ('active_ads', ads.values_list('user_id')),
+        ('pending_incoming', pending.values_list('ad_receiver__user_id')),
+        ('pending_outgoing', pending.values_list('ad_sender__user_id')),
+    ):
+        for user_id, count in queryset.annotate(Count('id')):
+            users.setdefault(user_id, {})[field] = count
+    UserCounter.objects.using(using).bulk_create([
+        UserCounter(user_id=user_id, **values)
+        for user_id, values in users.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0003_ad_active_partial_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryCounter',
+            fields=[
+                ('category', models.CharField(choices=[('electronics', 'Электроника'), ('clothing', 'Одежда'), ('books', 'Книги'), ('home', 'Дом и сад'), ('other', 'Другое')], max_length=50, primary_key=True, serialize=False, verbose_name='Категория')),
+                ('active_ads', models.IntegerField(default=0, verbose_name='Активных объявлений')),
+            ],
+            options={
+                'verbose_name': 'Счетчики категории',
+                'verbose_name_plural': 'Счетчики категорий',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('active_ads', models.IntegerField(default=0, verbose_name='Активных объявлений')),
+                ('pending_incoming', models.IntegerField(default=0, verbose_name='Ожидающих входящих предложений')),
+                ('pending_outgoing', models.IntegerField(default=0, verbose_name='Ожидающих исходящих предложений')),
+            ],
+            options={
+                'verbose_name': 'Счетчики пользователя',
+                'verbose_name_plural': 'Счетчики пользователей',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:02
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    """Для существующих объявлений дата изменения равна дате создания."""
+    Ad = apps.get_model('ads', 'Ad')
+    Ad.objects.using(schema_editor.connection.alias).update(
+        updated_at=F('created_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0005_ad_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAd',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID объявления')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('description', models.TextField(verbose_name='Описание товара')),
+                ('image_url', models.URLField(blank=True, null=True, verbose_name='URL изображения')),
+                ('category', models.CharField(choices=[('electronics', 'Электроника'), ('clothing', 'Одежда'), ('books', 'Книги'), ('home', 'Дом и сад'), ('other', 'Другое')], max_length=50, verbose_name='Категория')),
+                ('condition', models.CharField(choices=[('new', 'Новый'), ('used', 'Б/у'), ('broken', 'Требует ремонта')], max_length=50, verbose_name='Состояние')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата изменения')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата переноса в архив')),
+            ],
+            options={
+                'verbose_name': 'Архивное объявление',
+                'verbose_name_plural': 'Архивные объявления',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedExchangeProposal',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID предложения')),
+                ('ad_sender_id', models.BigIntegerField(db_index=True, verbose_name='Объявление отправителя')),
+                ('ad_receiver_id', models.BigIntegerField(db_index=True, verbose_name='Объявление получателя')),
+                ('comment', models.TextField(blank=True, verbose_name='Комментарий')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('accepted', 'Принята'), ('rejected', 'Отклонена'), ('canceled', 'Отменена')], max_length=20)),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата переноса в архив')),
+            ],
+            options={
+                'verbose_name': 'Архивное предложение обмена',
+                'verbose_name_plural': 'Архивные предложения обмена',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['updated_at', 'id'], name='ad_inactive_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_ads', to=settings.AUTH_USER_MODEL, verbose_name='Автор объявления'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0006_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='image_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256 изображения'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота изображения'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('ready', 'Готово'), ('invalid', 'Не изображение')], max_length=20, null=True, verbose_name='Статус изображения'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина изображения'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='thumbnail_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256 миниатюры'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='image_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256 изображения'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота изображения'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('ready', 'Готово'), ('invalid', 'Не изображение')], max_length=20, null=True, verbose_name='Статус изображения'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина изображения'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='thumbnail_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256 миниатюры'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_proposal_users(apps, schema_editor):
+    """Авторы объявлений отправителя и получателя для предложений."""
+    Ad = apps.get_model('ads', 'Ad')
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    alias = schema_editor.connection.alias
+    ExchangeProposal.objects.using(alias).update(
+        sender_user_id=Subquery(
+            Ad.objects.filter(pk=OuterRef('ad_sender_id')).values('user_id')
+        ),
+        receiver_user_id=Subquery(
+            Ad.objects.filter(
+                pk=OuterRef('ad_receiver_id')
+            ).values('user_id')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0007_ad_image_thumbnails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchangeproposal',
+            name='receiver_user',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='incoming_proposals', to=settings.AUTH_USER_MODEL, verbose_name='Получатель'),
+        ),
+        migrations.AddField(
+            model_name='exchangeproposal',
+            name='sender_user',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_proposals', to=settings.AUTH_USER_MODEL, verbose_name='Отправитель'),
+        ),
+        migrations.RunPython(fill_proposal_users, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='receiver_user',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='incoming_proposals', to=settings.AUTH_USER_MODEL, verbose_name='Получатель'),
+        ),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='sender_user',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_proposals', to=settings.AUTH_USER_MODEL, verbose_name='Отправитель'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['receiver_user', '-created_at', '-id'], name='proposal_receiver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['receiver_user', 'status', '-created_at', '-id'], name='proposal_receiver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['sender_user', '-created_at', '-id'], name='proposal_sender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['sender_user', 'status', '-created_at', '-id'], name='proposal_sender_status_idx'),
+        ),
+    ]
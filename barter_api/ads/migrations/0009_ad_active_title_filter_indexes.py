@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0008_proposal_users'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'title', 'id'], name='ad_active_category_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['condition', 'title', 'id'], name='ad_active_condition_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'condition', 'title', 'id'], name='ad_active_cat_cond_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'title', 'id'], name='ad_active_user_title_idx'),
+        ),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from .constants import (
-    CATEGORY_CHOICES, CONDITION_CHOICES, STATUS_CHOICES,
+    CATEGORY_CHOICES, CONDITION_CHOICES, IMAGE_STATUS_CHOICES,
+    PROPOSAL_DIRECTIONS, STATUS_CHOICES, STATUS_TRANSITIONS,
     TITLE_LENGHT_MAX, LENGHT_MAX, STATUS_LENGHT_MAX
 )
 
@@ -10,7 +12,143 @@ from .constants import (
 User = get_user_model()
 
 
-class Ad(models.Model):
+class AdQuerySet(models.QuerySet):
+    """Запросы к объявлениям."""
+
+    def active(self):
+        """Только активные объявления."""
+        return self.filter(is_active=True)
+
+    def with_related(self):
+        """Объявления вместе с авторами одним запросом."""
+        return self.select_related('user')
+
+    def deactivate(self):
+        """Мягкое удаление одним UPDATE.
+
+        Возвращает id, автора и категорию объявлений, которые были
+        активны: по ним обновляются счетчики.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            rows = list(
+                self.active().select_for_update().order_by().values(
+                    'id', 'user_id', 'category'
+                )
+            )
+            Ad.objects.using(self.db).filter(
+                id__in=[row['id'] for row in rows]
+            ).update(is_active=False, updated_at=timezone.now())
+        return rows
+
+
+class ExchangeProposalQuerySet(models.QuerySet):
+    """Запросы к предложениям обмена."""
+
+    def with_related(self):
+        """Предложения вместе с обоими объявлениями и их авторами."""
+        return self.select_related('ad_sender__user', 'ad_receiver__user')
+
+    def for_user(self, user, *directions):
+        """Входящие и (или) исходящие предложения пользователя.
+
+        directions - ключи PROPOSAL_DIRECTIONS, по умолчанию все.
+        Отбор идет по денормализованным sender_user и receiver_user,
+        без соединения с объявлениями.
+        """
+        condition = models.Q()
+        for direction in directions or PROPOSAL_DIRECTIONS:
+            condition |= models.Q(**{PROPOSAL_DIRECTIONS[direction]: user})
+        return self.filter(condition)
+
+    def transition(self, proposal, status):
+        """Атомарный перевод предложения из ожидания в status.
+
+        Строки обоих объявлений блокируются в порядке id, поэтому
+        конкурирующие принятия с общим объявлением выполняются по очереди,
+        а остальная таблица не блокируется. Статус меняется условным
+        UPDATE ... WHERE status='pending'; при принятии все остальные
+        ожидающие предложения по этим объявлениям отклоняются одним
+        UPDATE. Возвращает список изменений или пустой список, если
+        предложение уже не ожидает ответа.
+        """
+        previous = 'pending'
+        if status not in STATUS_TRANSITIONS[previous]:
+            raise ValueError(f'Недопустимый переход {previous} -> {status}')
+        ad_ids = sorted({proposal.ad_sender_id, proposal.ad_receiver_id})
+        with transaction.atomic(using=self.db):
+            list(
+                Ad.objects.using(self.db).select_for_update().filter(
+                    id__in=ad_ids
+                ).order_by('id').values_list('id', flat=True)
+            )
+            if not self.filter(pk=proposal.pk, status=previous).update(
+                status=status
+            ):
+                return []
+            statuses = {proposal.pk: status}
+            if status == 'accepted':
+                competing = self.filter(status=previous).filter(
+                    models.Q(ad_sender_id__in=ad_ids) |
+                    models.Q(ad_receiver_id__in=ad_ids)
+                )
+                rejected = list(competing.values_list('pk', flat=True))
+                competing.filter(pk__in=rejected).update(status='rejected')
+                statuses.update(dict.fromkeys(rejected, 'rejected'))
+            rows = self.filter(pk__in=statuses).values(
+                'id', 'ad_sender_id', 'ad_receiver_id', 'sender_user_id',
+                'receiver_user_id'
+            )
+            return [
+                dict(
+                    row, previous_status=previous, status=statuses[row['id']]
+                )
+                for row in rows
+            ]
+
+
+class TrackedStateMixin:
+    """Доступ к прежнему состоянию строки при записи.
+
+    Перед изменением или удалением строка блокируется и ее поля
+    tracked_fields попадают в saved_state: по разнице с новыми
+    значениями обработчики сигналов обновляют счетчики в той же
+    транзакции. Сохранение с update_fields без tracked_fields
+    обходится без блокировки: saved_state тогда - текущие значения.
+    """
+
+    tracked_fields = ()
+    saved_state = None
+
+    def get_state(self):
+        return {name: getattr(self, name) for name in self.tracked_fields}
+
+    def load_saved_state(self, using):
+        self.saved_state = type(self)._base_manager.using(using).filter(
+            pk=self.pk
+        ).select_for_update().values(*self.tracked_fields).first()
+
+    def tracks_update(self, update_fields):
+        """Меняет ли сохранение с update_fields поля tracked_fields."""
+        if update_fields is None:
+            return True
+        return not {
+            self._meta.get_field(name).attname for name in update_fields
+        }.isdisjoint(self.tracked_fields)
+
+    def save(self, *args, **kwargs):
+        """Сохранение в одной транзакции с обработчиками сигналов."""
+        if not self._state.adding and not self.tracks_update(
+            kwargs.get('update_fields')
+        ):
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class Ad(TrackedStateMixin, models.Model):
     """Модель объявлений."""
 
     user = models.ForeignKey(
@@ -31,6 +169,35 @@ class Ad(models.Model):
         blank=True,
         null=True
     )
+    image_status = models.CharField(
+        verbose_name='Статус изображения',
+        max_length=STATUS_LENGHT_MAX,
+        choices=IMAGE_STATUS_CHOICES,
+        blank=True,
+        null=True
+    )
+    image_hash = models.CharField(
+        verbose_name='SHA-256 изображения',
+        max_length=64,
+        blank=True,
+        null=True
+    )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина изображения',
+        blank=True,
+        null=True
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота изображения',
+        blank=True,
+        null=True
+    )
+    thumbnail_hash = models.CharField(
+        verbose_name='SHA-256 миниатюры',
+        max_length=64,
+        blank=True,
+        null=True
+    )
     category = models.CharField(
         verbose_name='Категория',
         max_length=LENGHT_MAX,
@@ -45,18 +212,82 @@ class Ad(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     is_active = models.BooleanField(
         default=True,
         verbose_name='Активно'
     )
 
+    objects = AdQuerySet.as_manager()
+    tracked_fields = ('user_id', 'category', 'is_active', 'image_url')
+    image_fields = (
+        'image_status', 'image_hash', 'image_width', 'image_height',
+        'thumbnail_hash'
+    )
+
     class Meta:
         verbose_name = 'Объявление'
         verbose_name_plural = 'Объявления'
         ordering = ('-created_at',)
         indexes = [
-            models.Index(fields=['created_at']),
-            models.Index(fields=['category']),
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_created_idx'
+            ),
+            models.Index(
+                fields=['title', 'id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_title_idx'
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_category_idx'
+            ),
+            models.Index(
+                fields=['condition', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_condition_idx'
+            ),
+            models.Index(
+                fields=['category', 'condition', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_cat_cond_idx'
+            ),
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_user_idx'
+            ),
+            models.Index(
+                fields=['category', 'title', 'id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_category_title_idx'
+            ),
+            models.Index(
+                fields=['condition', 'title', 'id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_condition_title_idx'
+            ),
+            models.Index(
+                fields=['category', 'condition', 'title', 'id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_cat_cond_title_idx'
+            ),
+            models.Index(
+                fields=['user', 'title', 'id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_user_title_idx'
+            ),
+            models.Index(
+                fields=['updated_at', 'id'],
+                condition=models.Q(is_active=False),
+                name='ad_inactive_updated_idx'
+            ),
         ]
 
     def __str__(self):
@@ -68,7 +299,7 @@ class Ad(models.Model):
         self.save()
 
 
-class ExchangeProposal(models.Model):
+class ExchangeProposal(TrackedStateMixin, models.Model):
     """Модель предложений обмена."""
 
     ad_sender = models.ForeignKey(
@@ -83,6 +314,22 @@ class ExchangeProposal(models.Model):
         on_delete=models.CASCADE,
         related_name='received_proposals'
     )
+    sender_user = models.ForeignKey(
+        User,
+        verbose_name='Отправитель',
+        on_delete=models.CASCADE,
+        related_name='outgoing_proposals',
+        db_index=False,
+        editable=False
+    )
+    receiver_user = models.ForeignKey(
+        User,
+        verbose_name='Получатель',
+        on_delete=models.CASCADE,
+        related_name='incoming_proposals',
+        db_index=False,
+        editable=False
+    )
     comment = models.TextField(
         verbose_name='Комментарий',
         blank=True
@@ -97,6 +344,12 @@ class ExchangeProposal(models.Model):
         verbose_name='Дата создания'
     )
 
+    objects = ExchangeProposalQuerySet.as_manager()
+    tracked_fields = (
+        'ad_sender_id', 'ad_receiver_id', 'sender_user_id',
+        'receiver_user_id', 'status'
+    )
+
     class Meta:
         verbose_name = 'Обмен предложением'
         verbose_name_plural = 'Обмен предложениями'
@@ -107,6 +360,259 @@ class ExchangeProposal(models.Model):
                 name='unique_proposal'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['receiver_user', '-created_at', '-id'],
+                name='proposal_receiver_idx'
+            ),
+            models.Index(
+                fields=['receiver_user', 'status', '-created_at', '-id'],
+                name='proposal_receiver_status_idx'
+            ),
+            models.Index(
+                fields=['sender_user', '-created_at', '-id'],
+                name='proposal_sender_idx'
+            ),
+            models.Index(
+                fields=['sender_user', 'status', '-created_at', '-id'],
+                name='proposal_sender_status_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Предложение #{self.id}: {self.ad_sender}->{self.ad_receiver}"
+
+    def save(self, *args, **kwargs):
+        """Сохранение с авторами объявлений в sender_user и receiver_user.
+
+        Автор объявления не меняется, поэтому денормализованные поля
+        достаточно заполнять при сохранении предложения.
+        """
+        self.sender_user_id = self.ad_sender.user_id
+        self.receiver_user_id = self.ad_receiver.user_id
+        super().save(*args, **kwargs)
+
+
+class ArchivedAd(models.Model):
+    """Архив объявлений, неактивных дольше срока хранения.
+
+    Строки переносятся из Ad с прежними id и датами, чтобы карточка
+    объявления отдавалась из архива без изменений.
+    """
+
+    id = models.BigIntegerField(
+        primary_key=True,
+        verbose_name='ID объявления'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_ads',
+        verbose_name='Автор объявления'
+    )
+    title = models.CharField(
+        verbose_name='Заголовок',
+        max_length=TITLE_LENGHT_MAX
+    )
+    description = models.TextField(
+        verbose_name='Описание товара',
+    )
+    image_url = models.URLField(
+        verbose_name='URL изображения',
+        blank=True,
+        null=True
+    )
+    category = models.CharField(
+        verbose_name='Категория',
+        max_length=LENGHT_MAX,
+        choices=CATEGORY_CHOICES
+    )
+    condition = models.CharField(
+        verbose_name='Состояние',
+        max_length=LENGHT_MAX,
+        choices=CONDITION_CHOICES
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания'
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения'
+    )
+    image_status = models.CharField(
+        verbose_name='Статус изображения',
+        max_length=STATUS_LENGHT_MAX,
+        choices=IMAGE_STATUS_CHOICES,
+        blank=True,
+        null=True
+    )
+    image_hash = models.CharField(
+        verbose_name='SHA-256 изображения',
+        max_length=64,
+        blank=True,
+        null=True
+    )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина изображения',
+        blank=True,
+        null=True
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота изображения',
+        blank=True,
+        null=True
+    )
+    thumbnail_hash = models.CharField(
+        verbose_name='SHA-256 миниатюры',
+        max_length=64,
+        blank=True,
+        null=True
+    )
+    archived_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата переноса в архив'
+    )
+
+    class Meta:
+        verbose_name = 'Архивное объявление'
+        verbose_name_plural = 'Архивные объявления'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.title}'
+
+
+class ArchivedExchangeProposal(models.Model):
+    """Архив завершенных предложений по архивным объявлениям.
+
+    Объявление может быть и в архиве, и в основной таблице, поэтому
+    ссылки на объявления хранятся как id без внешнего ключа.
+    """
+
+    id = models.BigIntegerField(
+        primary_key=True,
+        verbose_name='ID предложения'
+    )
+    ad_sender_id = models.BigIntegerField(
+        db_index=True,
+        verbose_name='Объявление отправителя'
+    )
+    ad_receiver_id = models.BigIntegerField(
+        db_index=True,
+        verbose_name='Объявление получателя'
+    )
+    comment = models.TextField(
+        verbose_name='Комментарий',
+        blank=True
+    )
+    status = models.CharField(
+        max_length=STATUS_LENGHT_MAX,
+        choices=STATUS_CHOICES
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания'
+    )
+    archived_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата переноса в архив'
+    )
+
+    class Meta:
+        verbose_name = 'Архивное предложение обмена'
+        verbose_name_plural = 'Архивные предложения обмена'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return (
+            f"Предложение #{self.id}: "
+            f"{self.ad_sender_id}->{self.ad_receiver_id}"
+        )
+
+
+class CounterQuerySet(models.QuerySet):
+    """Запросы к таблицам счетчиков."""
+
+    def apply(self, deltas):
+        """Прибавление приращений {ключ: {поле: приращение}}.
+
+        Строка счетчика меняется через F() в текущей транзакции.
+        Отсутствующая строка создается с нулями, только если есть что
+        прибавить: уменьшать несуществующий счетчик некуда, а строка
+        могла быть удалена каскадом вместе с пользователем.
+        """
+        key_field = self.model.key_field
+        for key, changes in deltas.items():
+            updates = {
+                name: models.F(name) + delta
+                for name, delta in changes.items() if delta
+            }
+            if not updates:
+                continue
+            rows = self.filter(**{key_field: key})
+            if not rows.update(**updates) and any(
+                delta > 0 for delta in changes.values()
+            ):
+                self.bulk_create(
+                    [self.model(**{key_field: key})], ignore_conflicts=True
+                )
+                rows.update(**updates)
+
+
+class CategoryCounter(models.Model):
+    """Счетчики по категории."""
+
+    category = models.CharField(
+        verbose_name='Категория',
+        max_length=LENGHT_MAX,
+        choices=CATEGORY_CHOICES,
+        primary_key=True
+    )
+    active_ads = models.IntegerField(
+        default=0,
+        verbose_name='Активных объявлений'
+    )
+
+    objects = CounterQuerySet.as_manager()
+    key_field = 'category'
+    counter_fields = ('active_ads',)
+
+    class Meta:
+        verbose_name = 'Счетчики категории'
+        verbose_name_plural = 'Счетчики категорий'
+
+    def __str__(self):
+        return f'{self.category}: {self.active_ads}'
+
+
+class UserCounter(models.Model):
+    """Счетчики по пользователю."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    active_ads = models.IntegerField(
+        default=0,
+        verbose_name='Активных объявлений'
+    )
+    pending_incoming = models.IntegerField(
+        default=0,
+        verbose_name='Ожидающих входящих предложений'
+    )
+    pending_outgoing = models.IntegerField(
+        default=0,
+        verbose_name='Ожидающих исходящих предложений'
+    )
+
+    objects = CounterQuerySet.as_manager()
+    key_field = 'user_id'
+    counter_fields = ('active_ads', 'pending_incoming', 'pending_outgoing')
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.active_ads}'
@@ -1,15 +1,327 @@
-from rest_framework.pagination import PageNumberPagination
+import heapq
+import json
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from datetime import date
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage, Page
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from .constants import (
-    PAGE_SIZE, PAGE_SIZE_MAX,
-    PAGE_SIZE_QUERY_PARAM, PAGE_QUERY_PARAM
+    CURSOR_QUERY_PARAM, PAGE_SIZE, PAGE_SIZE_MAX,
+    PAGE_SIZE_QUERY_PARAM, PAGE_QUERY_PARAM,
+    PAGINATION_CURSOR, PAGINATION_QUERY_PARAM
 )
 
 
-class AdsPagination(PageNumberPagination):
-    """Пагинация для ads."""
+KeysetCursor = namedtuple('KeysetCursor', ['position', 'pk', 'reverse'])
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset-пагинация по паре (поле сортировки, id).
+
+    Следующая страница выбирается условием по последней записи
+    предыдущей, поэтому стоимость страницы не зависит от ее номера,
+    а COUNT(*) не выполняется.
+    """
+
+    page_size = PAGE_SIZE
+    page_size_query_param = PAGE_SIZE_QUERY_PARAM
+    max_page_size = PAGE_SIZE_MAX
+    cursor_query_param = CURSOR_QUERY_PARAM
+    ordering = '-created_at'
+    tiebreaker = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Возвращает записи страницы."""
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.build_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Асинхронная версия paginate_queryset."""
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.build_page([row async for row in page_queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """Ленивый queryset страницы с одной лишней записью."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.field, self.descending = self.get_key_field(
+            queryset, request, view
+        )
+        self.cursor = self.decode_cursor(request)
+        descending = self.descending
+        if self.cursor is not None:
+            descending ^= self.cursor.reverse
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': self.cursor.position}) |
+                Q(**{
+                    self.field: self.cursor.position,
+                    f'{self.tiebreaker}__{lookup}': self.cursor.pk,
+                })
+            )
+        prefix = '-' if descending else ''
+        return queryset.order_by(
+            f'{prefix}{self.field}', f'{prefix}{self.tiebreaker}'
+        )[:self.page_size + 1]
+
+    def build_page(self, rows):
+        """Отделяет лишнюю запись и определяет наличие соседних страниц."""
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        reverse = self.cursor is not None and self.cursor.reverse
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = rows
+        return rows
+
+    def get_key_field(self, queryset, request, view):
+        """Первое поле сортировки, по которому строится ключ."""
+        ordering = self.get_ordering(request, queryset, view)[0]
+        field = ordering.lstrip('-')
+        try:
+            self.model_field = queryset.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            ordering = self.ordering
+            field = ordering.lstrip('-')
+            self.model_field = queryset.model._meta.get_field(field)
+        return field, ordering.startswith('-')
+
+    def get_value(self, item, name):
+        """Значение поля для объекта модели или строки .values()."""
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, item, reverse=False):
+        position = self.get_value(item, self.field)
+        if isinstance(position, date):
+            position = position.isoformat()
+        payload = json.dumps(
+            [position, self.get_value(item, self.tiebreaker), int(reverse)]
+        )
+        encoded = b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            encoded
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position, pk, reverse = json.loads(
+                b64decode(encoded.encode('ascii')).decode('utf-8')
+            )
+            return KeysetCursor(
+                position=self.model_field.to_python(position),
+                pk=int(pk),
+                reverse=bool(reverse)
+            )
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class AdsKeysetPagination(KeysetPagination):
+    """Keyset-пагинация для ads по (created_at, id)."""
+
+
+class MergedKeysetPagination(KeysetPagination):
+    """Keyset-пагинация слиянием нескольких выборок по (created_at, id).
+
+    Каждая выборка ограничивается курсором и page_size + 1 строками
+    по своему индексу, затем строки сливаются heapq.merge. Стоимость
+    страницы не зависит ни от ее номера, ни от размера выборок.
+    Строка, попавшая в несколько выборок, отдается один раз.
+    """
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """Возвращает записи страницы из всех выборок."""
+        pages = [
+            self.get_page_queryset(queryset, request, view)
+            for queryset in querysets
+        ]
+        if not self.page_size:
+            return None
+        return self.merge([list(page) for page in pages])
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        """Асинхронная версия paginate_querysets."""
+        pages = [
+            self.get_page_queryset(queryset, request, view)
+            for queryset in querysets
+        ]
+        if not self.page_size:
+            return None
+        rows = []
+        for page in pages:
+            rows.append([row async for row in page])
+        return self.merge(rows)
+
+    def merge(self, pages):
+        descending = self.descending
+        if self.cursor is not None:
+            descending ^= self.cursor.reverse
+
+        def key(row):
+            return (
+                self.get_value(row, self.field),
+                self.get_value(row, self.tiebreaker)
+            )
+
+        rows, seen = [], set()
+        for row in heapq.merge(*pages, key=key, reverse=descending):
+            pk = self.get_value(row, self.tiebreaker)
+            if pk in seen:
+                continue
+            seen.add(pk)
+            rows.append(row)
+            if len(rows) > self.page_size:
+                break
+        return self.build_page(rows)
+
+
+class AsyncPaginationMixin:
+    """Асинхронная выборка страницы для PageNumberPagination.
+
+    Повторяет paginate_queryset, но число записей и строки страницы
+    получает через acount() и асинхронную итерацию.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        bottom = (number - 1) * page_size
+        top = min(bottom + page_size, paginator.count)
+        rows = [row async for row in queryset[bottom:top]]
+        self.page = Page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class AsyncPageNumberPagination(AsyncPaginationMixin, PageNumberPagination):
+    """Постраничная пагинация с асинхронной выборкой."""
+
+
+class AdsPagination(AsyncPaginationMixin, PageNumberPagination):
+    """Пагинация для ads.
+
+    По умолчанию постраничная, с параметром
+    ``?pagination=cursor`` или ``?cursor=...`` переключается на keyset.
+    """
 
     page_size = PAGE_SIZE
     page_size_query_param = PAGE_SIZE_QUERY_PARAM
     max_page_size = PAGE_SIZE_MAX
     page_query_param = PAGE_QUERY_PARAM
+    keyset_class = AdsKeysetPagination
+
+    def is_keyset(self, request):
+        """Запрошен ли keyset-режим."""
+        return (
+            request.query_params.get(PAGINATION_QUERY_PARAM)
+            == PAGINATION_CURSOR
+            or CURSOR_QUERY_PARAM in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.is_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.is_keyset(request):
+            self.keyset = self.keyset_class()
+            return await self.keyset.apaginate_queryset(
+                queryset, request, view
+            )
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_page_state(self):
+        """Все, кроме строк, от чего зависит ответ со страницей."""
+        if self.keyset is not None:
+            return [self.keyset.has_next, self.keyset.has_previous]
+        return [self.page.paginator.count]
+
+
+class ProposalsPagination(AdsPagination):
+    """Пагинация предложений пользователя.
+
+    По умолчанию постраничная, в keyset-режиме входящие и исходящие
+    выбираются отдельными запросами по своим индексам и сливаются.
+    """
+
+    keyset_class = MergedKeysetPagination
+
+    def paginate_querysets(self, querysets, request, view=None):
+        self.keyset = self.keyset_class()
+        return self.keyset.paginate_querysets(querysets, request, view)
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        self.keyset = self.keyset_class()
+        return await self.keyset.apaginate_querysets(
+            querysets, request, view
+        )
+
+
+class ProposalsFeedPagination(ProposalsPagination):
+    """Только keyset-пагинация для входящих и исходящих предложений."""
+
+    def is_keyset(self, request):
+        return True
@@ -0,0 +1,470 @@
+import time
+from collections import defaultdict
+from itertools import product
+
+import numpy as np
+
+from .constants import (
+    CATEGORY_CHOICES, CONDITION_CHOICES, RECOMMEND_CACHE_SECONDS,
+    RECOMMEND_CANDIDATES, RECOMMEND_LIMIT, RECOMMEND_RECENCY_DAYS,
+    RECOMMEND_WEIGHTS
+)
+from .engines import SharedStateEngine, shared_write
+
+
+CATEGORIES = [value for value, _ in CATEGORY_CHOICES]
+CONDITIONS = [value for value, _ in CONDITION_CHOICES]
+FEATURES = CATEGORIES + CONDITIONS
+KEYS = list(product(CATEGORIES, CONDITIONS))
+KEY_INDEX = {key: index for index, key in enumerate(KEYS)}
+# Вектор признаков объявления: категория и состояние в one-hot.
+# Различных векторов всего len(KEYS), поэтому объявление хранит
+# только номер своего вектора.
+KEY_VECTORS = np.zeros((len(KEYS), len(FEATURES)), dtype=np.float32)
+for _index, (_category, _condition) in enumerate(KEYS):
+    KEY_VECTORS[_index, FEATURES.index(_category)] = 1
+    KEY_VECTORS[_index, FEATURES.index(_condition)] = 1
+
+SIGNALS = ('own', 'proposed', 'received', 'accepted', 'rejected')
+SIGNAL_INDEX = {name: index for index, name in enumerate(SIGNALS)}
+WANT_SIGNALS = [SIGNAL_INDEX['proposed'], SIGNAL_INDEX['accepted']]
+
+
+class RecommendationEngine(SharedStateEngine):
+    """Лента "на что можно обменяться" по уже хранимым сигналам.
+
+    Для каждого пользователя копятся векторы признаков объявлений
+    по видам сигналов: свои активные объявления, объявления, на
+    которые он предлагал обмен, его объявления, получившие
+    предложения, стороны принятых обменов и отклоненные им вещи.
+    Профиль - взвешенная сумма этих векторов. Оценка кандидата -
+    близость к профилю, свежесть и встречный интерес владельца
+    к тому, что предлагает пользователь. Все активные объявления
+    хранятся в массивах NumPy и оцениваются одним проходом.
+
+    Массивы строятся из базы при первом обращении и дальше
+    обновляются по событиям: новые объявления дописываются в конец,
+    снятые помечаются и вычищаются при накоплении. После записей
+    других процессов массивы перестраиваются в фоне. Выдача
+    пользователя кэшируется и при следующем запросе дополняется
+    оценками только новых объявлений.
+    """
+
+    state_fields = (
+        'size', 'dead', 'ad_ids', 'owners', 'keys', 'created', 'alive',
+        'positions', 'user_rows', 'row_users', 'signals', 'proposed',
+        'results'
+    )
+
+    def __init__(self, weights=None, recency_days=RECOMMEND_RECENCY_DAYS,
+                 cache_seconds=RECOMMEND_CACHE_SECONDS,
+                 candidates=RECOMMEND_CANDIDATES, name=None):
+        self.weights = {**RECOMMEND_WEIGHTS, **(weights or {})}
+        self.recency_days = recency_days
+        self.recency = recency_days * 24 * 60 * 60
+        self.cache_seconds = cache_seconds
+        self.candidates = candidates
+        super().__init__(name)
+
+    def clear(self):
+        with self.lock:
+            self.size = 0
+            self.dead = 0
+            self.ad_ids = np.zeros(0, dtype=np.int64)
+            self.owners = np.zeros(0, dtype=np.int32)
+            self.keys = np.zeros(0, dtype=np.int8)
+            self.created = np.zeros(0, dtype=np.float64)
+            self.alive = np.zeros(0, dtype=bool)
+            self.positions = {}
+            self.user_rows = {}
+            self.row_users = []
+            self.signals = np.zeros(
+                (0, len(SIGNALS), len(FEATURES)), dtype=np.float32
+            )
+            self.proposed = defaultdict(set)
+            self.results = {}
+
+    def spawn(self):
+        return type(self)(
+            self.weights, self.recency_days, self.cache_seconds,
+            self.candidates
+        )
+
+    def fill(self):
+        """Загрузка объявлений и истории предложений из базы."""
+        from .models import Ad, ExchangeProposal
+
+        with self.lock:
+            self.load_rows(
+                Ad.objects.active().values_list(
+                    'id', 'user_id', 'category', 'condition', 'created_at'
+                ).iterator(),
+                ExchangeProposal.objects.values_list(
+                    'status', 'sender_user_id', 'receiver_user_id',
+                    'ad_receiver_id', 'ad_sender__category',
+                    'ad_sender__condition', 'ad_receiver__category',
+                    'ad_receiver__condition'
+                ).iterator()
+            )
+
+    def load_rows(self, ads, proposals):
+        """Загрузка из строк объявлений и предложений.
+
+        ads - (id, user_id, category, condition, created_at), где
+        created_at - datetime или метка времени; proposals - (status,
+        sender_user_id, receiver_user_id, ad_receiver_id, категория и
+        состояние объявления отправителя, то же для получателя).
+        """
+        with self.lock:
+            self.reset()
+            ad_ids, owners, keys, created = [], [], [], []
+            for ad_id, user_id, category, condition, created_at in ads:
+                ad_ids.append(ad_id)
+                owners.append(self.user_row(user_id))
+                keys.append(KEY_INDEX[(category, condition)])
+                created.append(
+                    created_at if isinstance(created_at, (int, float))
+                    else created_at.timestamp()
+                )
+            self.size = len(ad_ids)
+            self.ad_ids = np.array(ad_ids, dtype=np.int64)
+            self.owners = np.array(owners, dtype=np.int32)
+            self.keys = np.array(keys, dtype=np.int8)
+            self.created = np.array(created, dtype=np.float64)
+            self.alive = np.ones(self.size, dtype=bool)
+            self.positions = dict(zip(ad_ids, range(self.size)))
+            np.add.at(
+                self.signals,
+                (self.owners, SIGNAL_INDEX['own']),
+                KEY_VECTORS[self.keys]
+            )
+
+            rows, kinds, vectors = [], [], []
+            for (status, sender, receiver, ad_receiver_id, sender_category,
+                 sender_condition, receiver_category,
+                 receiver_condition) in proposals:
+                self.proposed[sender].add(ad_receiver_id)
+                sender_key = KEY_INDEX[(sender_category, sender_condition)]
+                receiver_key = KEY_INDEX[
+                    (receiver_category, receiver_condition)
+                ]
+                for row, kind, key in self.proposal_signals(
+                    status, sender, receiver, sender_key, receiver_key
+                ):
+                    rows.append(row)
+                    kinds.append(kind)
+                    vectors.append(key)
+            if rows:
+                np.add.at(
+                    self.signals,
+                    (np.array(rows), np.array(kinds)),
+                    KEY_VECTORS[np.array(vectors)]
+                )
+            self.mark_loaded(self.generation.get())
+
+    def user_row(self, user_id):
+        """Строка пользователя в матрице сигналов, создается по запросу."""
+        row = self.user_rows.get(user_id)
+        if row is None:
+            row = self.user_rows[user_id] = len(self.row_users)
+            self.row_users.append(user_id)
+            if row >= len(self.signals):
+                capacity = max(2 * len(self.signals), 1024)
+                grown = np.zeros(
+                    (capacity,) + self.signals.shape[1:], dtype=np.float32
+                )
+                grown[:len(self.signals)] = self.signals
+                self.signals = grown
+        return row
+
+    def proposal_signals(self, status, sender, receiver, sender_key,
+                         receiver_key):
+        """Сигналы предложения: (строка пользователя, вид, вектор).
+
+        Любое предложение говорит, что отправитель хочет вещь
+        получателя, а у получателя есть востребованная вещь.
+        Принятие добавляет обеим сторонам вещь, на которую они
+        согласились, отклонение - вещь, которая не подошла.
+        """
+        sender_row = self.user_row(sender)
+        receiver_row = self.user_row(receiver)
+        if receiver_key is not None:
+            yield sender_row, SIGNAL_INDEX['proposed'], receiver_key
+            yield receiver_row, SIGNAL_INDEX['received'], receiver_key
+        yield from self.status_signals(
+            status, sender_row, receiver_row, sender_key, receiver_key
+        )
+
+    def status_signals(self, status, sender_row, receiver_row, sender_key,
+                       receiver_key):
+        if status == 'accepted':
+            if receiver_key is not None:
+                yield sender_row, SIGNAL_INDEX['accepted'], receiver_key
+            if sender_key is not None:
+                yield receiver_row, SIGNAL_INDEX['accepted'], sender_key
+        elif status == 'rejected' and sender_key is not None:
+            yield receiver_row, SIGNAL_INDEX['rejected'], sender_key
+
+    def apply_signals(self, signals):
+        for row, kind, key in signals:
+            self.signals[row, kind] += KEY_VECTORS[key]
+
+    def ad_key(self, ad_id):
+        """Номер вектора активного объявления или None."""
+        position = self.positions.get(ad_id)
+        return None if position is None else int(self.keys[position])
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self.results.pop(user_id, None)
+
+    def _append_ad(self, ad_id, user_id, key, created_at):
+        if self.size == len(self.ad_ids):
+            capacity = max(2 * self.size, 1024)
+            for name in ('ad_ids', 'owners', 'keys', 'created', 'alive'):
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                setattr(self, name, grown)
+        row = self.user_row(user_id)
+        position = self.size
+        self.ad_ids[position] = ad_id
+        self.owners[position] = row
+        self.keys[position] = key
+        self.created[position] = created_at
+        self.alive[position] = True
+        self.positions[ad_id] = position
+        self.size += 1
+        self.signals[row, SIGNAL_INDEX['own']] += KEY_VECTORS[key]
+        self.invalidate(user_id)
+
+    def _remove_ad(self, ad_id):
+        position = self.positions.pop(ad_id, None)
+        if position is None:
+            return
+        self.alive[position] = False
+        self.dead += 1
+        row = self.owners[position]
+        self.signals[row, SIGNAL_INDEX['own']] -= (
+            KEY_VECTORS[self.keys[position]]
+        )
+        self.invalidate(self.row_users[row])
+
+    def compact(self):
+        """Удаление снятых объявлений из массивов."""
+        alive = self.alive[:self.size]
+        for name in ('ad_ids', 'owners', 'keys', 'created'):
+            setattr(self, name, getattr(self, name)[:self.size][alive])
+        self.size = len(self.ad_ids)
+        self.alive = np.ones(self.size, dtype=bool)
+        self.positions = dict(zip(self.ad_ids.tolist(), range(self.size)))
+        self.dead = 0
+        # Кэш хранит позиции, до которых досчитана выдача.
+        self.results = {}
+
+    def _compact_if_needed(self):
+        if self.dead > 1024 and self.dead * 2 > self.size:
+            self.compact()
+
+    def update_ad(self, ad_id, user_id, key, created_at, is_active):
+        """Учет создания, изменения или удаления объявления."""
+        self.update_ads([(ad_id, user_id, key, created_at, is_active)])
+
+    @shared_write
+    def update_ads(self, rows):
+        """Учет пачки объявлений: (id, автор, ключ, создано, активность)."""
+        with self.lock:
+            if not self.loaded:
+                return
+            for ad_id, user_id, key, created_at, is_active in rows:
+                position = self.positions.get(ad_id)
+                if position is not None and is_active and (
+                    self.owners[position] == self.user_rows.get(user_id)
+                    and self.keys[position] == KEY_INDEX[key]
+                ):
+                    continue
+                self._remove_ad(ad_id)
+                if is_active:
+                    self._append_ad(
+                        ad_id, user_id, KEY_INDEX[key],
+                        created_at.timestamp()
+                    )
+            self._compact_if_needed()
+
+    @shared_write
+    def deactivate_ads(self, ad_ids):
+        with self.lock:
+            if not self.loaded:
+                return
+            for ad_id in ad_ids:
+                self._remove_ad(ad_id)
+            self._compact_if_needed()
+
+    def update_proposal(self, change, sender_key=None, receiver_key=None):
+        """Учет создания или смены статуса предложения.
+
+        change - словарь как в transition(); previous_status равен
+        None для нового предложения. Ключи объявлений, если не
+        переданы, берутся из массивов активных объявлений.
+        """
+        self.update_proposals([change], sender_key, receiver_key)
+
+    @shared_write
+    def update_proposals(self, changes, sender_key=None,
+                         receiver_key=None):
+        with self.lock:
+            if not self.loaded:
+                return
+            for change in changes:
+                self._update_proposal(change, sender_key, receiver_key)
+
+    def _update_proposal(self, change, sender_key, receiver_key):
+        sender_key = (
+            self.ad_key(change['ad_sender_id']) if sender_key is None
+            else KEY_INDEX[sender_key]
+        )
+        receiver_key = (
+            self.ad_key(change['ad_receiver_id'])
+            if receiver_key is None else KEY_INDEX[receiver_key]
+        )
+        sender, receiver = (
+            change['sender_user_id'], change['receiver_user_id']
+        )
+        if change['previous_status'] is None:
+            self.proposed[sender].add(change['ad_receiver_id'])
+            signals = self.proposal_signals(
+                change['status'], sender, receiver, sender_key,
+                receiver_key
+            )
+        else:
+            signals = self.status_signals(
+                change['status'], self.user_row(sender),
+                self.user_row(receiver), sender_key, receiver_key
+            )
+        self.apply_signals(signals)
+        self.invalidate(sender, receiver)
+
+    def profile(self, row):
+        """Профиль пользователя и вектор его предложения вещей."""
+        if row is None:
+            return (
+                np.zeros(len(FEATURES), dtype=np.float32),
+                np.zeros(len(FEATURES), dtype=np.float32)
+            )
+        weights = np.array(
+            [self.weights[name] for name in SIGNALS], dtype=np.float32
+        )
+        signals = self.signals[row]
+        profile = weights @ signals
+        norm = np.linalg.norm(profile)
+        if norm:
+            profile /= norm
+        offer = signals[SIGNAL_INDEX['own']]
+        norm = np.linalg.norm(offer)
+        return profile, offer / norm if norm else offer
+
+    def scorer(self, user_id, now):
+        """Функция оценки объявлений в диапазоне позиций."""
+        row = self.user_rows.get(user_id)
+        profile, offer = self.profile(row)
+        affinity = KEY_VECTORS @ profile
+        # Встречный интерес: насколько владельцы хотят вещи,
+        # которые предлагает пользователь.
+        wants = self.signals[:len(self.user_rows), WANT_SIGNALS].sum(axis=1)
+        interest = wants @ offer
+        interest /= interest + 1
+        excluded = np.fromiter(
+            (
+                self.positions[ad_id] for ad_id in self.proposed.get(
+                    user_id, ()
+                ) if ad_id in self.positions
+            ),
+            dtype=np.int64
+        )
+        weights = self.weights
+
+        def score(start, stop):
+            owners = self.owners[start:stop]
+            scores = weights['affinity'] * affinity[self.keys[start:stop]]
+            scores += weights['recency'] * np.exp(
+                (self.created[start:stop] - now) / self.recency
+            )
+            scores += weights['interest'] * interest[owners]
+            scores[~self.alive[start:stop]] = -np.inf
+            if row is not None:
+                scores[owners == row] = -np.inf
+            inside = excluded[(excluded >= start) & (excluded < stop)]
+            scores[inside - start] = -np.inf
+            return scores
+
+        return score
+
+    def top(self, scores, start, count):
+        """Лучшие count позиций по убыванию оценки: [(оценка, id)]."""
+        count = min(count, len(scores))
+        if not count:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.isfinite(scores[best])]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return list(zip(
+            scores[best].tolist(), self.ad_ids[best + start].tolist()
+        ))
+
+    def recommend(self, user_id, limit=RECOMMEND_LIMIT):
+        """Рекомендованные объявления: [(id, оценка)] по убыванию.
+
+        Кэш выдачи живет cache_seconds и хранит candidates лучших
+        объявлений. Повторный запрос досчитывает только объявления,
+        добавленные после кэширования, и отбрасывает снятые; полный
+        пересчет нужен, если кэша нет или в нем осталось меньше limit
+        при том, что за его пределами были другие кандидаты.
+        """
+        self.ensure_loaded()
+        now = time.time()
+        count = max(limit, self.candidates)
+        with self.lock:
+            cached = self.results.get(user_id)
+            if cached is not None and now - cached['time'] < (
+                self.cache_seconds
+            ):
+                start = cached['size']
+                # Измененное объявление переносится в конец массивов и
+                # будет оценено заново вместе с новыми.
+                items = [
+                    item for item in cached['items']
+                    if self.positions.get(item[1], start) < start
+                ]
+                complete = cached['complete']
+                if start < self.size:
+                    score = self.scorer(user_id, now)
+                    items += self.top(score(start, self.size), start, count)
+                    items.sort(key=lambda item: -item[0])
+                    complete = complete and len(items) <= count
+                    items = items[:count]
+                if complete or len(items) >= limit:
+                    cached.update(
+                        items=items, size=self.size, complete=complete
+                    )
+                    return [(ad_id, score) for score, ad_id in items[:limit]]
+            score = self.scorer(user_id, now)
+            items = self.top(score(0, self.size), 0, count)
+            self.results[user_id] = {
+                'time': now,
+                'size': self.size,
+                'items': items,
+                # В выдаче все подходящие объявления.
+                'complete': len(items) < count,
+            }
+            return [(ad_id, score) for score, ad_id in items[:limit]]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'ads': len(self.positions),
+                'users': len(self.user_rows),
+                'cached': len(self.results),
+            }
+
+
+recommendation_engine = RecommendationEngine(name='recommendations')
@@ -0,0 +1,63 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON через orjson, если он установлен, иначе через json.
+
+    Даты, Decimal и прочие нестандартные типы кодируются так же, как
+    в DRF, кириллица не экранируется. Отступы, некомпактный вывод и
+    значения, которые orjson не поддерживает, рендерит базовый класс.
+    """
+
+    default = JSONEncoder().default
+
+    def get_orjson_options(self):
+        return (
+            orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_NON_STR_KEYS
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data, default=self.default, option=self.get_orjson_options()
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        return ret.replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class EventStreamRenderer(FastJSONRenderer):
+    """Ответы-ошибки для клиентов потока text/event-stream.
+
+    Сам поток событий отдается StreamingHttpResponse, рендерер нужен,
+    чтобы согласование формата не отвергало заголовок Accept
+    EventSource, а ошибка пришла как событие error.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        payload = super().render(data, None, renderer_context)
+        return b'event: error\ndata: ' + payload + b'\n\n'
@@ -0,0 +1,176 @@
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .constants import (
+    ADS_CACHE_ALIAS, ADS_CACHE_PREFIX, REPLICA_HEALTH_CHECK_INTERVAL,
+    REPLICA_STICKY_SECONDS
+)
+
+
+# Алиас реплики для чтений текущего запроса; None - основная база.
+read_alias = ContextVar('read_alias', default=None)
+
+
+def get_routing_config():
+    config = getattr(settings, 'ADS_DATABASE_ROUTING', {})
+    return {
+        'REPLICAS': [],
+        'STICKY_SECONDS': REPLICA_STICKY_SECONDS,
+        'HEALTH_CHECK_INTERVAL': REPLICA_HEALTH_CHECK_INTERVAL,
+        'CACHE_ALIAS': ADS_CACHE_ALIAS,
+        **config,
+    }
+
+
+class ReplicaSet:
+    """Выбор исправной реплики.
+
+    Реплика проверяется открытием соединения не чаще раза в
+    HEALTH_CHECK_INTERVAL секунд; недоступная исключается до
+    следующей проверки. Если исправных реплик нет, чтения идут в
+    основную базу.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+
+    def reset(self):
+        with self.lock:
+            self.checked = {}
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+            return connection.is_usable()
+        except DatabaseError:
+            return False
+
+    def is_healthy(self, alias, interval):
+        now = time.monotonic()
+        with self.lock:
+            checked = self.checked.get(alias)
+        if checked is not None and now - checked[0] < interval:
+            return checked[1]
+        healthy = self.check(alias)
+        with self.lock:
+            self.checked[alias] = (now, healthy)
+        return healthy
+
+    def choose(self):
+        config = get_routing_config()
+        healthy = [
+            alias for alias in config['REPLICAS']
+            if self.is_healthy(alias, config['HEALTH_CHECK_INTERVAL'])
+        ]
+        return random.choice(healthy) if healthy else None
+
+    def stats(self):
+        with self.lock:
+            return {
+                alias: healthy for alias, (_, healthy) in self.checked.items()
+            }
+
+
+replica_set = ReplicaSet()
+
+
+def sticky_key(user_id):
+    return f'{ADS_CACHE_PREFIX}:primary:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Чтения пользователя идут в основную базу STICKY_SECONDS секунд.
+
+    STICKY_SECONDS - верхняя оценка отставания реплик. Метка хранится
+    в кэше CACHE_ALIAS; если он общий для процессов, пользователь
+    видит свою запись независимо от того, какой процесс его обслужит.
+    Кэш в памяти процесса с репликами отклоняет проверка ads.E001.
+    """
+    config = get_routing_config()
+    if config['REPLICAS'] and config['STICKY_SECONDS']:
+        caches[config['CACHE_ALIAS']].set(
+            sticky_key(user_id), True, config['STICKY_SECONDS']
+        )
+
+
+def replica_cache_timeout(timeout):
+    """Таймаут кэша для данных, прочитанных в текущем запросе.
+
+    Реплика может отставать, поэтому прочитанное из нее кэшируется
+    не дольше STICKY_SECONDS, иначе устаревшая версия пережила бы
+    сброс кэша при записи.
+    """
+    if read_alias.get() is None:
+        return timeout
+    return min(timeout, get_routing_config()['STICKY_SECONDS'])
+
+
+def is_pinned(user_id):
+    config = get_routing_config()
+    return bool(caches[config['CACHE_ALIAS']].get(sticky_key(user_id)))
+
+
+class ReplicaRouter:
+    """Чтения из реплики, выбранной для запроса, запись - в основную.
+
+    Вне view с ReplicaReadMixin read_alias не задан, и все запросы
+    идут в основную базу. Связанные объекты читаются из той же базы,
+    что и объект, через который к ним обращаются.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Реплики получают схему через репликацию, а не миграции."""
+        if db in get_routing_config()['REPLICAS']:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """Чтение GET-запросов view из реплики.
+
+    Реплика выбирается после аутентификации: пользователь, недавно
+    изменявший данные, читает из основной базы (read-your-writes).
+    Для него pinned истинно, и view не отдает ему записи кэша,
+    которые могли быть прочитаны из реплики или до его записи.
+    """
+
+    pinned = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.pinned = False
+        if (
+            request.method not in SAFE_METHODS
+            or not get_routing_config()['REPLICAS']
+        ):
+            return
+        user = request.user
+        if user and user.is_authenticated and is_pinned(user.pk):
+            self.pinned = True
+            return
+        read_alias.set(replica_set.choose())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        read_alias.set(None)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,205 @@
+import re
+
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+from .constants import SEARCH_CONFIG, SEARCH_STEM_MIN
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+REFLEXIVE_ENDINGS = ('ся', 'сь')
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'иях', 'ией', 'ием', 'иям', 'ого', 'его',
+    'ому', 'ему', 'ими', 'ыми', 'ешь', 'ете', 'ить', 'ать', 'ять',
+    'еть', 'уть', 'ишь', 'ите', 'ует', 'ают', 'яют', 'ов', 'ев', 'ей',
+    'ой', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ую', 'юю',
+    'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ию', 'ья', 'ье', 'ьи', 'ью',
+    'ют', 'ут', 'ат', 'ят', 'ет', 'ит', 'ла', 'ли', 'ло', 'ал', 'ял',
+    'ил', 'ел', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+
+
+def stem_russian(word):
+    """Упрощенный стеммер: отбрасывает типичные окончания."""
+    word = word.lower().replace('ё', 'е')
+    for ending in REFLEXIVE_ENDINGS:
+        if word.endswith(ending) and len(word) - 2 >= SEARCH_STEM_MIN:
+            word = word[:-2]
+            break
+    for ending in RUSSIAN_ENDINGS:
+        if (
+            word.endswith(ending)
+            and len(word) - len(ending) >= SEARCH_STEM_MIN
+        ):
+            return word[:-len(ending)]
+    return word
+
+
+class IcontainsSearchBackend:
+    """Поиск через LIKE для баз без полнотекстового индекса."""
+
+    def install(self, schema_editor):
+        """Индекс не требуется."""
+
+    def uninstall(self, schema_editor):
+        """Индекс не требуется."""
+
+    def search(self, queryset, value):
+        return queryset.filter(
+            models.Q(title__icontains=value) |
+            models.Q(description__icontains=value)
+        )
+
+
+class SQLiteSearchBackend:
+    """Поиск через FTS5 с внешним содержимым из таблицы объявлений.
+
+    Индекс поддерживается триггерами, поэтому его обновляют и
+    save(), и bulk_create(), и update(). Русские словоформы
+    приводятся к основе и ищутся префиксным запросом.
+    """
+
+    table = 'ads_ad'
+    fts_table = 'ads_ad_fts'
+
+    def install(self, schema_editor):
+        for statement in self.get_install_sql():
+            schema_editor.execute(statement)
+        schema_editor.execute(
+            f"INSERT INTO {self.fts_table}({self.fts_table}) "
+            f"VALUES ('rebuild')"
+        )
+
+    def uninstall(self, schema_editor):
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(
+                f'DROP TRIGGER IF EXISTS {self.fts_table}_{suffix}'
+            )
+        schema_editor.execute(f'DROP TABLE IF EXISTS {self.fts_table}')
+
+    def get_install_sql(self):
+        insert = (
+            f'INSERT INTO {self.fts_table}(rowid, title, description) '
+            f'VALUES (new.id, new.title, new.description);'
+        )
+        delete = (
+            f'INSERT INTO {self.fts_table}'
+            f'({self.fts_table}, rowid, title, description) '
+            f"VALUES ('delete', old.id, old.title, old.description);"
+        )
+        return [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} '
+            f'USING fts5(title, description, '
+            f"content='{self.table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')",
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ai '
+            f'AFTER INSERT ON {self.table} BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ad '
+            f'AFTER DELETE ON {self.table} BEGIN {delete} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts_table}_au '
+            f'AFTER UPDATE OF title, description ON {self.table} '
+            f'BEGIN {delete} {insert} END',
+        ]
+
+    def build_query(self, value):
+        """Строка MATCH: все основы слов как префиксы."""
+        return ' '.join(
+            f'"{stem_russian(word)}"*' for word in WORD_RE.findall(value)
+        )
+
+    def search(self, queryset, value):
+        query = self.build_query(value)
+        if not query:
+            return queryset
+        matches = RawSQL(
+            f'SELECT rowid FROM {self.fts_table} '
+            f'WHERE {self.fts_table} MATCH %s',
+            (query,)
+        )
+        rank = RawSQL(
+            f'SELECT -bm25({self.fts_table}, 2.0, 1.0) '
+            f'FROM {self.fts_table} WHERE {self.fts_table} MATCH %s '
+            f'AND rowid = {self.table}.id',
+            (query,),
+            output_field=models.FloatField()
+        )
+        return queryset.filter(id__in=matches).annotate(
+            search_rank=rank
+        ).order_by('-search_rank', '-created_at')
+
+
+class PostgresSearchBackend:
+    """Поиск по tsvector с русской морфологией и GIN-индексом.
+
+    Индекс построен по тому же выражению, что и запрос, поэтому
+    поддерживается самой СУБД при любой записи в таблицу.
+    """
+
+    index_name = 'ads_ad_search_gin'
+
+    def get_vector(self):
+        from django.contrib.postgres.search import SearchVector
+
+        return (
+            SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        )
+
+    def get_index(self):
+        from django.contrib.postgres.indexes import GinIndex
+
+        return GinIndex(self.get_vector(), name=self.index_name)
+
+    def install(self, schema_editor):
+        from .models import Ad
+
+        schema_editor.add_index(Ad, self.get_index())
+
+    def uninstall(self, schema_editor):
+        from .models import Ad
+
+        schema_editor.remove_index(Ad, self.get_index())
+
+    def search(self, queryset, value):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        vector = self.get_vector()
+        return queryset.annotate(
+            search_vector=vector,
+            search_rank=SearchRank(vector, query)
+        ).filter(search_vector=query).order_by('-search_rank', '-created_at')
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(alias):
+    """Поисковый бэкенд для базы данных с указанным алиасом."""
+    vendor = connections[alias].vendor
+    return SEARCH_BACKENDS.get(vendor, IcontainsSearchBackend)()
+
+
+def ensure_search_index(using, **kwargs):
+    """Восстанавливает триггеры FTS5 после пересоздания таблицы.
+
+    SQLite при изменении схемы копирует таблицу объявлений, и ее
+    триггеры удаляются вместе со старой таблицей.
+    """
+    backend = get_search_backend(using)
+    if not isinstance(backend, SQLiteSearchBackend):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=%s",
+            (backend.table,)
+        )
+        if cursor.fetchone() is None:
+            return
+        for statement in backend.get_install_sql():
+            cursor.execute(statement)
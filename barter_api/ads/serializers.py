@@ -1,9 +1,18 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework import serializers
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 
-from .constants import DESC_LENGHT_MIN, TITLE_LENGHT_MIN
+from .constants import (
+    BULK_SIZE_MAX, DESC_LENGHT_MIN, MATCH_DEPTH_MAX, RECOMMEND_LIMIT,
+    RECOMMEND_LIMIT_MAX, TITLE_LENGHT_MIN
+)
 from .models import Ad, ExchangeProposal
-from .constants import STATUS_CHOICES
+from .constants import STATUS_CHOICES, STATUS_TRANSITIONS
+from .thumbnails import thumbnail_url
 
 User = get_user_model()
 
@@ -21,15 +30,28 @@ class AdSerializer(serializers.ModelSerializer):
     """Сериализатор для модели объявлений."""
 
     user = UserSerializer(read_only=True)
+    thumbnail_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Ad
         fields = [
             'id', 'user', 'title', 'description', 'image_url',
-            'category', 'condition', 'created_at', 'is_active'
+            'thumbnail_url', 'category', 'condition', 'created_at',
+            'is_active'
         ]
         read_only_fields = ['id', 'user', 'created_at']
 
+    def get_thumbnail_url(self, obj):
+        return thumbnail_url(obj.thumbnail_hash)
+
+    def validate_image_url(self, value):
+        """Изображения загружаются только по http и https."""
+        if value and urlsplit(value).scheme not in ('http', 'https'):
+            raise serializers.ValidationError(
+                "Допустимы только ссылки http и https"
+            )
+        return value
+
     def validate(self, data):
         """Валидация данных объявления."""
         if len(data.get('title', '')) < TITLE_LENGHT_MIN:
@@ -48,18 +70,28 @@ class AdSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class AdBulkDeactivateSerializer(serializers.Serializer):
+    """Сериализатор списка объявлений для массового удаления."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_SIZE_MAX
+    )
+
+
 class ExchangeProposalSerializer(serializers.ModelSerializer):
     """Сериализатор для модели предложений обмена."""
 
     ad_sender = AdSerializer(read_only=True)
     ad_receiver = AdSerializer(read_only=True)
     ad_sender_id = serializers.PrimaryKeyRelatedField(
-        queryset=Ad.objects.filter(is_active=True),
+        queryset=Ad.objects.active().with_related(),
         write_only=True,
         source='ad_sender'
     )
     ad_receiver_id = serializers.PrimaryKeyRelatedField(
-        queryset=Ad.objects.filter(is_active=True),
+        queryset=Ad.objects.active().with_related(),
         write_only=True,
         source='ad_receiver'
     )
@@ -97,6 +129,119 @@ class ExchangeProposalSerializer(serializers.ModelSerializer):
         return data
 
 
+class ValuesSerializer:
+    """Быстрый сериализатор только для чтения строк .values().
+
+    Строит словари напрямую, минуя механизм полей DRF. Вывод должен
+    совпадать байт в байт с соответствующим ModelSerializer.
+    """
+
+    values_fields = ()
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def prepare_queryset(cls, queryset):
+        return queryset.values(*cls.values_fields)
+
+    @classmethod
+    def get_datetime_formatter(cls):
+        """Форматирование дат как в DateTimeField.
+
+        Часовой пояс определяется один раз на весь ответ; нестандартные
+        настройки обрабатывает само поле DRF.
+        """
+        output_format = api_settings.DATETIME_FORMAT
+        if (
+            not settings.USE_TZ
+            or output_format is None
+            or output_format.lower() != ISO_8601
+        ):
+            return cls.datetime_field.to_representation
+        current_timezone = timezone.get_current_timezone()
+
+        def format_datetime(value):
+            if not value or timezone.is_naive(value):
+                return cls.datetime_field.to_representation(value)
+            value = value.astimezone(current_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+
+        return format_datetime
+
+    @property
+    def data(self):
+        self.format_datetime = self.get_datetime_formatter()
+        if self.many:
+            return [self.to_representation(row) for row in self.instance]
+        return self.to_representation(self.instance)
+
+
+class AdReadSerializer(ValuesSerializer):
+    """Быстрый сериализатор объявлений, аналог AdSerializer."""
+
+    ad_fields = (
+        'id', 'user_id', 'user__username', 'user__email', 'title',
+        'description', 'image_url', 'thumbnail_hash', 'category',
+        'condition', 'created_at', 'is_active'
+    )
+    values_fields = ad_fields + ('updated_at',)
+
+    @classmethod
+    def prefixed_fields(cls, prefix):
+        return tuple(f'{prefix}__{field}' for field in cls.ad_fields)
+
+    @staticmethod
+    def represent(row, format_datetime, prefix=''):
+        """Объявление из строки, поля которой начинаются с prefix."""
+        return {
+            'id': row[f'{prefix}id'],
+            'user': {
+                'id': row[f'{prefix}user_id'],
+                'username': row[f'{prefix}user__username'],
+                'email': row[f'{prefix}user__email'],
+            },
+            'title': row[f'{prefix}title'],
+            'description': row[f'{prefix}description'],
+            'image_url': row[f'{prefix}image_url'],
+            'thumbnail_url': thumbnail_url(row[f'{prefix}thumbnail_hash']),
+            'category': row[f'{prefix}category'],
+            'condition': row[f'{prefix}condition'],
+            'created_at': format_datetime(row[f'{prefix}created_at']),
+            'is_active': row[f'{prefix}is_active'],
+        }
+
+    def to_representation(self, row):
+        return self.represent(row, self.format_datetime)
+
+
+class ExchangeProposalReadSerializer(ValuesSerializer):
+    """Быстрый сериализатор предложений, аналог ExchangeProposalSerializer."""
+
+    values_fields = (
+        'id', 'comment', 'status', 'created_at',
+        *AdReadSerializer.prefixed_fields('ad_sender'),
+        *AdReadSerializer.prefixed_fields('ad_receiver'),
+    )
+
+    def to_representation(self, row):
+        represent = AdReadSerializer.represent
+        return {
+            'id': row['id'],
+            'ad_sender': represent(row, self.format_datetime, 'ad_sender__'),
+            'ad_receiver': represent(
+                row, self.format_datetime, 'ad_receiver__'
+            ),
+            'comment': row['comment'],
+            'status': row['status'],
+            'created_at': self.format_datetime(row['created_at']),
+        }
+
+
 class ExchangeProposaUpdatelSerializer(serializers.ModelSerializer):
     """Сериализатор только для обновления статуса."""
 
@@ -105,3 +250,38 @@ class ExchangeProposaUpdatelSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExchangeProposal
         fields = ['status']
+
+    def validate_status(self, value):
+        """Разрешены только переходы из статуса ожидания."""
+        if value not in STATUS_TRANSITIONS['pending']:
+            raise serializers.ValidationError(
+                "Статус можно изменить только на: "
+                f"{', '.join(STATUS_TRANSITIONS['pending'])}"
+            )
+        return value
+
+
+class MatchQuerySerializer(serializers.Serializer):
+    """Параметры подбора обменов."""
+
+    depth = serializers.IntegerField(
+        min_value=2,
+        max_value=MATCH_DEPTH_MAX,
+        default=MATCH_DEPTH_MAX
+    )
+
+
+class RecommendationQuerySerializer(serializers.Serializer):
+    """Параметры ленты рекомендаций."""
+
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=RECOMMEND_LIMIT_MAX,
+        default=RECOMMEND_LIMIT
+    )
+
+
+class SummaryQuerySerializer(serializers.Serializer):
+    """Параметры сводки счетчиков."""
+
+    user = serializers.IntegerField(min_value=1, required=False)
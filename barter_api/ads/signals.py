@@ -0,0 +1,398 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import Signal, receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .cache import ad_cache
+from .counters import CounterDeltas
+from .events import event_hub
+from .matching import matching_engine
+from .models import Ad, ExchangeProposal
+from .recommendations import recommendation_engine
+from .thumbnails import thumbnail_pipeline
+
+
+# Массовые операции обходят post_save, поэтому шлют свои сигналы.
+# ads_bulk_created: ads - созданные объявления.
+# ads_bulk_deactivated: ids - идентификаторы деактивированных объявлений,
+# ads - их строки из AdQuerySet.deactivate().
+# proposal_status_changed: changes - изменения из transition().
+ads_bulk_created = Signal()
+ads_bulk_deactivated = Signal()
+proposal_status_changed = Signal()
+
+
+@receiver(post_save, sender=Ad)
+def invalidate_ad_cache(sender, instance, **kwargs):
+    """Сброс кэша объявления при записи."""
+    ad_cache.invalidate_on_commit(instance.pk)
+
+
+@receiver(ads_bulk_created, sender=Ad)
+def invalidate_ad_cache_bulk_created(sender, ads, **kwargs):
+    """Сброс кэша ленты после массового создания."""
+    ad_cache.invalidate_on_commit()
+
+
+@receiver(ads_bulk_deactivated, sender=Ad)
+def invalidate_ad_cache_bulk_deactivated(sender, ids, **kwargs):
+    """Сброс кэша ленты и карточек после массового удаления."""
+    ad_cache.invalidate_on_commit(*ids)
+
+
+@receiver(post_save, sender=Ad)
+def update_matching_ad(sender, instance, **kwargs):
+    """Обновление предложений вещей в графе обменов."""
+    args = (
+        instance.pk, instance.user_id,
+        (instance.category, instance.condition), instance.is_active
+    )
+    transaction.on_commit(lambda: matching_engine.update_ad(*args))
+
+
+@receiver(post_delete, sender=Ad)
+def remove_matching_ad(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: matching_engine.deactivate_ads([instance.pk])
+    )
+
+
+@receiver(ads_bulk_created, sender=Ad)
+def update_matching_ads_bulk(sender, ads, **kwargs):
+    """Добавление массово созданных объявлений в граф обменов."""
+    rows = [
+        (ad.pk, ad.user_id, (ad.category, ad.condition), ad.is_active)
+        for ad in ads
+    ]
+    transaction.on_commit(lambda: matching_engine.update_ads(rows))
+
+
+@receiver(ads_bulk_deactivated, sender=Ad)
+def deactivate_matching_ads_bulk(sender, ids, **kwargs):
+    transaction.on_commit(lambda: matching_engine.deactivate_ads(ids))
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def update_matching_proposal(sender, instance, **kwargs):
+    """Обновление ребра графа обменов по предложению."""
+    args = (
+        instance.pk,
+        instance.sender_user_id,
+        instance.receiver_user_id,
+        (instance.ad_receiver.category, instance.ad_receiver.condition),
+        instance.status,
+    )
+    transaction.on_commit(lambda: matching_engine.update_proposal(*args))
+
+
+@receiver(post_delete, sender=ExchangeProposal)
+def remove_matching_proposal(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: matching_engine.remove_proposals([instance.pk])
+    )
+
+
+@receiver(proposal_status_changed, sender=ExchangeProposal)
+def remove_matching_proposals(sender, changes, **kwargs):
+    """Удаление из графа предложений, вышедших из ожидания."""
+    pks = [change['id'] for change in changes]
+    transaction.on_commit(lambda: matching_engine.remove_proposals(pks))
+
+
+@receiver(post_save, sender=Ad)
+def update_recommendation_ad(sender, instance, raw=False, **kwargs):
+    """Обновление кандидатов и профиля автора в ленте рекомендаций."""
+    if raw:
+        return
+    args = (
+        instance.pk, instance.user_id,
+        (instance.category, instance.condition), instance.created_at,
+        instance.is_active
+    )
+    transaction.on_commit(lambda: recommendation_engine.update_ad(*args))
+
+
+@receiver(post_delete, sender=Ad)
+def remove_recommendation_ad(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: recommendation_engine.deactivate_ads([instance.pk])
+    )
+
+
+@receiver(ads_bulk_created, sender=Ad)
+def update_recommendation_ads_bulk(sender, ads, **kwargs):
+    """Добавление массово созданных объявлений в ленту рекомендаций."""
+    rows = [
+        (
+            ad.pk, ad.user_id, (ad.category, ad.condition), ad.created_at,
+            ad.is_active
+        )
+        for ad in ads
+    ]
+    transaction.on_commit(lambda: recommendation_engine.update_ads(rows))
+
+
+@receiver(ads_bulk_deactivated, sender=Ad)
+def deactivate_recommendation_ads_bulk(sender, ids, **kwargs):
+    transaction.on_commit(lambda: recommendation_engine.deactivate_ads(ids))
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def update_recommendation_proposal(sender, instance, created=False,
+                                   raw=False, **kwargs):
+    """Сигналы профиля по созданию или смене статуса через save()."""
+    previous = instance.saved_state
+    if raw or not created and (
+        previous is None or previous['status'] == instance.status
+    ):
+        return
+    change = {
+        'ad_sender_id': instance.ad_sender_id,
+        'ad_receiver_id': instance.ad_receiver_id,
+        'sender_user_id': instance.sender_user_id,
+        'receiver_user_id': instance.receiver_user_id,
+        'previous_status': None if created else previous['status'],
+        'status': instance.status,
+    }
+    keys = (
+        (instance.ad_sender.category, instance.ad_sender.condition),
+        (instance.ad_receiver.category, instance.ad_receiver.condition),
+    )
+    transaction.on_commit(
+        lambda: recommendation_engine.update_proposal(change, *keys)
+    )
+
+
+@receiver(proposal_status_changed, sender=ExchangeProposal)
+def update_recommendation_transition(sender, changes, **kwargs):
+    """Сигналы профиля по смене статусов через transition()."""
+    transaction.on_commit(
+        lambda: recommendation_engine.update_proposals(changes)
+    )
+
+
+def publish_proposal_event(proposal_id, ad_sender_id, ad_receiver_id,
+                           status, users, previous_status=None):
+    """Событие предложения для отправителя и получателя после фиксации."""
+    event_type = 'proposal.created' if previous_status is None else (
+        f'proposal.{status}'
+    )
+    data = {
+        'id': proposal_id,
+        'ad_sender': ad_sender_id,
+        'ad_receiver': ad_receiver_id,
+        'status': status,
+        'previous_status': previous_status,
+    }
+    transaction.on_commit(
+        lambda: event_hub.publish(event_type, data, users)
+    )
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def publish_proposal_saved(sender, instance, created=False, raw=False,
+                           **kwargs):
+    """Событие создания предложения или смены статуса через save()."""
+    if raw:
+        return
+    previous = instance.saved_state
+    if not created and (
+        previous is None or previous['status'] == instance.status
+    ):
+        return
+    publish_proposal_event(
+        instance.pk, instance.ad_sender_id, instance.ad_receiver_id,
+        instance.status,
+        (instance.sender_user_id, instance.receiver_user_id),
+        previous_status=None if created else previous['status']
+    )
+
+
+@receiver(proposal_status_changed, sender=ExchangeProposal)
+def publish_proposal_transition(sender, changes, **kwargs):
+    """События смены статуса через transition()."""
+    for change in changes:
+        publish_proposal_event(
+            change['id'], change['ad_sender_id'], change['ad_receiver_id'],
+            change['status'],
+            (change['sender_user_id'], change['receiver_user_id']),
+            previous_status=change['previous_status']
+        )
+
+
+@receiver(pre_save, sender=Ad)
+@receiver(pre_save, sender=ExchangeProposal)
+def load_saved_state(sender, instance, raw=False, using=None,
+                     update_fields=None, **kwargs):
+    """Прежнее состояние изменяемой строки для счетчиков."""
+    instance.saved_state = None
+    if raw or instance._state.adding:
+        return
+    if instance.tracks_update(update_fields):
+        instance.load_saved_state(using)
+    else:
+        instance.saved_state = instance.get_state()
+
+
+@receiver(pre_delete, sender=Ad)
+@receiver(pre_delete, sender=ExchangeProposal)
+def load_deleted_state(sender, instance, using=None, origin=None, **kwargs):
+    """Состояние удаляемой строки.
+
+    Объекты каскада только что загружены из базы, а объект, с которого
+    началось удаление, мог устареть, поэтому он перечитывается.
+    """
+    if origin is instance:
+        instance.load_saved_state(using)
+    else:
+        instance.saved_state = instance.get_state()
+
+
+@receiver(post_save, sender=Ad)
+def update_ad_counters(sender, instance, raw=False, using=None, **kwargs):
+    """Счетчики активных объявлений при создании и изменении."""
+    if raw:
+        return
+    deltas = CounterDeltas()
+    previous = instance.saved_state
+    if previous and previous['is_active']:
+        deltas.add_ad(previous['user_id'], previous['category'], -1)
+    if instance.is_active:
+        deltas.add_ad(instance.user_id, instance.category)
+    deltas.apply(using)
+
+
+@receiver(post_delete, sender=Ad)
+def remove_ad_counters(sender, instance, using=None, **kwargs):
+    previous = instance.saved_state
+    if previous and previous['is_active']:
+        deltas = CounterDeltas()
+        deltas.add_ad(previous['user_id'], previous['category'], -1)
+        deltas.apply(using)
+
+
+@receiver(ads_bulk_created, sender=Ad)
+def update_ad_counters_bulk_created(sender, ads, **kwargs):
+    deltas = CounterDeltas()
+    for ad in ads:
+        if ad.is_active:
+            deltas.add_ad(ad.user_id, ad.category)
+    deltas.apply()
+
+
+@receiver(ads_bulk_deactivated, sender=Ad)
+def update_ad_counters_bulk_deactivated(sender, ads, **kwargs):
+    deltas = CounterDeltas()
+    for ad in ads:
+        deltas.add_ad(ad['user_id'], ad['category'], -1)
+    deltas.apply()
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def update_proposal_counters(sender, instance, raw=False, using=None,
+                             **kwargs):
+    """Счетчики ожидающих предложений при создании и смене статуса."""
+    if raw:
+        return
+    deltas = CounterDeltas()
+    previous = instance.saved_state
+    if previous and previous['status'] == 'pending':
+        deltas.add_proposal(
+            previous['sender_user_id'], previous['receiver_user_id'], -1
+        )
+    if instance.status == 'pending':
+        deltas.add_proposal(
+            instance.sender_user_id, instance.receiver_user_id
+        )
+    deltas.apply(using)
+
+
+@receiver(post_delete, sender=ExchangeProposal)
+def remove_proposal_counters(sender, instance, using=None, **kwargs):
+    previous = instance.saved_state
+    if previous and previous['status'] == 'pending':
+        deltas = CounterDeltas()
+        deltas.add_proposal(
+            previous['sender_user_id'], previous['receiver_user_id'], -1
+        )
+        deltas.apply(using)
+
+
+@receiver(proposal_status_changed, sender=ExchangeProposal)
+def update_proposal_counters_transition(sender, changes, **kwargs):
+    """Счетчики после transition(); вызывается в транзакции смены статуса."""
+    deltas = CounterDeltas()
+    for change in changes:
+        if change['previous_status'] == 'pending':
+            deltas.add_proposal(
+                change['sender_user_id'], change['receiver_user_id'], -1
+            )
+    deltas.apply()
+
+
+def image_url_changed(instance):
+    previous = instance.saved_state
+    return previous is None or previous['image_url'] != instance.image_url
+
+
+@receiver(pre_save, sender=Ad)
+def reset_image_fields(sender, instance, raw=False, **kwargs):
+    """Сброс данных изображения при смене image_url."""
+    if not raw and image_url_changed(instance):
+        for name in sender.image_fields:
+            setattr(instance, name, None)
+
+
+@receiver(post_save, sender=Ad)
+def queue_thumbnail(sender, instance, raw=False, **kwargs):
+    """Постановка нового изображения в очередь миниатюр."""
+    if raw or not instance.image_url or not image_url_changed(instance):
+        return
+    url, ad_id = instance.image_url, instance.pk
+    transaction.on_commit(lambda: thumbnail_pipeline.submit(url, [ad_id]))
+
+
+@receiver(ads_bulk_created, sender=Ad)
+def queue_thumbnails_bulk(sender, ads, **kwargs):
+    urls = defaultdict(list)
+    for ad in ads:
+        if ad.image_url:
+            urls[ad.image_url].append(ad.pk)
+
+    def submit():
+        for url, ad_ids in urls.items():
+            thumbnail_pipeline.submit(url, ad_ids)
+    if urls:
+        transaction.on_commit(submit)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache(sender, instance, **kwargs):
+    """Сброс кэша аутентификации при удалении токена."""
+    token_cache.invalidate_on_commit(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created=False,
+                           update_fields=None, **kwargs):
+    """Сброс кэша аутентификации при изменении пользователя.
+
+    Кэш хранит поля пользователя, поэтому сбрасывается при любом
+    изменении, кроме обновления last_login при входе.
+    """
+    if created or update_fields is not None and (
+        set(update_fields) <= {'last_login'}
+    ):
+        return
+    keys = list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    if keys:
+        token_cache.invalidate_on_commit(*keys)
@@ -1,12 +1,78 @@
+import asyncio
+import json
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from base64 import b64encode
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+from django.test import (
+    AsyncClient, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.status import (
-    HTTP_200_OK, HTTP_201_CREATED,
-    HTTP_403_FORBIDDEN, HTTP_204_NO_CONTENT
+    HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST,
+    HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND,
+    HTTP_204_NO_CONTENT, HTTP_304_NOT_MODIFIED, HTTP_409_CONFLICT,
+    HTTP_429_TOO_MANY_REQUESTS, HTTP_503_SERVICE_UNAVAILABLE
 )
 from rest_framework.test import APIClient
 
-from .models import Ad, ExchangeProposal
+from .benchmark import (
+    InProcessRunner, ScenarioResult, Scenarios,
+    compare_with_baseline, generate_data, results_to_baseline
+)
+from .archive import archive_inactive_ads
+from .authentication import TokenCache, token_cache
+from .cache import ad_cache
+from .checks import check_replica_cache
+from .constants import ARCHIVE_AGE_DAYS
+from .counters import reconcile_counters
+from .events import EventHub, event_hub, stream_events
+from .matching import MatchingEngine, matching_engine
+from .metrics import metrics_registry
+from .middleware import RequestStats
+from .models import (
+    Ad, ArchivedAd, ArchivedExchangeProposal, CategoryCounter,
+    ExchangeProposal, UserCounter
+)
+from .parsers import FastJSONParser
+from .recommendations import recommendation_engine
+from .renderers import FastJSONRenderer
+from .routing import ReplicaRouter, replica_set
+from .throttling import CacheRateStore, LocalRateStore, rate_limiter
+from .thumbnails import (
+    HTTPFetcher, LocalFileFetcher, ThumbnailError, ThumbnailPipeline,
+    thumbnail_pipeline
+)
+from .serializers import (
+    AdReadSerializer, AdSerializer, ExchangeProposalReadSerializer,
+    ExchangeProposalSerializer
+)
+from .urls import get_urlpatterns
+from .views import (
+    AdListCreateView, AdRetrieveUpdateDestroyView, AsyncAdExportView
+)
 
 
 class AdTestCase(TestCase):
@@ -163,3 +229,2441 @@ class ExchangeProposalTestCase(TestCase):
             format='json'
         )
         self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+
+class AdsKeysetPaginationTestCase(TestCase):
+    """Тестирование keyset-пагинации ленты объявлений."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        Ad.objects.bulk_create([
+            Ad(
+                user=self.user,
+                title=f'Объявление {index:02d}',
+                description='Описание объявления для проверки ленты',
+                category='books' if index % 2 else 'home',
+                condition='new'
+            )
+            for index in range(25)
+        ])
+        self.client = APIClient()
+
+    def collect(self, url):
+        """Обход всех страниц по ссылкам next."""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_cursor_pages_cover_feed(self):
+        """Проверка обхода всей ленты без пропусков и повторов."""
+        ids = self.collect('/api/ads/?pagination=cursor&page_size=7')
+        expected = list(
+            Ad.objects.order_by('-created_at', '-id').values_list(
+                'id', flat=True
+            )
+        )
+        self.assertEqual(ids, expected)
+
+    def test_cursor_with_filter_and_ordering(self):
+        """Проверка keyset-режима вместе с фильтром и сортировкой."""
+        ids = self.collect(
+            '/api/ads/?pagination=cursor&page_size=4'
+            '&category=books&ordering=title'
+        )
+        expected = list(
+            Ad.objects.filter(category='books').order_by(
+                'title', 'id'
+            ).values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_cursor_previous_link(self):
+        """Проверка возврата на предыдущую страницу."""
+        first = self.client.get('/api/ads/?pagination=cursor&page_size=5')
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in previous.data['results']],
+            [item['id'] for item in first.data['results']]
+        )
+
+    def test_cursor_empty_previous_page(self):
+        """Проверка пустой страницы при возврате назад."""
+        cursor = b64encode(
+            json.dumps(['2999-01-01T00:00:00+00:00', 0, 1]).encode('utf-8')
+        ).decode('ascii')
+        response = self.client.get(
+            f'/api/ads/?cursor={cursor}&page_size=5'
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+        self.assertIsNone(response.data['previous'])
+        first = self.client.get(response.data['next'])
+        self.assertEqual(first.status_code, HTTP_200_OK)
+        self.assertEqual(len(first.data['results']), 5)
+
+
+class AdSearchTestCase(TestCase):
+    """Тестирование полнотекстового поиска объявлений."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        self.sweater = Ad.objects.create(
+            user=self.user,
+            title="Кофта из шерсти",
+            description="Теплая вязаная кофта, подойдет для зимы",
+            category="clothing",
+            condition="new"
+        )
+        self.headphones = Ad.objects.create(
+            user=self.user,
+            title="Наушники",
+            description="Беспроводные наушники с шумоподавлением",
+            category="electronics",
+            condition="used"
+        )
+        self.case = Ad.objects.create(
+            user=self.user,
+            title="Чехол для телефона",
+            description="Подходит также для хранения наушников",
+            category="electronics",
+            condition="new"
+        )
+        self.client = APIClient()
+
+    def search(self, value):
+        """Идентификаторы найденных объявлений в порядке выдачи."""
+        response = self.client.get('/api/ads/', {'search': value})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_search_word_forms(self):
+        """Проверка поиска по другой словоформе."""
+        self.assertEqual(self.search('шерсть'), [self.sweater.id])
+        self.assertEqual(self.search('кофты'), [self.sweater.id])
+
+    def test_search_ranks_title_first(self):
+        """Проверка ранжирования: совпадение в заголовке выше."""
+        self.assertEqual(
+            self.search('наушников'), [self.headphones.id, self.case.id]
+        )
+
+    def test_search_index_follows_updates(self):
+        """Проверка обновления индекса при изменении объявления."""
+        self.sweater.title = 'Свитер из шерсти'
+        self.sweater.save()
+        self.assertEqual(self.search('свитер'), [self.sweater.id])
+        self.assertEqual(self.search('кофта'), [self.sweater.id])
+        self.sweater.delete()
+        self.assertEqual(self.search('свитер'), [])
+
+
+class AdIndexAdvisorTestCase(TestCase):
+    """Тестирование советника по индексам ленты."""
+
+    def test_feed_queries_use_indexes(self):
+        """Проверка отсутствия полных сканов в планах ленты."""
+        out = StringIO()
+        call_command('explain_ad_queries', '--check', stdout=out)
+        self.assertIn('ad_active_category_idx', out.getvalue())
+        self.assertIn('ad_active_category_title_idx', out.getvalue())
+        self.assertIn('search=', out.getvalue())
+
+    def test_sort_without_index_is_reported(self):
+        """Сортировка без подходящего индекса считается регрессией."""
+        with mock.patch.object(
+            AdListCreateView, 'ordering_fields', ['description']
+        ), self.assertRaisesMessage(
+            CommandError, 'ordering=-description'
+        ):
+            call_command('explain_ad_queries', '--check', stdout=StringIO())
+
+
+class QueryBudgetMixin:
+    """Проверка бюджета SQL-запросов на endpoint."""
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        """Не больше budget запросов внутри блока.
+
+        SAVEPOINT вложенных транзакций не считаются: в TestCase они
+        появляются вместо BEGIN/COMMIT.
+        """
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        queries = [
+            query['sql'] for query in context
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{len(queries)} запросов при бюджете {budget}:\n"
+            + '\n'.join(queries)
+        )
+
+    def assertEndpointQueries(self, budget, url, method='get', **kwargs):
+        """Запрос к endpoint в пределах бюджета."""
+        with self.assertMaxQueries(budget):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Регрессионные тесты числа запросов на endpoint."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='owner', password='qwerty123'
+        )
+        self.own_ads = []
+        for index in range(10):
+            partner = User.objects.create_user(
+                username=f'partner{index}', password='qwerty123'
+            )
+            own_ad = Ad.objects.create(
+                user=self.user,
+                title=f'Мое объявление {index}',
+                description='Описание собственного объявления',
+                category='books',
+                condition='new'
+            )
+            partner_ad = Ad.objects.create(
+                user=partner,
+                title=f'Чужое объявление {index}',
+                description='Описание объявления партнера',
+                category='home',
+                condition='used'
+            )
+            self.own_ads.append(own_ad)
+            if index % 2:
+                ExchangeProposal.objects.create(
+                    ad_sender=own_ad, ad_receiver=partner_ad
+                )
+            else:
+                ExchangeProposal.objects.create(
+                    ad_sender=partner_ad, ad_receiver=own_ad
+                )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_ads_list_budget(self):
+        """Лента: подсчет и страница."""
+        response = self.assertEndpointQueries(2, '/api/ads/')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_ads_cursor_list_budget(self):
+        """Лента в keyset-режиме: одна выборка страницы."""
+        self.assertEndpointQueries(1, '/api/ads/?pagination=cursor')
+
+    def test_ad_detail_budget(self):
+        """Карточка объявления."""
+        self.assertEndpointQueries(1, f'/api/ads/{self.own_ads[0].id}/')
+
+    def test_user_proposals_budget(self):
+        """Предложения пользователя с вложенными объявлениями."""
+        response = self.assertEndpointQueries(2, '/api/my-proposals/')
+        self.assertEqual(len(response.data['results']), 10)
+
+
+class ProposalFeedsTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование входящих, исходящих и общих предложений."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='owner', password='qwerty123'
+        )
+        self.partner = User.objects.create_user(
+            username='partner', password='qwerty123'
+        )
+        own_ads, partner_ads = [
+            [
+                Ad.objects.create(
+                    user=user,
+                    title=f'Объявление {user.username} {index}',
+                    description='Описание объявления для предложений',
+                    category='books',
+                    condition='new'
+                )
+                for index in range(6)
+            ]
+            for user in (self.user, self.partner)
+        ]
+        self.incoming, self.outgoing = [], []
+        for index in range(6):
+            self.outgoing.append(ExchangeProposal.objects.create(
+                ad_sender=own_ads[index], ad_receiver=partner_ads[index],
+                status='rejected' if index % 3 else 'pending'
+            ))
+            self.incoming.append(ExchangeProposal.objects.create(
+                ad_sender=partner_ads[index],
+                ad_receiver=own_ads[(index + 1) % 6]
+            ))
+        self.own = ExchangeProposal.objects.create(
+            ad_sender=own_ads[0], ad_receiver=own_ads[1]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def collect(self, url):
+        """id предложений со всех страниц по ссылкам next."""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def expected(self, *proposals):
+        return [
+            proposal.id for proposal in sorted(
+                set(proposals), key=lambda proposal: (
+                    proposal.created_at, proposal.id
+                ), reverse=True
+            )
+        ]
+
+    def test_denormalized_users(self):
+        """Авторы объявлений сохраняются в предложении."""
+        proposal = ExchangeProposal.objects.get(pk=self.incoming[0].pk)
+        self.assertEqual(proposal.sender_user_id, self.partner.id)
+        self.assertEqual(proposal.receiver_user_id, self.user.id)
+
+    def test_feeds(self):
+        """Входящие и исходящие по отдельности и с фильтром статуса."""
+        self.assertEqual(
+            self.collect('/api/my-proposals/incoming/?page_size=4'),
+            self.expected(*self.incoming, self.own)
+        )
+        self.assertEqual(
+            self.collect('/api/my-proposals/outgoing/?status=pending'),
+            self.expected(*(
+                proposal for proposal in self.outgoing + [self.own]
+                if proposal.status == 'pending'
+            ))
+        )
+
+    def test_merged_keyset(self):
+        """Слияние направлений без пропусков и повторов."""
+        ids = self.collect('/api/my-proposals/?pagination=cursor&page_size=5')
+        self.assertEqual(
+            ids, self.expected(*self.incoming, *self.outgoing, self.own)
+        )
+        response = self.client.get('/api/my-proposals/?page_size=5')
+        self.assertEqual(response.data['count'], 13)
+        first = self.client.get(
+            '/api/my-proposals/?pagination=cursor&page_size=5'
+        )
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(previous.data['results'], first.data['results'])
+
+    def test_feed_query_budget(self):
+        """Один запрос на направление, условие без объявлений."""
+        with self.assertMaxQueries(1) as context:
+            self.client.get('/api/my-proposals/incoming/?status=pending')
+        condition = context[0]['sql'].split('WHERE')[1]
+        self.assertIn('receiver_user_id', condition)
+        self.assertNotIn('ads_ad', condition)
+        self.assertEndpointQueries(
+            2, '/api/my-proposals/?pagination=cursor'
+        )
+
+
+class ReadSerializerContractTestCase(TestCase):
+    """Быстрые сериализаторы совпадают с ModelSerializer байт в байт."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='qwerty123'
+        )
+        self.other = User.objects.create_user(
+            username='другой', password='qwerty123'
+        )
+        self.ad = Ad.objects.create(
+            user=self.user,
+            title='Книга "Мастер и Маргарита"',
+            description='Описание с кавычками " и переносом\nстроки',
+            image_url='https://example.com/книга.png',
+            category='books',
+            condition='new'
+        )
+        self.other_ad = Ad.objects.create(
+            user=self.other,
+            title='Лампа',
+            description='Настольная лампа',
+            category='home',
+            condition='used'
+        )
+        ExchangeProposal.objects.create(
+            ad_sender=self.ad, ad_receiver=self.other_ad, comment='Обмен?'
+        )
+        ExchangeProposal.objects.create(
+            ad_sender=self.other_ad, ad_receiver=self.ad, comment=''
+        )
+        self.renderer = JSONRenderer()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def assertSameBytes(self, fast, slow):
+        self.assertEqual(
+            self.renderer.render(fast.data), self.renderer.render(slow.data)
+        )
+
+    def test_ad_contract(self):
+        """Объявления, в том числе без изображения."""
+        queryset = Ad.objects.with_related().order_by('id')
+        self.assertSameBytes(
+            AdReadSerializer(
+                AdReadSerializer.prepare_queryset(queryset), many=True
+            ),
+            AdSerializer(queryset, many=True)
+        )
+
+    def test_proposal_contract(self):
+        """Предложения с вложенными объявлениями."""
+        queryset = ExchangeProposal.objects.with_related().order_by('id')
+        self.assertSameBytes(
+            ExchangeProposalReadSerializer(
+                ExchangeProposalReadSerializer.prepare_queryset(queryset),
+                many=True
+            ),
+            ExchangeProposalSerializer(queryset, many=True)
+        )
+
+    def test_endpoints_contract(self):
+        """Ответы endpoint совпадают с выводом ModelSerializer."""
+        response = self.client.get(f'/api/ads/{self.ad.id}/')
+        self.assertEqual(
+            response.content,
+            self.renderer.render(AdSerializer(self.ad).data)
+        )
+        response = self.client.get('/api/ads/')
+        self.assertEqual(
+            self.renderer.render(response.data['results']),
+            self.renderer.render(AdSerializer(
+                Ad.objects.order_by('-created_at'), many=True
+            ).data)
+        )
+        response = self.client.get('/api/my-proposals/')
+        self.assertEqual(
+            self.renderer.render(response.data['results']),
+            self.renderer.render(ExchangeProposalSerializer(
+                ExchangeProposal.objects.order_by('-created_at'), many=True
+            ).data)
+        )
+
+
+class FastJSONTestCase(TestCase):
+    """Тесты быстрого JSON-рендерера и парсера."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.data = {
+            'title': 'Книга\u2028о «вещах»',
+            'created_at': datetime(2025, 5, 1, 12, 30, tzinfo=timezone.utc),
+            'price': Decimal('10.5'),
+            'uuid': uuid.UUID(int=1),
+            'items': [1, 2.5, None, True],
+            1: 'ключ-число',
+        }
+
+    def test_same_bytes_as_drf(self):
+        """Вывод совпадает со стандартным JSONRenderer."""
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        self.assertIn('«вещах»'.encode(), expected)
+        with mock.patch('ads.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), expected)
+
+    def test_indent(self):
+        """Запрошенный отступ обрабатывает базовый рендерер."""
+        self.assertEqual(
+            FastJSONRenderer().render(
+                self.data, 'application/json; indent=2'
+            ),
+            JSONRenderer().render(self.data, 'application/json; indent=2')
+        )
+
+    def test_parse(self):
+        """Разбор тела запроса и ошибка на неверном JSON."""
+        body = '{"comment": "Обмен", "ids": [1, 2]}'.encode()
+        expected = {'comment': 'Обмен', 'ids': [1, 2]}
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), expected)
+        with mock.patch('ads.parsers.orjson', None):
+            self.assertEqual(FastJSONParser().parse(BytesIO(body)), expected)
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"comment":'))
+
+
+class AsyncUrls:
+    urlpatterns = [path('api/', include(get_urlpatterns(async_views=True)))]
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls)
+class AsyncViewsTestCase(TestCase):
+    """Async-версии view отвечают так же, как синхронные."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='owner', password='qwerty123'
+        )
+        self.partner = User.objects.create_user(
+            username='partner', password='qwerty123'
+        )
+        self.ads = [
+            Ad.objects.create(
+                user=self.user if index % 2 else self.partner,
+                title=f'Объявление {index}',
+                description='Описание объявления',
+                category='books',
+                condition='new'
+            )
+            for index in range(12)
+        ]
+        self.proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ads[0], ad_receiver=self.ads[1]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    async def get_both(self, url, user=None):
+        """Ответ синхронного и асинхронного view на один запрос."""
+        await sync_to_async(ad_cache.invalidate)(*(ad.id for ad in self.ads))
+        with override_settings(ROOT_URLCONF='barter_api.urls'):
+            expected = await sync_to_async(self.client.get)(url)
+        await sync_to_async(ad_cache.invalidate)(*(ad.id for ad in self.ads))
+        client = AsyncClient()
+        if user is not None:
+            await client.aforce_login(user)
+        return expected, await client.get(url)
+
+    async def test_ads_list(self):
+        """Лента постранично, в keyset-режиме и с фильтрами."""
+        for url in (
+            '/api/ads/?page=2',
+            '/api/ads/?pagination=cursor&ordering=title',
+            '/api/ads/?category=books&search=%D0%BE%D0%B1%D1%8A%D1%8F%D0%B2',
+        ):
+            expected, response = await self.get_both(url)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertEqual(response.content, expected.content)
+        _, response = await self.get_both('/api/ads/?page=100')
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+    async def test_ad_detail(self):
+        """Карточка объявления и 404 для несуществующего."""
+        expected, response = await self.get_both(f'/api/ads/{self.ads[0].id}/')
+        self.assertEqual(response.content, expected.content)
+        _, response = await self.get_both('/api/ads/0/')
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+    async def test_export_streams_asynchronously(self):
+        """Выгрузка через ASGI отдается асинхронным итератором порциями."""
+        admin = await sync_to_async(User.objects.create_superuser)(
+            username='admin', password='qwerty123'
+        )
+        client = AsyncClient()
+        await client.aforce_login(admin)
+        with mock.patch.object(
+            AsyncAdExportView, 'export_chunk_size', 4
+        ), mock.patch(
+            'ads.export.sync_to_async', wraps=sync_to_async
+        ) as wrapped:
+            response = await client.get('/api/ads/export/')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        wrapped.assert_called_once()
+        rows = [
+            json.loads(line)
+            for line in b''.join(chunks).decode('utf-8').splitlines()
+        ]
+        self.assertEqual(
+            [row['id'] for row in rows], [ad.id for ad in self.ads]
+        )
+        self.assertGreater(len(chunks), 1)
+        response = await client.get(
+            '/api/proposals/export/', {'export_format': 'csv'}
+        )
+        content = b''.join(
+            [chunk async for chunk in response.streaming_content]
+        ).decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 2)
+
+    async def test_conditional_get(self):
+        """Async-view отвечают 304 на актуальный ETag."""
+        for url in ('/api/ads/', f'/api/ads/{self.ads[0].id}/'):
+            expected, response = await self.get_both(url)
+            self.assertEqual(response['ETag'], expected['ETag'])
+            await sync_to_async(ad_cache.invalidate)(self.ads[0].id)
+            response = await AsyncClient().get(
+                url, headers={'If-None-Match': response['ETag']}
+            )
+            self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+
+    async def test_user_proposals(self):
+        """Предложения пользователя требуют аутентификации."""
+        expected, response = await self.get_both(
+            '/api/my-proposals/', user=self.user
+        )
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.json()['count'], 1)
+        for url in (
+            '/api/my-proposals/?pagination=cursor',
+            '/api/my-proposals/incoming/',
+        ):
+            expected, response = await self.get_both(url, user=self.user)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(len(response.json()['results']), 1)
+        response = await AsyncClient().get('/api/my-proposals/')
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+
+    async def test_status_update(self):
+        """Запись выполняется синхронным обработчиком в потоке."""
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        url = f'/api/proposals/{self.proposal.id}/'
+        response = await client.patch(
+            url, {'status': 'accepted'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        await self.proposal.arefresh_from_db()
+        self.assertEqual(self.proposal.status, 'accepted')
+        response = await client.patch(
+            url, {'status': 'rejected'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, HTTP_409_CONFLICT)
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls)
+class ProposalEventsTestCase(TestCase):
+    """Тестирование потока событий предложений."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        event_hub.reset()
+        self.sender = User.objects.create_user(
+            username='sender', password='qwerty123'
+        )
+        self.receiver = User.objects.create_user(
+            username='receiver', password='qwerty123'
+        )
+        self.ads = [
+            Ad.objects.create(
+                user=user,
+                title='Объявление для обмена',
+                description='Описание объявления для обмена',
+                category='books',
+                condition='new'
+            )
+            for user in (self.sender, self.receiver, self.sender)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sender)
+
+    def create_proposal(self, ad_sender):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/proposals/', {
+                'ad_sender_id': ad_sender.id,
+                'ad_receiver_id': self.ads[1].id,
+                'comment': 'Меняю',
+            }, format='json')
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        return response.data['id']
+
+    def get_events(self, user):
+        events, _ = event_hub.get_history(user.id, 0)
+        return [(event.type, event.data['id']) for event in events]
+
+    def test_created_and_transition_events(self):
+        """События создания и смены статуса получают обе стороны."""
+        first = self.create_proposal(self.ads[0])
+        second = self.create_proposal(self.ads[2])
+        self.client.force_authenticate(user=self.receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/proposals/{first}/', {'status': 'accepted'},
+                format='json'
+            )
+        expected = [
+            ('proposal.created', first),
+            ('proposal.created', second),
+            ('proposal.accepted', first),
+            ('proposal.rejected', second),
+        ]
+        self.assertCountEqual(self.get_events(self.sender), expected)
+        self.assertCountEqual(self.get_events(self.receiver), expected)
+
+    def test_no_events_on_rollback(self):
+        """Без фиксации транзакции события не публикуются."""
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post('/api/proposals/', {
+                'ad_sender_id': self.ads[0].id,
+                'ad_receiver_id': self.ads[1].id,
+            }, format='json')
+        self.assertEqual(self.get_events(self.receiver), [])
+
+    async def read_chunks(self, stream, count):
+        return [
+            (chunk if isinstance(chunk, str) else chunk.decode('utf-8'))
+            for chunk in [await anext(stream) for _ in range(count)]
+        ]
+
+    async def test_stream_resumes_from_last_event_id(self):
+        """Пропущенные события, затем новые; отключение снимает подписку."""
+        old = event_hub.publish(
+            'proposal.created', {'id': 1}, [self.sender.id]
+        )
+        missed = event_hub.publish(
+            'proposal.accepted', {'id': 1}, [self.sender.id]
+        )
+        client = AsyncClient()
+        await client.aforce_login(self.sender)
+        response = await client.get(
+            '/api/events/proposals/',
+            headers={
+                'Accept': 'text/event-stream', 'Last-Event-ID': str(old.id)
+            }
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith(
+            'text/event-stream'
+        ))
+        stream = aiter(response.streaming_content)
+        retry, event = await self.read_chunks(stream, 2)
+        self.assertTrue(retry.startswith('retry: '))
+        self.assertIn(f'id: {missed.id}\nevent: proposal.accepted', event)
+        live = await sync_to_async(event_hub.publish)(
+            'proposal.rejected', {'id': 2}, [self.sender.id]
+        )
+        [event] = await self.read_chunks(stream, 1)
+        self.assertIn(f'id: {live.id}\nevent: proposal.rejected', event)
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(event_hub.subscriber_count(), 0)
+
+    async def test_stream_resync_and_keepalive(self):
+        """Вытесненная история дает resync, тишина - keepalive."""
+        hub = EventHub(history=1)
+        first = hub.publish('proposal.created', {'id': 1}, [1])
+        hub.publish('proposal.created', {'id': 2}, [1])
+        hub.publish('proposal.created', {'id': 3}, [1])
+        stream = stream_events(1, first.id, hub=hub, heartbeat=0.01)
+        chunks = [await anext(stream) for _ in range(4)]
+        await stream.aclose()
+        self.assertEqual(chunks[1], 'event: resync\ndata: {}\n\n')
+        self.assertIn('"id": 3', chunks[2])
+        self.assertEqual(chunks[3], ': keepalive\n\n')
+
+    async def test_history_pruned_after_unsubscribe(self):
+        """История без подписчиков удаляется по истечении ttl."""
+        hub = EventHub(ttl=60)
+        old = hub.publish('proposal.created', {'id': 1}, [1, 2])
+        subscription = hub.subscribe(1)
+        backend = hub.backend
+        later = time.monotonic() + 61
+        backend.prune(later)
+        self.assertEqual(set(backend.history), {1})
+        hub.unsubscribe(subscription)
+        backend.prune(later)
+        self.assertEqual(
+            (backend.history, backend.evicted, backend.touched),
+            ({}, {}, {})
+        )
+        self.assertEqual(hub.get_history(1, 0), ([], False))
+        self.assertEqual(hub.get_history(1, old.id), ([], True))
+        new = hub.publish('proposal.created', {'id': 2}, [2])
+        self.assertEqual(hub.get_history(2, 0), ([new], False))
+        self.assertEqual(hub.get_history(2, old.id), ([new], True))
+
+    async def test_stream_requires_authentication(self):
+        """Без аутентификации поток не открывается."""
+        response = await AsyncClient().get(
+            '/api/events/proposals/', headers={'Accept': 'text/event-stream'}
+        )
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+        self.assertTrue(response.content.startswith(b'event: error'))
+
+
+class TokenCacheTestCase(TestCase):
+    """Тестирование кэша аутентификации по токену."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        token_cache.reset()
+        self.user = User.objects.create_user(
+            username='tokenuser', password='qwerty123'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_queries(self):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+            response = self.client.get('/api/my-proposals/')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return len(context)
+
+    def test_cached_token_skips_lookup(self):
+        """Повторный запрос с токеном обходится без запроса токена."""
+        self.assertEqual(self.get_queries() - self.get_queries(), 1)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_token_deletion_invalidates(self):
+        """Удаленный токен перестает действовать сразу."""
+        self.get_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        response = self.client.get('/api/my-proposals/')
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivation_invalidates(self):
+        """Токен деактивированного пользователя перестает действовать."""
+        self.get_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response = self.client.get('/api/my-proposals/')
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+
+    def test_invalidation_during_read(self):
+        """Сброс во время чтения из базы не оставляет старую запись."""
+        for cache in (TokenCache(), TokenCache(shared_alias='default')):
+            user, version = cache.lookup(self.token.key)
+            self.assertIsNone(user)
+            cache.invalidate(self.token.key)
+            cache.set(self.token.key, self.user, version)
+            self.assertIsNone(cache.get(self.token.key))
+
+    def test_local_tier_bounds(self):
+        """LRU вытесняет давние записи, записи истекают по таймауту."""
+        cache = TokenCache(max_size=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, self.user)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), self.user)
+        expired = TokenCache(local_timeout=-1)
+        expired.set('a', self.user)
+        self.assertIsNone(expired.get('a'))
+
+    def test_shared_tier(self):
+        """Общий кэш отдает пользователя после сброса первого уровня."""
+        cache = TokenCache(shared_alias='default')
+        cache.set(self.token.key, self.user)
+        cache.reset()
+        self.assertEqual(cache.get(self.token.key), self.user)
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+        cache.invalidate(self.token.key)
+        cache.reset()
+        self.assertIsNone(cache.get(self.token.key))
+
+    def test_password_hash_not_cached(self):
+        """Хэш пароля не попадает ни в один уровень кэша."""
+        cache = TokenCache(shared_alias='default')
+        cache.set(self.token.key, self.user)
+        version = cache.get_version(self.token.key)
+        [(_, _, local)] = cache.entries.values()
+        shared = cache.shared.get(
+            f'{cache.shared_key(self.token.key)}:{version}'
+        )
+        for data in (local, shared):
+            self.assertNotIn(self.user.password, repr(data))
+        user = cache.get(self.token.key)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertTrue(user.check_password('qwerty123'))
+
+    def test_each_hit_gets_own_user(self):
+        """Попадание в кэш отдает новый объект пользователя."""
+        token_cache.set(self.token.key, self.user)
+        first = token_cache.get(self.token.key)
+        first.first_name = 'Изменено'
+        second = token_cache.get(self.token.key)
+        self.assertIsNot(first, second)
+        self.assertEqual(second, self.user)
+        self.assertEqual(second.first_name, '')
+        self.assertFalse(second._state.adding)
+
+    def test_invalidation_reaches_other_processes(self):
+        """Сброс в одном процессе снимает запись первого уровня в другом."""
+        first = TokenCache(shared_alias='default')
+        second = TokenCache(shared_alias='default')
+        first.set(self.token.key, self.user)
+        self.assertEqual(first.get(self.token.key), self.user)
+        self.assertEqual(first.stats()['hits'], 1)
+        second.invalidate(self.token.key)
+        self.assertIsNone(first.get(self.token.key))
+
+
+def throttle_rates(**rates):
+    """Настройки DRF с заданными лимитами вместо стандартных."""
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates
+    })
+
+
+class ThrottlingTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование лимитов запросов и допуска записей."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        rate_limiter.reset()
+        self.users = [
+            User.objects.create_user(
+                username=f'user{index}', password='qwerty123'
+            )
+            for index in range(2)
+        ]
+        self.ads = [
+            Ad.objects.create(
+                user=user,
+                title=f'Вещь пользователя {index}',
+                description='Описание вещи для проверки лимитов',
+                category='books',
+                condition='used'
+            )
+            for index, user in enumerate(self.users)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def propose(self):
+        return self.client.post('/api/proposals/', {
+            'ad_sender_id': self.ads[0].id,
+            'ad_receiver_id': self.ads[1].id,
+        }, format='json')
+
+    @throttle_rates(proposals='2/min')
+    def test_proposal_budget_sheds_before_db(self):
+        """Запрос сверх лимита получает 429 без обращения к базе."""
+        self.assertEqual(self.propose().status_code, HTTP_201_CREATED)
+        self.assertEqual(self.propose().status_code, HTTP_400_BAD_REQUEST)
+        with self.assertMaxQueries(0):
+            response = self.propose()
+        self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.client.get('/api/ads/').status_code, 200)
+
+    def update_ad(self):
+        ad = self.ads[0]
+        return self.client.patch(f'/api/ads/{ad.id}/', {
+            'title': ad.title,
+            'description': ad.description,
+            'condition': 'new',
+        }, format='json')
+
+    @throttle_rates(proposals='1/min', writes='2/min')
+    def test_budgets_per_endpoint_and_user(self):
+        """Лимиты считаются по endpoint и по пользователю.
+
+        Запрос, отклоненный лимитом endpoint, не расходует общий.
+        """
+        self.propose()
+        self.assertEqual(
+            self.propose().status_code, HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(self.update_ad().status_code, HTTP_200_OK)
+        self.assertEqual(
+            self.update_ad().status_code, HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.client.force_authenticate(user=self.users[1])
+        response = self.client.post('/api/proposals/', {
+            'ad_sender_id': self.ads[1].id,
+            'ad_receiver_id': self.ads[0].id,
+        }, format='json')
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+
+    @throttle_rates(ads='1/min', ads_bulk_deactivate='1/min')
+    def test_update_and_bulk_deactivate_scopes(self):
+        """Изменение объявления и массовое удаление имеют свои лимиты."""
+        self.assertEqual(self.update_ad().status_code, HTTP_200_OK)
+        self.assertEqual(
+            self.update_ad().status_code, HTTP_429_TOO_MANY_REQUESTS
+        )
+        for status in (HTTP_200_OK, HTTP_429_TOO_MANY_REQUESTS):
+            response = self.client.post(
+                '/api/ads/bulk-deactivate/', {'ids': [self.ads[0].id]},
+                format='json'
+            )
+            self.assertEqual(response.status_code, status)
+
+    def test_rate_stores(self):
+        """Token bucket пополняется со временем, окно - по границе."""
+        store = LocalRateStore()
+        with mock.patch('ads.throttling.time.monotonic', return_value=0):
+            self.assertEqual(store.acquire('key', 2, 60), (0, 'key'))
+            self.assertEqual(store.acquire('key', 2, 60)[0], 0)
+            self.assertEqual(store.acquire('key', 2, 60)[0], 30)
+        with mock.patch('ads.throttling.time.monotonic', return_value=30):
+            _, ticket = store.acquire('key', 2, 60)
+            store.release(ticket, 2, 60)
+            self.assertEqual(store.acquire('key', 2, 60)[0], 0)
+        store = CacheRateStore()
+        key = f'test-{uuid.uuid4()}'
+        with mock.patch('ads.throttling.time.time', return_value=6000):
+            self.assertEqual(store.acquire(key, 2, 60)[0], 0)
+            self.assertEqual(store.acquire(key, 2, 60)[0], 0)
+            self.assertEqual(store.acquire(key, 2, 60)[0], 60)
+        with mock.patch('ads.throttling.time.time', return_value=6105):
+            self.assertEqual(store.acquire(key, 2, 60)[0], 0)
+            self.assertEqual(store.acquire(key, 2, 60)[0], 15)
+
+    def test_cache_store_release(self):
+        """Возврат идет в окно инкремента и не падает без счетчика."""
+        store = CacheRateStore()
+        key = f'test-{uuid.uuid4()}'
+        with mock.patch('ads.throttling.time.time', return_value=6000):
+            _, ticket = store.acquire(key, 1, 60)
+        with mock.patch('ads.throttling.time.time', return_value=6060):
+            self.assertEqual(store.acquire(key, 1, 60)[0], 60)
+            store.release(ticket, 1, 60)
+            self.assertEqual(store.acquire(key, 1, 60)[0], 0)
+        caches['default'].delete(ticket)
+        store.release(ticket, 1, 60)
+        with mock.patch.object(
+            caches['default'], 'decr', side_effect=ValueError
+        ), mock.patch('ads.throttling.time.time', return_value=6060):
+            self.assertEqual(store.acquire(key, 1, 60)[0], 60)
+
+    @override_settings(ADS_THROTTLING={'WRITE_CONCURRENCY': 0})
+    def test_write_admission(self):
+        """Записи сверх лимита одновременных запросов получают 503."""
+        with self.assertMaxQueries(0):
+            response = self.propose()
+        self.assertEqual(response.status_code, HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.client.get('/api/ads/').status_code, 200)
+
+
+@override_settings(ADS_DATABASE_ROUTING={
+    'REPLICAS': ['replica1'], 'STICKY_SECONDS': 5
+})
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """Тестирование чтения из реплик."""
+
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        replica_set.reset()
+        ad_cache.invalidate()
+        self.user = User.objects.create_user(
+            username='replicauser', password='qwerty123'
+        )
+        self.ad = Ad.objects.create(
+            user=self.user,
+            title='Вещь для проверки реплик',
+            description='Описание вещи для проверки чтения из реплик',
+            category='books',
+            condition='used'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_queries(self, url):
+        """Число запросов к основной базе и к реплике."""
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica1']) as replica:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_replica(self):
+        """GET ленты, карточки и предложений читает из реплики."""
+        for url in (
+            '/api/ads/', f'/api/ads/{self.ad.id}/', '/api/my-proposals/'
+        ):
+            primary, replica = self.get_queries(url)
+            self.assertEqual(primary, 0)
+            self.assertGreater(replica, 0)
+        primary, replica = self.get_queries('/api/summary/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_read_your_writes(self):
+        """После записи пользователь читает из основной базы."""
+        response = self.client.patch(f'/api/ads/{self.ad.id}/', {
+            'title': self.ad.title,
+            'description': self.ad.description,
+            'condition': 'new',
+        }, format='json')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        primary, replica = self.get_queries('/api/my-proposals/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.client.force_authenticate(user=None)
+        primary, replica = self.get_queries('/api/ads/')
+        self.assertGreater(replica, 0)
+
+    def test_pinned_user_bypasses_cache(self):
+        """После записи пользователь не получает старую запись кэша."""
+        url = f'/api/ads/{self.ad.id}/'
+        self.client.get(url)
+        entry = ad_cache.get(ad_cache.detail_key(self.ad.id))
+        response = self.client.patch(url, {
+            'title': 'Новое название вещи',
+            'description': self.ad.description,
+        }, format='json')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        # Карточка, закэшированная из отстающей реплики.
+        ad_cache.set(ad_cache.detail_key(self.ad.id), entry)
+        self.assertEqual(
+            self.client.get(url).data['title'], 'Новое название вещи'
+        )
+
+    def test_unhealthy_replica_falls_back(self):
+        """Недоступная реплика исключается до следующей проверки."""
+        with mock.patch.object(replica_set, 'check', return_value=False):
+            primary, replica = self.get_queries('/api/my-proposals/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.assertEqual(replica_set.stats(), {'replica1': False})
+
+    def test_shared_cache_required(self):
+        """С репликами метка не может храниться в кэше процесса."""
+        self.assertEqual(
+            [error.id for error in check_replica_cache(None)], ['ads.E001']
+        )
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.gettempdir(),
+        }}):
+            self.assertEqual(check_replica_cache(None), [])
+        with override_settings(ADS_DATABASE_ROUTING={'REPLICAS': []}):
+            self.assertEqual(check_replica_cache(None), [])
+
+    def test_router(self):
+        """Запись и миграции только в основную базу."""
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_write(Ad), 'default')
+        self.assertIsNone(router.db_for_read(Ad))
+        self.assertFalse(router.allow_migrate('replica1', 'ads'))
+        self.assertIsNone(router.allow_migrate('default', 'ads'))
+
+
+class AdCacheTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование кэша ленты и карточек объявлений."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        self.ad = Ad.objects.create(
+            user=self.user,
+            title="Кофта из шерсти",
+            description="Не ношеная кофта из шерсти",
+            category="clothing",
+            condition="new"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        ad_cache.reset_stats()
+
+    def test_detail_served_from_cache(self):
+        """Повторный запрос карточки не обращается к базе."""
+        url = f'/api/ads/{self.ad.id}/'
+        self.client.get(url)
+        with self.assertMaxQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['title'], self.ad.title)
+        self.assertEqual(ad_cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_list_keyed_by_filters(self):
+        """Страницы с разными фильтрами кэшируются раздельно."""
+        self.client.get('/api/ads/', {'category': 'clothing'})
+        response = self.client.get('/api/ads/', {'category': 'books'})
+        self.assertEqual(response.data['count'], 0)
+        with self.assertMaxQueries(0):
+            response = self.client.get('/api/ads/', {'category': 'clothing'})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_update_invalidates_cache(self):
+        """Изменение и удаление объявления сбрасывают кэш."""
+        url = f'/api/ads/{self.ad.id}/'
+        self.client.get(url)
+        self.client.get('/api/ads/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {
+                'title': 'Свитер из шерсти',
+                'description': self.ad.description,
+            }, format='json')
+        self.assertEqual(
+            self.client.get(url).data['title'], 'Свитер из шерсти'
+        )
+        self.assertEqual(
+            self.client.get('/api/ads/').data['results'][0]['title'],
+            'Свитер из шерсти'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+        self.assertEqual(self.client.get('/api/ads/').data['count'], 0)
+        self.assertFalse(self.client.get(url).data['is_active'])
+
+    def test_invalidation_during_read(self):
+        """Сброс во время чтения из базы не оставляет старую запись."""
+        url = f'/api/ads/{self.ad.id}/'
+        read = AdRetrieveUpdateDestroyView.get_object_or_archived
+
+        def read_then_invalidate(view):
+            instance = read(view)
+            ad_cache.invalidate(self.ad.id)
+            return instance
+
+        with mock.patch.object(
+            AdRetrieveUpdateDestroyView, 'get_object_or_archived',
+            read_then_invalidate
+        ):
+            self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(ad_cache.stats(), {'hits': 0, 'misses': 2})
+
+
+class AdFacetsTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование счетчиков фасетов ленты."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        self.ads = [
+            Ad.objects.create(
+                user=self.user,
+                title=f'Объявление {index}',
+                description='Описание объявления для теста',
+                category=category,
+                condition=condition
+            )
+            for index, (category, condition) in enumerate([
+                ('books', 'new'), ('books', 'used'), ('books', 'used'),
+                ('clothing', 'used'), ('home', 'broken'),
+            ])
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        ad_cache.invalidate()
+
+    def test_facets_under_filters(self):
+        """Фасет не учитывает свой фильтр, но учитывает остальные."""
+        response = self.client.get('/api/ads/', {
+            'facets': 'true', 'category': 'books', 'condition': 'used',
+        })
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['facets'], {
+            'category': {
+                'electronics': 0, 'clothing': 1, 'books': 2,
+                'home': 0, 'other': 0,
+            },
+            'condition': {'new': 1, 'used': 2, 'broken': 0},
+        })
+        response = self.client.get('/api/ads/', {
+            'facets': 'true', 'search': 'Описание', 'user': self.user.id,
+        })
+        self.assertEqual(
+            response.data['facets']['condition'],
+            {'new': 1, 'used': 3, 'broken': 1}
+        )
+        self.assertNotIn('facets', self.client.get('/api/ads/').data)
+
+    def test_facets_skip_unknown_values(self):
+        """Значение вне choices не ломает подсчет фасетов."""
+        Ad.objects.filter(id=self.ads[0].id).update(condition='legacy')
+        response = self.client.get('/api/ads/', {'facets': 'true'})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotIn('legacy', response.data['facets']['condition'])
+
+    def test_facets_one_query_and_cached(self):
+        """Фасеты считаются одним запросом и общие для страниц."""
+        params = {'facets': 'true', 'page_size': 2}
+        with self.assertMaxQueries(3):
+            self.client.get('/api/ads/', params)
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/ads/', {**params, 'page': 2})
+        self.assertEqual(response.data['facets']['category']['books'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/ads/{self.ads[0].id}/')
+        response = self.client.get('/api/ads/', params)
+        self.assertEqual(response.data['facets']['category']['books'], 2)
+
+
+class ConditionalGetTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование условных GET карточки и ленты."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        self.ads = [
+            Ad.objects.create(
+                user=self.user,
+                title=f'Объявление {index}',
+                description='Описание объявления для теста',
+                category='books',
+                condition='new'
+            )
+            for index in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        ad_cache.invalidate(*(ad.id for ad in self.ads))
+
+    def test_detail_validators(self):
+        """Карточка отдает ETag и Last-Modified и отвечает 304."""
+        url = f'/api/ads/{self.ads[0].id}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': etag},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+
+    def test_not_modified_without_serialization(self):
+        """304 при промахе кэша отдается до сериализации."""
+        url = f'/api/ads/{self.ads[0].id}/'
+        etag = self.client.get(url)['ETag']
+        page_etag = self.client.get('/api/ads/')['ETag']
+        ad_cache.invalidate(self.ads[0].id)
+        with mock.patch.object(
+            AdReadSerializer, 'represent', side_effect=AssertionError
+        ):
+            with self.assertMaxQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+            with self.assertMaxQueries(2):
+                response = self.client.get(
+                    '/api/ads/', HTTP_IF_NONE_MATCH=page_etag
+                )
+            self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+
+    def test_update_changes_etag(self):
+        """После изменения объявления старый ETag не подходит."""
+        url = f'/api/ads/{self.ads[0].id}/'
+        etag = self.client.get(url)['ETag']
+        page_etag = self.client.get('/api/ads/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {
+                'title': 'Новое название',
+                'description': 'Описание объявления для теста',
+            }, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get('/api/ads/', HTTP_IF_NONE_MATCH=page_etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], page_etag)
+
+    def test_list_etag_follows_page(self):
+        """ETag страницы меняется при деактивации и не зависит от кэша."""
+        for url in ('/api/ads/', '/api/ads/?pagination=cursor&page_size=2'):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url)['ETag'], etag)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+        etag = self.client.get('/api/ads/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/ads/bulk-deactivate/',
+                {'ids': [self.ads[1].id]}, format='json'
+            )
+        response = self.client.get('/api/ads/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
+
+class ArchiveTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование переноса неактивных объявлений в архив."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        self.partner = User.objects.create_user(
+            username='user2', password='qwerty123'
+        )
+        self.ads = [
+            Ad.objects.create(
+                user=self.user,
+                title=f'Объявление {index}',
+                description='Описание объявления для архива',
+                category='books',
+                condition='used'
+            )
+            for index in range(5)
+        ]
+        self.partner_ad = Ad.objects.create(
+            user=self.partner,
+            title='Объявление партнера',
+            description='Описание объявления партнера',
+            category='home',
+            condition='new'
+        )
+        self.accepted = ExchangeProposal.objects.create(
+            ad_sender=self.partner_ad, ad_receiver=self.ads[0],
+            status='accepted'
+        )
+        self.pending = ExchangeProposal.objects.create(
+            ad_sender=self.partner_ad, ad_receiver=self.ads[1]
+        )
+        for ad in self.ads[:4]:
+            ad.delete()
+        Ad.objects.filter(id__in=[ad.id for ad in self.ads[:3]]).update(
+            updated_at=datetime.now(timezone.utc) - timedelta(
+                days=ARCHIVE_AGE_DAYS + 1
+            )
+        )
+        self.client = APIClient()
+        ad_cache.invalidate(*(ad.id for ad in self.ads))
+
+    def test_archive_moves_old_inactive_ads(self):
+        """Старые неактивные объявления переносятся с предложениями."""
+        batches = list(archive_inactive_ads(batch_size=1))
+        self.assertEqual(batches, [(1, 1), (1, 0)])
+        archived = {self.ads[0].id, self.ads[2].id}
+        self.assertEqual(
+            set(ArchivedAd.objects.values_list('id', flat=True)), archived
+        )
+        self.assertFalse(Ad.objects.filter(id__in=archived).exists())
+        self.assertEqual(
+            list(ArchivedExchangeProposal.objects.values_list(
+                'id', 'status'
+            )),
+            [(self.accepted.id, 'accepted')]
+        )
+        self.assertTrue(
+            ExchangeProposal.objects.filter(id=self.pending.id).exists()
+        )
+        self.assertEqual(Ad.objects.count(), 4)
+        self.assertEqual(reconcile_counters(dry_run=True), [])
+
+    def test_detail_falls_back_to_archive(self):
+        """Карточка архивного объявления не отличается от прежней."""
+        url = f'/api/ads/{self.ads[0].id}/'
+        expected = self.client.get(url)
+        list(archive_inactive_ads())
+        ad_cache.invalidate(self.ads[0].id)
+        with self.assertMaxQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+        self.client.force_authenticate(user=self.user)
+        response = self.client.patch(url, {'title': 'Новое название'})
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/ads/0/')
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+    def test_command(self):
+        """Команда печатает итог и поддерживает пробный запуск."""
+        out = StringIO()
+        call_command('archive_ads', '--dry-run', stdout=out)
+        self.assertIn('К переносу: 2', out.getvalue())
+        self.assertEqual(ArchivedAd.objects.count(), 0)
+        call_command(
+            'archive_ads', '--older-than-days', '0', stdout=out
+        )
+        self.assertIn('Перенесено объявлений: 3, предложений: 1', (
+            out.getvalue()
+        ))
+
+
+class ThumbnailTestCase(TestCase):
+    """Тестирование построения миниатюр изображений объявлений."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        images = self.root / 'images'
+        images.mkdir()
+        Image.new('RGB', (800, 600), 'red').save(images / 'photo.png')
+        (images / 'broken.png').write_bytes(b'not an image')
+        settings = override_settings(ADS_THUMBNAILS={
+            'FETCHER': 'ads.thumbnails.LocalFileFetcher',
+            'FETCHER_OPTIONS': {'root': self.root},
+            'ROOT': self.root / 'thumbnails',
+            'URL': '/media/thumbnails/',
+            'SIZE': (100, 100),
+            'WORKERS': 0,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        thumbnail_pipeline.reset()
+        self.addCleanup(thumbnail_pipeline.reset)
+        self.user = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_ad(self, image_url):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/ads/', {
+                'title': 'Объявление с фото',
+                'description': 'Описание объявления с фотографией',
+                'image_url': image_url,
+                'category': 'books',
+                'condition': 'new',
+            }, format='json')
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        return Ad.objects.get(pk=response.data['id'])
+
+    def test_thumbnail_created(self):
+        """Миниатюра строится, размеры и хэши записываются в объявление."""
+        ad = self.create_ad('https://example.com/images/photo.png')
+        self.assertEqual(ad.image_status, 'ready')
+        self.assertEqual((ad.image_width, ad.image_height), (800, 600))
+        self.assertEqual(len(ad.image_hash), 64)
+        relative = f'{ad.thumbnail_hash[:2]}/{ad.thumbnail_hash}.jpg'
+        with Image.open(self.root / 'thumbnails' / relative) as thumbnail:
+            self.assertEqual(thumbnail.size, (100, 75))
+        response = self.client.get(f'/api/ads/{ad.id}/')
+        self.assertEqual(
+            response.data['thumbnail_url'], f'/media/thumbnails/{relative}'
+        )
+
+    def test_popular_image_fetched_once(self):
+        """Повторный URL берется из результатов, а не загружается снова."""
+        with mock.patch.object(
+            LocalFileFetcher, 'fetch', autospec=True,
+            side_effect=LocalFileFetcher.fetch
+        ) as fetch:
+            first = self.create_ad('https://example.com/images/photo.png')
+            second = self.create_ad('https://example.com/images/photo.png')
+        self.assertEqual(fetch.call_count, 1)
+        second.refresh_from_db()
+        self.assertEqual(second.thumbnail_hash, first.thumbnail_hash)
+
+    def test_invalid_image(self):
+        """Не изображение помечается, миниатюры нет."""
+        ad = self.create_ad('https://example.com/images/broken.png')
+        self.assertEqual(ad.image_status, 'invalid')
+        response = self.client.get(f'/api/ads/{ad.id}/')
+        self.assertIsNone(response.data['thumbnail_url'])
+        response = self.client.post('/api/ads/', {
+            'title': 'Объявление с фото',
+            'description': 'Описание объявления с фотографией',
+            'image_url': 'ftp://example.com/photo.png',
+            'category': 'books',
+            'condition': 'new',
+        }, format='json')
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_url_change_resets_image(self):
+        """Смена image_url сбрасывает данные старого изображения."""
+        ad = self.create_ad('https://example.com/images/photo.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/ads/{ad.id}/', {
+                'title': ad.title,
+                'description': ad.description,
+                'image_url': 'https://example.com/images/broken.png',
+            }, format='json')
+        ad.refresh_from_db()
+        self.assertEqual(ad.image_status, 'invalid')
+        self.assertIsNone(ad.thumbnail_hash)
+
+    def test_inflight_deduplication(self):
+        """Объявления с URL в обработке присоединяются к задаче."""
+        started, release = threading.Event(), threading.Event()
+        pipeline = ThumbnailPipeline()
+        pipeline.configure()
+        pipeline.config = {**pipeline.config, 'WORKERS': 1}
+
+        def fetch(url):
+            started.set()
+            release.wait(5)
+            return (self.root / 'images' / 'photo.png').read_bytes()
+
+        url = 'https://example.com/images/photo.png'
+        with mock.patch.object(pipeline.fetcher, 'fetch', side_effect=fetch):
+            with mock.patch.object(pipeline, 'save') as save:
+                pipeline.submit(url, [1])
+                started.wait(5)
+                pipeline.submit(url, [2])
+                release.set()
+                pipeline.wait()
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(save.call_args.args[1], {1, 2})
+
+    def test_private_address_refused(self):
+        """Локальные и внутренние адреса не загружаются."""
+        fetcher = HTTPFetcher(timeout=1)
+        for url in (
+            'http://127.0.0.1/photo.png',
+            'http://169.254.169.254/latest/meta-data/',
+            'http://[::ffff:10.0.0.1]/photo.png',
+            'http://localhost:8000/photo.png',
+        ):
+            with self.assertRaises(ThumbnailError):
+                fetcher.fetch(url)
+        with mock.patch('socket.getaddrinfo', return_value=[
+            (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.1.2.3', 80))
+        ]):
+            with self.assertRaisesMessage(ThumbnailError, '10.1.2.3'):
+                fetcher.fetch('http://images.example.com/photo.png')
+
+    def test_redirect_to_private_address_refused(self):
+        """Переадресация проверяется так же, как исходный URL."""
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append(self.path)
+                if self.path == '/ok':
+                    self.send_response(200)
+                    self.end_headers()
+                    self.wfile.write(b'image')
+                    return
+                self.send_response(302)
+                self.send_header(
+                    'Location', 'http://169.254.169.254/latest/meta-data/'
+                )
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = f'http://127.0.0.1:{server.server_port}'
+        # Разрешаем только loopback, чтобы дойти до переадресации.
+        with mock.patch(
+            'ads.thumbnails.is_public_address',
+            side_effect=lambda address: address.is_loopback
+        ):
+            fetcher = HTTPFetcher(timeout=1)
+            self.assertEqual(fetcher.fetch(f'{base}/ok'), b'image')
+            with self.assertRaisesMessage(ThumbnailError, '169.254.169.254'):
+                fetcher.fetch(f'{base}/photo.png')
+        self.assertEqual(requests, ['/ok', '/photo.png'])
+
+    def test_command_backfills(self):
+        """Команда обрабатывает объявления без миниатюр."""
+        ad = Ad.objects.create(
+            user=self.user,
+            title='Объявление с фото',
+            description='Описание объявления с фотографией',
+            image_url='https://example.com/images/photo.png',
+            category='books',
+            condition='new'
+        )
+        out = StringIO()
+        call_command('process_thumbnails', stdout=out)
+        self.assertIn('Изображений: 1, объявлений: 1', out.getvalue())
+        ad.refresh_from_db()
+        self.assertEqual(ad.image_status, 'ready')
+
+
+class AdBulkTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование массового создания и удаления объявлений."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.user1 = User.objects.create_user(
+            username='user1', password='qwerty123'
+        )
+        self.user2 = User.objects.create_user(
+            username='user2', password='qwerty123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+
+    def make_item(self, index):
+        """Корректное объявление для пакета."""
+        return {
+            'title': f'Объявление номер {index}',
+            'description': 'Описание объявления из пакетного импорта',
+            'category': 'books',
+            'condition': 'used'
+        }
+
+    def test_bulk_create_reports_errors_per_item(self):
+        """Корректные объявления создаются, ошибки привязаны к индексу."""
+        items = [self.make_item(index) for index in range(5)]
+        items[2]['title'] = 'Нет'
+        items[4]['category'] = 'unknown'
+        # Вставка и по три запроса на первую запись каждого счетчика.
+        with self.assertMaxQueries(7):
+            response = self.client.post(
+                '/api/ads/bulk/', items, format='json'
+            )
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created']), 3)
+        self.assertEqual(
+            [error['index'] for error in response.data['errors']], [2, 4]
+        )
+        self.assertEqual(Ad.objects.filter(user=self.user1).count(), 3)
+
+    def test_bulk_create_rejects_invalid_batch(self):
+        """Пакет без корректных объявлений отклоняется."""
+        response = self.client.post(
+            '/api/ads/bulk/', [{'title': 'Нет'}], format='json'
+        )
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            '/api/ads/bulk/', self.make_item(0), format='json'
+        )
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_bulk_deactivate_own_ads(self):
+        """Массовое удаление затрагивает только свои объявления."""
+        own = Ad.objects.bulk_create([
+            Ad(user=self.user1, **self.make_item(index))
+            for index in range(3)
+        ])
+        foreign = Ad.objects.create(user=self.user2, **self.make_item(9))
+        # Выборка, UPDATE и по запросу на счетчик категории и автора.
+        with self.assertMaxQueries(4):
+            response = self.client.post('/api/ads/bulk-deactivate/', {
+                'ids': [ad.id for ad in own] + [foreign.id]
+            }, format='json')
+        self.assertEqual(response.data['deactivated'], 3)
+        self.assertFalse(
+            Ad.objects.filter(user=self.user1, is_active=True).exists()
+        )
+        foreign.refresh_from_db()
+        self.assertTrue(foreign.is_active)
+
+
+class ExportTestCase(TestCase):
+    """Тестирование потоковой выгрузки."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.admin = User.objects.create_user(
+            username='admin', password='qwerty123', is_staff=True
+        )
+        self.ads = Ad.objects.bulk_create([
+            Ad(
+                user=self.admin,
+                title=f'Объявление {index}',
+                description='Описание объявления для выгрузки',
+                category='books' if index % 2 else 'home',
+                condition='new',
+                is_active=index != 0
+            )
+            for index in range(5)
+        ])
+        ExchangeProposal.objects.create(
+            ad_sender=self.ads[1], ad_receiver=self.ads[2]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def read(self, response):
+        """Содержимое потокового ответа."""
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_ads_ndjson_with_filter(self):
+        """Выгрузка активных объявлений с фильтром AdFilter."""
+        response = self.client.get(
+            '/api/ads/export/', {'category': 'books'}
+        )
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(
+            [row['id'] for row in rows],
+            [self.ads[1].id, self.ads[3].id]
+        )
+        self.assertEqual(rows[0]['title'], 'Объявление 1')
+
+    def test_export_proposals_csv(self):
+        """Выгрузка предложений обмена в CSV."""
+        response = self.client.get(
+            '/api/proposals/export/', {'export_format': 'csv'}
+        )
+        lines = self.read(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], [
+            'id', 'ad_sender_id', 'ad_receiver_id'
+        ])
+        self.assertEqual(len(lines), 2)
+
+    def test_export_requires_admin(self):
+        """Выгрузка недоступна обычному пользователю."""
+        self.client.force_authenticate(user=User.objects.create_user(
+            username='user', password='qwerty123'
+        ))
+        response = self.client.get('/api/ads/export/')
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+    def test_export_command(self):
+        """Выгрузка через management-команду."""
+        out = StringIO()
+        call_command(
+            'export_data', 'ads', '--filter', 'category=home', stdout=out
+        )
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class MatchingTestCase(TestCase):
+    """Тестирование подбора обменов."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        matching_engine.reset()
+        self.users = [
+            User.objects.create_user(
+                username=f'user{index}', password='qwerty123'
+            )
+            for index in range(4)
+        ]
+        self.ads = [
+            Ad.objects.create(
+                user=user,
+                title=f'Вещь пользователя {index}',
+                description='Описание вещи для подбора обмена',
+                category=category,
+                condition='used'
+            )
+            for index, (user, category) in enumerate(zip(
+                self.users, ['books', 'home', 'clothing', 'books']
+            ))
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def propose(self, sender, receiver):
+        """Предложение обмена между объявлениями."""
+        return ExchangeProposal.objects.create(
+            ad_sender=self.ads[sender], ad_receiver=self.ads[receiver]
+        )
+
+    def user_ids(self, *indexes):
+        return [self.users[index].id for index in indexes]
+
+    def test_direct_and_three_way_cycles(self):
+        """Поиск прямого обмена и цикла из трех участников."""
+        first = self.propose(0, 1)
+        self.propose(1, 2)
+        self.propose(2, 0)
+        self.propose(1, 0)
+        response = self.client.get('/api/matches/')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        cycles = sorted(
+            response.data['cycles'], key=lambda cycle: len(cycle['users'])
+        )
+        self.assertEqual(cycles[0]['users'], self.user_ids(0, 1))
+        self.assertEqual(cycles[1]['users'], self.user_ids(0, 1, 2))
+        self.assertEqual(cycles[1]['proposals'][0], first.id)
+        response = self.client.get('/api/matches/', {'depth': 2})
+        self.assertEqual(len(response.data['cycles']), 1)
+
+    def test_graph_follows_status_changes(self):
+        """Предложение, вышедшее из ожидания, убирается из графа."""
+        matching_engine.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            proposal = self.propose(0, 1)
+            self.propose(1, 0)
+        self.assertEqual(len(matching_engine.find_cycles(self.users[0].id)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            proposal.status = 'rejected'
+            proposal.save()
+        self.assertEqual(matching_engine.find_cycles(self.users[0].id), [])
+
+    def test_counter_offer_suggestions(self):
+        """Подсказка встречного обмена по категориям желаний."""
+        self.propose(0, 2)
+        self.propose(3, 1)
+        self.propose(1, 0)
+        suggestions = matching_engine.suggest(self.users[1].id)
+        self.assertEqual(
+            [item['user'] for item in suggestions], self.user_ids(3)
+        )
+        self.assertEqual(
+            suggestions[0]['gives'],
+            {'category': 'books', 'condition': 'used'}
+        )
+
+    @override_settings(ADS_ENGINES={
+        'CHECK_INTERVAL': 0, 'RELOAD_INTERVAL': 0, 'MAX_AGE': 600
+    })
+    def test_reload_after_foreign_write(self):
+        """Запись другого процесса вызывает фоновую перестройку."""
+        matching_engine.load()
+        with mock.patch.object(
+            matching_engine, 'reload_in_background'
+        ) as reload:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.propose(0, 1)
+            matching_engine.find_cycles(self.users[0].id)
+            reload.assert_not_called()
+            matching_engine.generation.bump()
+            matching_engine.find_cycles(self.users[0].id)
+            reload.assert_called_once()
+
+    def test_bench_runs_on_small_graph(self):
+        """Бенчмарк работает на графе меньше выборки обновлений."""
+        out = StringIO()
+        with mock.patch.object(
+            MatchingEngine, 'reload_in_background'
+        ) as reload:
+            call_command(
+                'bench_matching', proposals=500, users=50, samples=5,
+                stdout=out
+            )
+        reload.assert_not_called()
+        self.assertIn('Циклы', out.getvalue())
+
+    def test_reload_keeps_reads_available(self):
+        """Перестройка не блокирует чтение старого графа."""
+        matching_engine.load()
+        self.propose(0, 1)
+        self.propose(1, 0)
+        fill = MatchingEngine.fill
+        during = []
+
+        def slow_fill(engine):
+            thread = threading.Thread(target=lambda: during.append(
+                matching_engine.find_cycles(self.users[0].id)
+            ))
+            thread.start()
+            thread.join(5)
+            fill(engine)
+
+        with mock.patch.object(MatchingEngine, 'fill', slow_fill):
+            matching_engine.load()
+        self.assertEqual(during, [[]])
+        self.assertEqual(len(matching_engine.find_cycles(self.users[0].id)), 1)
+
+
+class RecommendationTestCase(TestCase):
+    """Тестирование ленты рекомендаций."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        recommendation_engine.reset()
+        self.users = [
+            User.objects.create_user(
+                username=f'user{index}', password='qwerty123'
+            )
+            for index in range(4)
+        ]
+        self.ads = [
+            self.create_ad(user, category, condition)
+            for user, category, condition in [
+                (self.users[0], 'books', 'used'),
+                (self.users[1], 'books', 'used'),
+                (self.users[2], 'electronics', 'new'),
+                (self.users[3], 'home', 'used'),
+                (self.users[3], 'electronics', 'new'),
+            ]
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def create_ad(self, user, category, condition):
+        return Ad.objects.create(
+            user=user,
+            title=f'Вещь {user.username}',
+            description='Описание вещи для ленты рекомендаций',
+            category=category,
+            condition=condition
+        )
+
+    def recommended(self):
+        response = self.client.get('/api/recommendations/')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return [ad['id'] for ad in response.data['results']]
+
+    def test_feed_ranks_by_proposal_history(self):
+        """Вещи, похожие на желаемые, выше; свои и уже запрошенные скрыты."""
+        ExchangeProposal.objects.create(
+            ad_sender=self.ads[0], ad_receiver=self.ads[2]
+        )
+        self.assertEqual(
+            self.recommended(),
+            [self.ads[4].id, self.ads[1].id, self.ads[3].id]
+        )
+        response = self.client.get('/api/recommendations/', {'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIn('score', response.data['results'][0])
+        response = self.client.get('/api/recommendations/', {'limit': 0})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_cached_feed_is_refreshed_incrementally(self):
+        """Новые объявления досчитываются в кэш, снятые убираются."""
+        recommendation_engine.load()
+        user_id = self.users[0].id
+        self.recommended()
+        with self.captureOnCommitCallbacks(execute=True):
+            ad = self.create_ad(self.users[1], 'books', 'used')
+        self.assertEqual(
+            recommendation_engine.results[user_id]['size'], len(self.ads)
+        )
+        self.assertIn(ad.id, self.recommended())
+        self.assertEqual(
+            recommendation_engine.results[user_id]['size'],
+            len(self.ads) + 1
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            ad.delete()
+        self.assertNotIn(ad.id, self.recommended())
+
+    def test_edited_ad_not_duplicated(self):
+        """Измененное объявление остается в кэше выдачи один раз."""
+        recommendation_engine.load()
+        self.recommended()
+        ad = self.ads[1]
+        ad.category = 'home'
+        with self.captureOnCommitCallbacks(execute=True):
+            ad.save()
+        ids = self.recommended()
+        self.assertIn(ad.id, ids)
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_rejected_category_moves_down(self):
+        """Отклоненная категория опускается в выдаче получателя."""
+        recommendation_engine.load()
+        proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ads[3], ad_receiver=self.ads[0]
+        )
+        self.assertNotEqual(self.recommended()[-1], self.ads[3].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/proposals/{proposal.id}/', {'status': 'rejected'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(self.recommended()[-1], self.ads[3].id)
+
+    @override_settings(ADS_ENGINES={
+        'CHECK_INTERVAL': 0, 'RELOAD_INTERVAL': 0, 'MAX_AGE': 600
+    })
+    def test_reload_after_foreign_write(self):
+        """Чужая запись перестраивает массивы в фоне, своя - нет."""
+        recommendation_engine.load()
+        self.recommended()
+        with mock.patch.object(
+            recommendation_engine, 'reload_in_background'
+        ) as reload:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_ad(self.users[1], 'books', 'used')
+            self.recommended()
+            reload.assert_not_called()
+            recommendation_engine.generation.bump()
+            self.recommended()
+            reload.assert_called_once()
+        recommendation_engine.load()
+        self.assertEqual(recommendation_engine.seen, (
+            recommendation_engine.generation.get()
+        ))
+
+
+class ProposalTransitionTestCase(TestCase):
+    """Тестирование смены статусов предложений обмена."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.users = [
+            User.objects.create_user(
+                username=f'user{index}', password='qwerty123'
+            )
+            for index in range(3)
+        ]
+        self.ads = [
+            Ad.objects.create(
+                user=user,
+                title=f'Вещь пользователя {index}',
+                description='Описание вещи для проверки статусов',
+                category='other',
+                condition='used'
+            )
+            for index, user in enumerate(self.users)
+        ]
+        self.first = ExchangeProposal.objects.create(
+            ad_sender=self.ads[0], ad_receiver=self.ads[2]
+        )
+        self.second = ExchangeProposal.objects.create(
+            ad_sender=self.ads[1], ad_receiver=self.ads[2]
+        )
+        self.client = APIClient()
+
+    def patch_status(self, user, proposal, status):
+        self.client.force_authenticate(user=user)
+        return self.client.patch(
+            f'/api/proposals/{proposal.id}/', {'status': status},
+            format='json'
+        )
+
+    def test_accept_rejects_competing_proposals(self):
+        """Принятие отклоняет конкурирующие предложения по объявлению."""
+        response = self.patch_status(self.users[2], self.first, 'accepted')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'accepted')
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.status, 'rejected')
+
+    def test_second_transition_conflicts(self):
+        """Повторная смена статуса после принятия конкурента - 409."""
+        self.patch_status(self.users[2], self.first, 'accepted')
+        response = self.patch_status(self.users[2], self.second, 'accepted')
+        self.assertEqual(response.status_code, HTTP_409_CONFLICT)
+        response = self.patch_status(self.users[2], self.first, 'rejected')
+        self.assertEqual(response.status_code, HTTP_409_CONFLICT)
+
+    def test_sender_cancels_own_proposal(self):
+        """Отменить может только отправитель."""
+        response = self.patch_status(self.users[2], self.first, 'canceled')
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+        response = self.patch_status(self.users[0], self.first, 'canceled')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.status, 'pending')
+
+    def test_pending_is_not_a_target_status(self):
+        """Вернуть предложение в ожидание нельзя."""
+        response = self.patch_status(self.users[2], self.first, 'pending')
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_transition_changes(self):
+        """Список изменений содержит участников каждого предложения."""
+        changes = ExchangeProposal.objects.transition(self.first, 'accepted')
+        self.assertEqual(
+            sorted((change['id'], change['status']) for change in changes),
+            [(self.first.id, 'accepted'), (self.second.id, 'rejected')]
+        )
+        self.assertEqual(
+            {change['receiver_user_id'] for change in changes},
+            {self.users[2].id}
+        )
+
+
+class CounterTestCase(QueryBudgetMixin, TestCase):
+    """Тестирование денормализованных счетчиков."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        self.users = [
+            User.objects.create_user(
+                username=f'user{index}', password='qwerty123'
+            )
+            for index in range(3)
+        ]
+        self.ads = [
+            Ad.objects.create(
+                user=user,
+                title=f'Вещь пользователя {index}',
+                description='Описание вещи для проверки счетчиков',
+                category='books',
+                condition='used'
+            )
+            for index, user in enumerate(self.users)
+        ]
+        self.client = APIClient()
+
+    def assertCountersConsistent(self):
+        self.assertEqual(reconcile_counters(dry_run=True), [])
+
+    def get_user_counters(self, user):
+        return UserCounter.objects.filter(user=user).values(
+            *UserCounter.counter_fields
+        ).first()
+
+    def test_ad_create_update_delete(self):
+        """Создание, смена категории и мягкое удаление объявления."""
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post('/api/ads/', {
+            'title': 'Новая лампа',
+            'description': 'Настольная лампа с абажуром',
+            'category': 'home',
+            'condition': 'new'
+        }, format='json')
+        ad_id = response.data['id']
+        self.assertEqual(CategoryCounter.objects.get(pk='home').active_ads, 1)
+        self.assertEqual(
+            self.get_user_counters(self.users[0])['active_ads'], 2
+        )
+        self.client.patch(f'/api/ads/{ad_id}/', {
+            'title': 'Новая лампа',
+            'description': 'Настольная лампа с абажуром',
+            'category': 'electronics'
+        }, format='json')
+        self.assertEqual(CategoryCounter.objects.get(pk='home').active_ads, 0)
+        self.assertEqual(
+            CategoryCounter.objects.get(pk='electronics').active_ads, 1
+        )
+        self.client.delete(f'/api/ads/{ad_id}/')
+        self.assertEqual(
+            CategoryCounter.objects.get(pk='electronics').active_ads, 0
+        )
+        self.assertCountersConsistent()
+
+    def test_bulk_operations(self):
+        """Массовое создание и удаление объявлений."""
+        self.client.force_authenticate(user=self.users[1])
+        item = {
+            'title': 'Пакетное объявление',
+            'description': 'Описание пакетного объявления',
+            'category': 'clothing',
+            'condition': 'used'
+        }
+        response = self.client.post(
+            '/api/ads/bulk/', [item, item, item], format='json'
+        )
+        self.assertEqual(
+            CategoryCounter.objects.get(pk='clothing').active_ads, 3
+        )
+        ids = [ad['id'] for ad in response.data['created']]
+        self.client.post(
+            '/api/ads/bulk-deactivate/',
+            {'ids': ids[:2] + [self.ads[0].id]},
+            format='json'
+        )
+        self.assertEqual(
+            CategoryCounter.objects.get(pk='clothing').active_ads, 1
+        )
+        self.assertCountersConsistent()
+
+    def test_proposal_status_changes(self):
+        """Ожидающие предложения при создании, принятии и отмене."""
+        first = ExchangeProposal.objects.create(
+            ad_sender=self.ads[0], ad_receiver=self.ads[2]
+        )
+        second = ExchangeProposal.objects.create(
+            ad_sender=self.ads[1], ad_receiver=self.ads[2]
+        )
+        third = ExchangeProposal.objects.create(
+            ad_sender=self.ads[0], ad_receiver=self.ads[1]
+        )
+        self.assertEqual(
+            self.get_user_counters(self.users[2])['pending_incoming'], 2
+        )
+        self.assertEqual(
+            self.get_user_counters(self.users[0])['pending_outgoing'], 2
+        )
+        self.client.force_authenticate(user=self.users[2])
+        self.client.patch(
+            f'/api/proposals/{first.id}/', {'status': 'accepted'},
+            format='json'
+        )
+        self.assertEqual(
+            self.get_user_counters(self.users[2])['pending_incoming'], 0
+        )
+        self.client.force_authenticate(user=self.users[0])
+        self.client.patch(
+            f'/api/proposals/{third.id}/', {'status': 'canceled'},
+            format='json'
+        )
+        self.assertEqual(self.get_user_counters(self.users[0]), {
+            'active_ads': 1, 'pending_incoming': 0, 'pending_outgoing': 0
+        })
+        second.delete()
+        self.assertCountersConsistent()
+
+    def test_summary(self):
+        """Сводка читает только таблицы счетчиков."""
+        ExchangeProposal.objects.create(
+            ad_sender=self.ads[1], ad_receiver=self.ads[0]
+        )
+        self.user = self.users[0]
+        self.client.force_authenticate(user=self.user)
+        response = self.assertEndpointQueries(
+            3, f'/api/summary/?user={self.users[1].id}'
+        )
+        self.assertEqual(response.data['categories']['books'], 3)
+        self.assertEqual(response.data['categories']['home'], 0)
+        self.assertEqual(response.data['me'], {
+            'active_ads': 1, 'pending_incoming': 1, 'pending_outgoing': 0
+        })
+        self.assertEqual(
+            response.data['user'], {'id': self.users[1].id, 'active_ads': 1}
+        )
+        response = APIClient().get('/api/summary/')
+        self.assertIsNone(response.data['me'])
+
+    def test_reconcile_reports_drift(self):
+        """Пересчет находит и исправляет расхождения."""
+        CategoryCounter.objects.filter(pk='books').update(active_ads=10)
+        UserCounter.objects.filter(user=self.users[0]).delete()
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('books active_ads: 10 -> 3', out.getvalue())
+        self.assertIn('Расхождений: 2', out.getvalue())
+        self.assertCountersConsistent()
+
+    def test_untracked_update_fields_skip_lock(self):
+        """Сохранение без отслеживаемых полей - один UPDATE без блокировки."""
+        ad = self.ads[0]
+        ad.title = 'Новый заголовок вещи'
+        with self.assertMaxQueries(1):
+            ad.save(update_fields=['title'])
+        self.assertEqual(ad.saved_state, ad.get_state())
+        self.assertEqual(
+            self.get_user_counters(self.users[0])['active_ads'], 1
+        )
+        ad.is_active = False
+        ad.save(update_fields=['is_active'])
+        self.assertEqual(
+            self.get_user_counters(self.users[0])['active_ads'], 0
+        )
+        self.assertCountersConsistent()
+
+    def test_reconcile_writes_only_drifted_rows(self):
+        """Пересчет переписывает только расходящиеся строки."""
+        CategoryCounter.objects.filter(pk='books').update(active_ads=10)
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+            drift = reconcile_counters()
+        self.assertEqual(
+            drift, [(CategoryCounter, 'books', 'active_ads', 10, 3)]
+        )
+        writes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'DELETE'))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('categorycounter', writes[0])
+        self.assertIn('ON CONFLICT', writes[0])
+        self.assertCountersConsistent()
+
+
+class BenchmarkTestCase(TestCase):
+    """Тестирование генератора данных и прогона сценариев."""
+
+    def test_generate_and_run_scenarios(self):
+        """Генерация данных и прогон всех сценариев в процессе."""
+        created = generate_data(users=5, ads=40, proposals=30, batch_size=16)
+        self.assertEqual(created['users'], 5)
+        self.assertEqual(Ad.objects.count(), 40)
+        scenarios = Scenarios()
+        runner = InProcessRunner(scenarios.user)
+        for name in Scenarios.names():
+            result = runner.run(name, getattr(scenarios, name), 3)
+            self.assertEqual(result.requests, 3)
+            self.assertEqual(result.errors, 0)
+            self.assertIsNotNone(result.queries_per_request)
+        uncached = runner.run('feed', scenarios.feed, 3)
+        self.assertGreater(uncached.queries_per_request, 0)
+        runner.run('feed_cached', scenarios.feed_cached, 1)
+        cached = runner.run('feed_cached', scenarios.feed_cached, 3)
+        self.assertEqual(cached.queries_per_request, 0)
+
+    def test_generated_counters(self):
+        """Счетчики после генерации совпадают с агрегатами таблиц."""
+        generate_data(users=5, ads=40, proposals=30, batch_size=16)
+        ads = Ad.objects.active().order_by()
+        self.assertEqual(
+            dict(CategoryCounter.objects.filter(
+                active_ads__gt=0
+            ).values_list('category', 'active_ads')),
+            dict(ads.values_list('category').annotate(Count('id')))
+        )
+        self.assertEqual(
+            dict(UserCounter.objects.filter(
+                active_ads__gt=0
+            ).values_list('user_id', 'active_ads')),
+            dict(ads.values_list('user_id').annotate(Count('id')))
+        )
+        pending = ExchangeProposal.objects.filter(
+            status='pending'
+        ).order_by()
+        self.assertEqual(
+            dict(UserCounter.objects.filter(
+                pending_incoming__gt=0
+            ).values_list('user_id', 'pending_incoming')),
+            dict(pending.values_list('receiver_user_id').annotate(
+                Count('id')
+            ))
+        )
+        self.assertFalse(matching_engine.loaded)
+        self.assertFalse(recommendation_engine.loaded)
+
+    def test_baseline_regressions(self):
+        """Сравнение с базовой линией находит ухудшения."""
+        result = ScenarioResult(
+            scenario='feed', requests=10, errors=0, p50_ms=1.0,
+            p95_ms=3.0, p99_ms=4.0, throughput_rps=100.0,
+            queries_per_request=3.0
+        )
+        baseline = results_to_baseline([result])
+        self.assertEqual(compare_with_baseline([result], baseline, 0.2), [])
+        baseline['feed'].update(p95_ms=2.0, queries_per_request=2.0)
+        self.assertEqual(
+            len(compare_with_baseline([result], baseline, 0.2)), 2
+        )
+
+
+@override_settings(PERF_INSTRUMENTATION={'SAMPLE_RATE': 1.0})
+class PerformanceMiddlewareTestCase(TestCase):
+    """Тестирование замеров производительности запросов."""
+
+    def setUp(self):
+        """Получение данных для тестирования."""
+        metrics_registry.reset()
+        ad_cache.invalidate()
+        ad_cache.reset_stats()
+        self.admin = User.objects.create_user(
+            username='admin', password='qwerty123', is_staff=True
+        )
+        Ad.objects.create(
+            user=self.admin,
+            title="Кофта из шерсти",
+            description="Не ношеная кофта из шерсти",
+            category="clothing",
+            condition="new"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_server_timing_header(self):
+        """Ответ содержит разбивку времени по частям."""
+        response = self.client.get('/api/ads/', {'category': 'clothing'})
+        timing = response['Server-Timing']
+        for name in ('total', 'db', 'serialize', 'render'):
+            self.assertIn(f'{name};dur=', timing)
+        self.assertIn('queries"', timing)
+
+    def test_metrics_endpoint(self):
+        """Метрики группируются по view."""
+        self.client.get('/api/ads/', {'category': 'books'})
+        self.client.get('/api/ads/', {'category': 'books'})
+        response = self.client.get('/api/metrics/')
+        metrics = response.data['views']['AdListCreateView']
+        self.assertEqual(metrics['counters']['requests'], 2)
+        self.assertEqual(metrics['timings_ms']['total']['count'], 2)
+        self.assertGreater(metrics['counters']['response_bytes'], 0)
+        self.assertEqual(response.data['ad_cache']['hits'], 1)
+
+    @override_settings(PERF_INSTRUMENTATION={'SAMPLE_RATE': 0.0})
+    def test_sampling_disabled(self):
+        """Запросы вне выборки не замеряются."""
+        response = self.client.get('/api/ads/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_duplicate_queries(self):
+        """Подсчет одинаковых и похожих запросов."""
+        stats = RequestStats()
+        stats.queries.update({
+            ('SELECT 1', '(1,)'): 2, ('SELECT 1', '(2,)'): 1
+        })
+        self.assertEqual(stats.duplicate_queries, 1)
+        self.assertEqual(stats.similar_queries, 2)
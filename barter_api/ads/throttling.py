@@ -0,0 +1,256 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .constants import (
+    ADS_CACHE_PREFIX, THROTTLE_KEYS_MAX, THROTTLE_STORE_DEFAULT,
+    THROTTLE_WRITE_METHODS
+)
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """Лимит и период в секундах из строки вида '30/min'."""
+    limit, period = rate.split('/')
+    return int(limit), PERIODS[period[0]]
+
+
+def get_throttling_config():
+    config = getattr(settings, 'ADS_THROTTLING', {})
+    return {
+        'STORE': THROTTLE_STORE_DEFAULT,
+        'STORE_OPTIONS': {},
+        'WRITE_CONCURRENCY': None,
+        **config,
+    }
+
+
+class LocalRateStore:
+    """Token bucket в памяти процесса.
+
+    Корзина на limit запросов пополняется равномерно за period
+    секунд, поэтому допускает всплеск до limit и средний темп
+    limit/period. Хранится не больше keys_max корзин: давно не
+    использованные вытесняются, что равносильно полной корзине.
+    """
+
+    def __init__(self, keys_max=THROTTLE_KEYS_MAX):
+        self.keys_max = keys_max
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def acquire(self, key, limit, period):
+        """Ожидание и метка для release().
+
+        Ожидание - 0, если запрос пропущен, иначе секунды до
+        следующего токена; метка - ключ корзины.
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * limit / period)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) * period / limit
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.keys_max:
+                self.buckets.popitem(last=False)
+        return wait, key
+
+    def release(self, key, limit, period):
+        """Возврат токена, взятого acquire() с меткой key."""
+        with self.lock:
+            if key in self.buckets:
+                tokens, updated = self.buckets[key]
+                self.buckets[key] = (min(limit, tokens + 1), updated)
+
+
+class CacheRateStore:
+    """Скользящее окно в общем кэше Django для нескольких процессов.
+
+    Счетчики текущего и предыдущего окна длиной period меняются
+    атомарными add/incr; число запросов за последние period секунд
+    оценивается как текущий счетчик плюс доля предыдущего.
+    Отклоненный запрос возвращает свой инкремент. Метка acquire() -
+    ключ окна, в котором сделан инкремент.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def acquire(self, key, limit, period):
+        cache = caches[self.alias]
+        position = time.time() / period
+        window = int(position)
+        elapsed = position - window
+        current_key = f'{ADS_CACHE_PREFIX}:throttle:{key}:{window}'
+        cache.add(current_key, 0, timeout=2 * period)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            # Счетчик вытеснен между add и incr.
+            cache.set(current_key, 1, timeout=2 * period)
+            current = 1
+        previous = cache.get(
+            f'{ADS_CACHE_PREFIX}:throttle:{key}:{window - 1}', 0
+        )
+        if previous * (1 - elapsed) + current <= limit:
+            return 0.0, current_key
+        self.release(current_key, limit, period)
+        if previous and current <= limit:
+            # Ждать, пока доля предыдущего окна не освободит место.
+            wait = (1 - (limit - current) / previous - elapsed) * period
+        else:
+            wait = (1 - elapsed) * period
+        return wait, current_key
+
+    def release(self, window_key, limit, period):
+        """Возврат инкремента, сделанного acquire() в окне window_key."""
+        try:
+            caches[self.alias].decr(window_key)
+        except ValueError:
+            # Счетчик истек или вытеснен: возвращать нечего.
+            pass
+
+
+class RateLimiter:
+    """Хранилище лимитов из настройки ADS_THROTTLING['STORE']."""
+
+    def __init__(self):
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            config = get_throttling_config()
+            self._store = import_string(config['STORE'])(
+                **config['STORE_OPTIONS']
+            )
+        return self._store
+
+    def reset(self):
+        """Новое хранилище с пустыми счетчиками."""
+        self._store = None
+
+    def acquire(self, key, limit, period):
+        """Ожидание в секундах и метка для release()."""
+        return self.store.acquire(key, limit, period)
+
+    def release(self, ticket, limit, period):
+        self.store.release(ticket, limit, period)
+
+
+rate_limiter = RateLimiter()
+
+
+class RateThrottle(BaseThrottle):
+    """Лимит запросов пользователя в рамках scope.
+
+    Лимиты берутся из DEFAULT_THROTTLE_RATES; scope без лимита не
+    ограничивается. Ключ - id пользователя, для анонимных - адрес.
+    Проверка выполняется после аутентификации и проверки прав, но
+    до сериализатора, поэтому отклоненный запрос не обращается к
+    базе (при кэше аутентификации).
+
+    DRF проверяет все лимиты запроса подряд. Если один из них
+    отклонил запрос, токены, взятые предыдущими, возвращаются, а
+    следующие токенов не берут: отклоненный запрос не расходует
+    другие лимиты.
+    """
+
+    scope = None
+    methods = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_key(self, request, scope):
+        user = request.user
+        if user and user.is_authenticated:
+            return f'{scope}:user:{user.pk}'
+        return f'{scope}:ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if self.methods is not None and request.method not in self.methods:
+            return True
+        scope = self.get_scope(view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        acquired = getattr(request, '_rate_acquired', [])
+        if acquired is None:
+            # Запрос уже отклонен другим лимитом.
+            return True
+        limit, period = parse_rate(rate)
+        self.wait_seconds, ticket = rate_limiter.acquire(
+            self.get_key(request, scope), limit, period
+        )
+        if not self.wait_seconds:
+            request._rate_acquired = acquired + [(ticket, limit, period)]
+            return True
+        for taken in acquired:
+            rate_limiter.release(*taken)
+        request._rate_acquired = None
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserWriteThrottle(RateThrottle):
+    """Общий лимит изменяющих запросов пользователя."""
+
+    scope = 'writes'
+    methods = THROTTLE_WRITE_METHODS
+
+
+class ScopedWriteThrottle(RateThrottle):
+    """Лимит изменяющих запросов к endpoint по его throttle_scope."""
+
+    methods = THROTTLE_WRITE_METHODS
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+
+class WriteAdmission:
+    """Ограничение числа одновременных изменяющих запросов процесса.
+
+    Запрос сверх лимита не ждет, а сразу отклоняется, так что при
+    всплеске база получает не больше limit параллельных записей.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self, limit):
+        with self.lock:
+            if self.in_flight >= limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {'in_flight': self.in_flight, 'rejected': self.rejected}
+
+
+write_admission = WriteAdmission()
@@ -0,0 +1,424 @@
+import hashlib
+import http.client
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+
+from .cache import ad_cache
+from .constants import (
+    ADS_CACHE_PREFIX, THUMBNAIL_CACHE_TIMEOUT, THUMBNAIL_FETCH_TIMEOUT,
+    THUMBNAIL_FORMATS, THUMBNAIL_PIXELS_MAX, THUMBNAIL_QUALITY,
+    THUMBNAIL_QUEUE_MAX, THUMBNAIL_REDIRECTS_MAX, THUMBNAIL_SIZE,
+    THUMBNAIL_SOURCE_BYTES_MAX, THUMBNAIL_WORKERS
+)
+
+
+logger = logging.getLogger('ads.thumbnails')
+
+Thumbnail = namedtuple(
+    'Thumbnail', ['image_hash', 'width', 'height', 'thumbnail_hash']
+)
+
+
+class ThumbnailError(Exception):
+    """Изображение нельзя получить или разобрать."""
+
+
+def get_thumbnail_config():
+    config = getattr(settings, 'ADS_THUMBNAILS', {})
+    return {
+        'FETCHER': 'ads.thumbnails.HTTPFetcher',
+        'FETCHER_OPTIONS': {},
+        'ROOT': Path(settings.MEDIA_ROOT) / 'thumbnails',
+        'URL': f'{settings.MEDIA_URL}thumbnails/',
+        'SIZE': THUMBNAIL_SIZE,
+        'WORKERS': THUMBNAIL_WORKERS,
+        'QUEUE_MAX': THUMBNAIL_QUEUE_MAX,
+        **config,
+    }
+
+
+def is_public_address(address):
+    """Адрес не локальный, не частный и не служебный."""
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_global and not (
+        address.is_loopback or address.is_private
+        or address.is_link_local or address.is_reserved
+        or address.is_multicast or address.is_unspecified
+    )
+
+
+def resolve_public_address(host, port):
+    """Адрес для подключения к хосту, если все его адреса публичные.
+
+    Проверяются все адреса из DNS, а подключение идет к проверенному,
+    без повторного разрешения имени: иначе ответ DNS мог бы смениться
+    между проверкой и подключением.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as exc:
+        raise ThumbnailError(f'Не удалось разрешить {host}: {exc}')
+    addresses = [info[4][:2] for info in infos]
+    for ip, _ in addresses:
+        if not is_public_address(ipaddress.ip_address(ip.split('%')[0])):
+            raise ThumbnailError(f'Запрещенный адрес {ip} для {host}')
+    return addresses[0]
+
+
+def check_url(url):
+    """Схема http(s) и публичный адрес хоста URL."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ThumbnailError(f'Неподдерживаемый URL: {url}')
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError as exc:
+        raise ThumbnailError(f'Неверный порт в {url}: {exc}')
+    return resolve_public_address(parts.hostname, port)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    """Соединение только с публичным адресом хоста."""
+
+    def connect(self):
+        self.sock = socket.create_connection(
+            resolve_public_address(self.host, self.port),
+            self.timeout, self.source_address
+        )
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class PublicHTTPSConnection(
+    http.client.HTTPSConnection, PublicHTTPConnection
+):
+    """TLS поверх PublicHTTPConnection; сертификат проверяется по имени."""
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, context=None):
+        super().__init__(context=context)
+        self.context = context
+
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self.context)
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Переадресация только на http(s) URL с публичным адресом."""
+
+    max_redirections = THUMBNAIL_REDIRECTS_MAX
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(
+            req, fp, code, msg, headers, newurl
+        )
+
+
+class HTTPFetcher:
+    """Загрузка изображения по http(s) с ограничением размера.
+
+    URL пользователя не должен открывать серверу внутреннюю сеть:
+    loopback, частные, link-local, зарезервированные и multicast
+    адреса отклоняются и для исходного URL, и для каждой
+    переадресации. Прокси из окружения не используются, так как
+    адрес проверяется при подключении.
+    """
+
+    def __init__(self, timeout=THUMBNAIL_FETCH_TIMEOUT,
+                 max_bytes=THUMBNAIL_SOURCE_BYTES_MAX):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}),
+            PublicHTTPHandler,
+            PublicHTTPSHandler(),
+            PublicRedirectHandler
+        )
+
+    def fetch(self, url):
+        check_url(url)
+        request = urllib.request.Request(
+            url, headers={'User-Agent': 'barter-api-thumbnails'}
+        )
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                data = response.read(self.max_bytes + 1)
+        except (OSError, ValueError, http.client.HTTPException) as exc:
+            raise ThumbnailError(f'Не удалось загрузить {url}: {exc}')
+        if len(data) > self.max_bytes:
+            raise ThumbnailError(f'Изображение больше {self.max_bytes} байт')
+        return data
+
+
+class LocalFileFetcher:
+    """Изображения из локального каталога по пути URL.
+
+    Заглушка для тестов и разработки без доступа к сети:
+    https://example.com/a/b.png читается из ROOT/a/b.png.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+
+    def fetch(self, url):
+        path = (
+            self.root / unquote(urlsplit(url).path).lstrip('/')
+        ).resolve()
+        if self.root not in path.parents:
+            raise ThumbnailError(f'Путь вне каталога изображений: {url}')
+        try:
+            return path.read_bytes()
+        except OSError as exc:
+            raise ThumbnailError(f'Не удалось прочитать {url}: {exc}')
+
+
+class ThumbnailStore:
+    """Хранилище миниатюр, адресуемых по SHA-256 содержимого.
+
+    Одинаковые миниатюры хранятся одним файлом, а файл по адресу
+    никогда не меняется, поэтому его можно кэшировать бессрочно.
+    """
+
+    extension = 'jpg'
+
+    def __init__(self, root, base_url):
+        self.root = Path(root)
+        self.base_url = base_url
+
+    def relative_path(self, digest):
+        return f'{digest[:2]}/{digest}.{self.extension}'
+
+    def url(self, digest):
+        return f'{self.base_url}{self.relative_path(digest)}'
+
+    def exists(self, digest):
+        return (self.root / self.relative_path(digest)).exists()
+
+    def save(self, data):
+        """Запись содержимого; возвращает его хэш."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.root / self.relative_path(digest)
+        if path.exists():
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return digest
+
+
+def render_thumbnail(data, size):
+    """Размеры исходного изображения и JPEG-миниатюра не больше size."""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            if image.format not in THUMBNAIL_FORMATS:
+                raise ThumbnailError(
+                    f'Неподдерживаемый формат {image.format}'
+                )
+            width, height = image.size
+            if width * height > THUMBNAIL_PIXELS_MAX:
+                raise ThumbnailError('Слишком большое изображение')
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(size)
+            output = BytesIO()
+            image.convert('RGB').save(
+                output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True
+            )
+    except (
+        OSError, SyntaxError, ValueError, Image.DecompressionBombError
+    ) as exc:
+        raise ThumbnailError(f'Не удалось разобрать изображение: {exc}')
+    return width, height, output.getvalue()
+
+
+class ThumbnailPipeline:
+    """Фоновое построение миниатюр для объявлений.
+
+    Задачи группируются по URL: пока изображение обрабатывается,
+    новые объявления с тем же URL присоединяются к задаче, а
+    готовый результат запоминается в кэше, так что популярное
+    изображение загружается один раз. Пул потоков ограничен WORKERS,
+    очередь - QUEUE_MAX задач; не поместившиеся задачи отбрасываются
+    и досчитываются командой process_thumbnails. При WORKERS=0
+    задача выполняется сразу в вызывающем потоке.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.store = None
+        self.pending = {}
+        self.executor = None
+        self.config = None
+        self.dropped = 0
+
+    def configure(self):
+        with self.lock:
+            if self.config is None:
+                config = get_thumbnail_config()
+                self.fetcher = import_string(config['FETCHER'])(
+                    **config['FETCHER_OPTIONS']
+                )
+                self.store = ThumbnailStore(config['ROOT'], config['URL'])
+                self.config = config
+        return self.config
+
+    def get_executor(self):
+        """Пул потоков, создается при первой задаче."""
+        if self.executor is None and self.config['WORKERS']:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.config['WORKERS'],
+                thread_name_prefix='thumbnails'
+            )
+        return self.executor
+
+    def reset(self):
+        """Перечитать настройки; запущенные задачи доработают в старом пуле."""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+            self.executor = None
+            self.config = None
+            self.pending = {}
+            self.dropped = 0
+
+    def wait(self):
+        """Дождаться завершения поставленных задач."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def result_key(self, url):
+        digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+        return f'{ADS_CACHE_PREFIX}:thumbnail:{digest}'
+
+    def submit(self, url, ad_ids):
+        """Поставить URL в очередь для объявлений ad_ids.
+
+        Возвращает False, если очередь заполнена.
+        """
+        config = self.configure()
+        with self.lock:
+            if url in self.pending:
+                self.pending[url].update(ad_ids)
+                return True
+            if len(self.pending) >= config['QUEUE_MAX']:
+                self.dropped += 1
+                return False
+            self.pending[url] = set(ad_ids)
+            executor = self.get_executor()
+        if executor is None:
+            self.process(url)
+        else:
+            executor.submit(self.run, url)
+        return True
+
+    def run(self, url):
+        close_old_connections()
+        try:
+            self.process(url)
+        except Exception:
+            logger.exception('Ошибка обработки изображения %s', url)
+        finally:
+            close_old_connections()
+
+    def process(self, url):
+        try:
+            thumbnail = self.build(url)
+        except ThumbnailError as exc:
+            logger.warning('%s', exc)
+            thumbnail = None
+        with self.lock:
+            ad_ids = self.pending.pop(url, set())
+        self.save(url, ad_ids, thumbnail)
+
+    def build(self, url):
+        """Миниатюра из кэша результатов или из загруженного файла.
+
+        Результат из кэша используется, только если файл миниатюры
+        есть в хранилище.
+        """
+        cache = caches[ad_cache.alias]
+        key = self.result_key(url)
+        cached = cache.get(key)
+        if cached is not None:
+            thumbnail = Thumbnail(*cached)
+            if self.store.exists(thumbnail.thumbnail_hash):
+                return thumbnail
+        data = self.fetcher.fetch(url)
+        width, height, thumbnail = render_thumbnail(data, self.config['SIZE'])
+        result = Thumbnail(
+            hashlib.sha256(data).hexdigest(), width, height,
+            self.store.save(thumbnail)
+        )
+        cache.set(key, tuple(result), THUMBNAIL_CACHE_TIMEOUT)
+        return result
+
+    def save(self, url, ad_ids, thumbnail):
+        """Запись результата объявлениям, у которых URL не сменился."""
+        from .models import Ad
+
+        if thumbnail is None:
+            fields = {
+                'image_hash': None, 'image_width': None,
+                'image_height': None, 'thumbnail_hash': None,
+                'image_status': 'invalid',
+            }
+        else:
+            fields = {
+                'image_hash': thumbnail.image_hash,
+                'image_width': thumbnail.width,
+                'image_height': thumbnail.height,
+                'thumbnail_hash': thumbnail.thumbnail_hash,
+                'image_status': 'ready',
+            }
+        updated = Ad.objects.filter(id__in=ad_ids, image_url=url).update(
+            updated_at=timezone.now(), **fields
+        )
+        if updated:
+            ad_cache.invalidate(*ad_ids)
+
+    def stats(self):
+        with self.lock:
+            return {'pending': len(self.pending), 'dropped': self.dropped}
+
+
+thumbnail_pipeline = ThumbnailPipeline()
+
+
+def thumbnail_url(thumbnail_hash):
+    """Адрес миниатюры по хэшу или None."""
+    if not thumbnail_hash:
+        return None
+    if thumbnail_pipeline.config is None:
+        thumbnail_pipeline.configure()
+    return thumbnail_pipeline.store.url(thumbnail_hash)
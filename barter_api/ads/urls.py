@@ -1,38 +1,137 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import (
+    AdBulkCreateView,
+    AdBulkDeactivateView,
+    AdExportView,
     AdListCreateView,
     AdRetrieveUpdateDestroyView,
+    AsyncAdExportView,
+    AsyncAdListCreateView,
+    AsyncAdRetrieveUpdateDestroyView,
+    AsyncExchangeProposalCreateView,
+    AsyncExchangeProposalExportView,
+    AsyncExchangeProposalUpdateView,
+    AsyncUserIncomingProposalsListView,
+    AsyncUserOutgoingProposalsListView,
+    AsyncUserProposalsListView,
     ExchangeProposalCreateView,
+    ExchangeProposalExportView,
     ExchangeProposalUpdateView,
+    MatchesView,
+    MetricsView,
+    ProposalEventsView,
+    RecommendationsView,
+    SummaryView,
+    UserIncomingProposalsListView,
+    UserOutgoingProposalsListView,
     UserProposalsListView
 )
 
 
-urlpatterns = [
-    path(
-        'ads/',
-        AdListCreateView.as_view(),
-        name='ad-list-create'
-    ),
-    path(
-        'ads/<int:pk>/',
-        AdRetrieveUpdateDestroyView.as_view(),
-        name='ad-detail'
-    ),
-    path(
-        'proposals/',
-        ExchangeProposalCreateView.as_view(),
-        name='proposal-create'
-    ),
-    path(
-        'proposals/<int:pk>/',
-        ExchangeProposalUpdateView.as_view(),
-        name='proposal-update'
-    ),
-    path(
-        'my-proposals/',
-        UserProposalsListView.as_view(),
-        name='user-proposals'
-    ),
-]
+def get_urlpatterns(async_views=False):
+    """Маршруты API; при async_views часть view заменяется async-версиями.
+
+    Поток событий держит соединение открытым, поэтому доступен только
+    при запуске через ASGI.
+    """
+
+    def pick(sync_view, async_view):
+        return (async_view if async_views else sync_view).as_view()
+
+    patterns = [
+        path(
+            'ads/',
+            pick(AdListCreateView, AsyncAdListCreateView),
+            name='ad-list-create'
+        ),
+        path(
+            'ads/bulk/',
+            AdBulkCreateView.as_view(),
+            name='ad-bulk-create'
+        ),
+        path(
+            'ads/bulk-deactivate/',
+            AdBulkDeactivateView.as_view(),
+            name='ad-bulk-deactivate'
+        ),
+        path(
+            'ads/export/',
+            pick(AdExportView, AsyncAdExportView),
+            name='ad-export'
+        ),
+        path(
+            'ads/<int:pk>/',
+            pick(
+                AdRetrieveUpdateDestroyView, AsyncAdRetrieveUpdateDestroyView
+            ),
+            name='ad-detail'
+        ),
+        path(
+            'proposals/',
+            pick(ExchangeProposalCreateView, AsyncExchangeProposalCreateView),
+            name='proposal-create'
+        ),
+        path(
+            'proposals/export/',
+            pick(ExchangeProposalExportView, AsyncExchangeProposalExportView),
+            name='proposal-export'
+        ),
+        path(
+            'proposals/<int:pk>/',
+            pick(ExchangeProposalUpdateView, AsyncExchangeProposalUpdateView),
+            name='proposal-update'
+        ),
+        path(
+            'my-proposals/',
+            pick(UserProposalsListView, AsyncUserProposalsListView),
+            name='user-proposals'
+        ),
+        path(
+            'my-proposals/incoming/',
+            pick(
+                UserIncomingProposalsListView,
+                AsyncUserIncomingProposalsListView
+            ),
+            name='user-proposals-incoming'
+        ),
+        path(
+            'my-proposals/outgoing/',
+            pick(
+                UserOutgoingProposalsListView,
+                AsyncUserOutgoingProposalsListView
+            ),
+            name='user-proposals-outgoing'
+        ),
+        path(
+            'matches/',
+            MatchesView.as_view(),
+            name='matches'
+        ),
+        path(
+            'recommendations/',
+            RecommendationsView.as_view(),
+            name='recommendations'
+        ),
+        path(
+            'summary/',
+            SummaryView.as_view(),
+            name='summary'
+        ),
+        path(
+            'metrics/',
+            MetricsView.as_view(),
+            name='metrics'
+        ),
+    ]
+    if async_views:
+        patterns.append(path(
+            'events/proposals/',
+            ProposalEventsView.as_view(),
+            name='proposal-events'
+        ))
+    return patterns
+
+
+urlpatterns = get_urlpatterns(settings.ADS_ASYNC_VIEWS)
@@ -1,43 +1,369 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Value
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.fields import BooleanField
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (
-    CreateAPIView, ListAPIView, ListCreateAPIView,
+    CreateAPIView, GenericAPIView, ListAPIView, ListCreateAPIView,
     RetrieveUpdateDestroyAPIView, UpdateAPIView
 )
 from rest_framework.permissions import (
-    IsAuthenticated, IsAuthenticatedOrReadOnly
+    IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 )
 from rest_framework.response import Response
-from rest_framework.status import HTTP_204_NO_CONTENT
+from rest_framework.status import (
+    HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST
+)
+from rest_framework.views import APIView
 
-from .filters import AdFilter
-from .models import Ad, ExchangeProposal
-from .pagination import AdsPagination
+from .authentication import token_cache
+from .cache import ad_cache
+from .conditional import (
+    ad_validators, cached_response, not_modified, page_validators
+)
+from .constants import (
+    BULK_BATCH_SIZE, BULK_SIZE_MAX, CATEGORY_CHOICES,
+    EVENTS_LAST_ID_QUERY_PARAM, EXPORT_CHUNK_SIZE, EXPORT_FORMAT_DEFAULT,
+    EXPORT_FORMAT_QUERY_PARAM, FACETS_QUERY_PARAM, PROPOSAL_DIRECTIONS,
+    STATUS_RECEIVER_ACTIONS, STATUS_SENDER_ACTIONS
+)
+from .events import event_hub, stream_events
+from .exceptions import Conflict
+from .export import (
+    AD_EXPORT_FIELDS, EXPORT_FORMATS, PROPOSAL_EXPORT_FIELDS, aexport,
+    export
+)
+from .filters import AdFilter, ExchangeProposalFilter
+from .matching import matching_engine
+from .metrics import metrics_registry
+from .models import (
+    Ad, ArchivedAd, CategoryCounter, ExchangeProposal, UserCounter
+)
+from .pagination import (
+    AdsPagination, ProposalsFeedPagination, ProposalsPagination
+)
+from .recommendations import recommendation_engine
+from .renderers import EventStreamRenderer, FastJSONRenderer
+from .routing import ReplicaReadMixin, replica_set
 from .serializers import (
-    AdSerializer, ExchangeProposalSerializer,
-    ExchangeProposaUpdatelSerializer
+    AdBulkDeactivateSerializer, AdReadSerializer, AdSerializer,
+    ExchangeProposalReadSerializer, ExchangeProposalSerializer,
+    ExchangeProposaUpdatelSerializer, MatchQuerySerializer,
+    RecommendationQuerySerializer, SummaryQuerySerializer, ValuesSerializer
+)
+from .signals import (
+    ads_bulk_created, ads_bulk_deactivated, proposal_status_changed
 )
+from .thumbnails import thumbnail_pipeline
+from .throttling import write_admission
+
+
+class FastReadMixin:
+    """Чтение через быстрый сериализатор строк .values() для GET."""
 
+    read_serializer_class = None
 
-class AdListCreateView(ListCreateAPIView):
+    def use_read_serializer(self):
+        return (
+            self.request.method == 'GET'
+            and self.read_serializer_class is not None
+            and not getattr(self, 'swagger_fake_view', False)
+        )
+
+    def get_serializer_class(self):
+        if self.use_read_serializer():
+            return self.read_serializer_class
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.use_read_serializer():
+            queryset = self.read_serializer_class.prepare_queryset(queryset)
+        return queryset
+
+
+class AdListCreateView(ReplicaReadMixin, FastReadMixin, ListCreateAPIView):
     """Endpoint для просмотра списка и создания объявлений."""
 
-    queryset = Ad.objects.filter(is_active=True)
+    queryset = Ad.objects.active().with_related()
     serializer_class = AdSerializer
+    read_serializer_class = AdReadSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = AdFilter
-    search_fields = ['title', 'description']
     ordering_fields = ['created_at', 'title']
     pagination_class = AdsPagination
+    throttle_scope = 'ads'
 
+    def list(self, request, *args, **kwargs):
+        """Страница ленты из кэша или из базы.
 
-class AdRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
-    """Endpoint для просмотра, обновления и удаления объявления."""
+        Если ETag клиента совпадает, отдается 304 без сериализации.
+        """
+        key = ad_cache.list_key(request)
+        entry = None if self.pinned else ad_cache.get(key)
+        if entry is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            facets = self.get_facets(request)
+            validators = page_validators(self.get_page_state(facets), page)
+            response = not_modified(request, validators)
+            if response is not None:
+                return response
+            entry = self.get_page_entry(page, validators, facets)
+            ad_cache.set(key, entry)
+        return cached_response(request, entry)
+
+    def facets_requested(self, request):
+        return (
+            request.query_params.get(FACETS_QUERY_PARAM)
+            in BooleanField.TRUE_VALUES
+        )
+
+    def get_facets(self, request):
+        """Счетчики по category и condition, если запрошены ?facets=true.
+
+        Считаются по текущим фильтрам и поиску и кэшируются по ним, а
+        не по странице, поэтому общие для всех страниц выборки.
+        """
+        if not self.facets_requested(request):
+            return None
+        filterset = DjangoFilterBackend().get_filterset(
+            request, self.get_queryset(), self
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        signature = filterset.get_facet_signature()
+        key = ad_cache.facets_key(signature)
+        facets = None if self.pinned else ad_cache.get(key)
+        if facets is None:
+            facets = filterset.facet_counts()
+            ad_cache.set(key, facets)
+        return facets
+
+    def get_page_state(self, facets):
+        state = self.paginator.get_page_state()
+        if facets is not None:
+            state.append(facets)
+        return state
+
+    def get_page_entry(self, page, validators, facets=None):
+        """Запись кэша: данные страницы вместе с ее валидаторами."""
+        data = self.get_serializer(page, many=True).data
+        data = self.get_paginated_response(data).data
+        if facets is not None:
+            data['facets'] = facets
+        return {**validators, 'data': data}
+
+
+class AdBulkCreateView(GenericAPIView):
+    """Endpoint для массового создания объявлений."""
 
     queryset = Ad.objects.all()
     serializer_class = AdSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'ads_bulk'
+
+    def post(self, request, *args, **kwargs):
+        """Проверка каждого объявления и вставка корректных через bulk_create.
+
+        Ошибки возвращаются по индексу элемента в исходном списке.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError("Ожидается список объявлений")
+        if len(request.data) > BULK_SIZE_MAX:
+            raise ValidationError(
+                f"Не больше {BULK_SIZE_MAX} объявлений за запрос"
+            )
+        ads, errors = [], []
+        for index, item in enumerate(request.data):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                ads.append(Ad(user=request.user, **serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        with transaction.atomic():
+            created = Ad.objects.bulk_create(ads, batch_size=BULK_BATCH_SIZE)
+            if created:
+                ads_bulk_created.send(sender=Ad, ads=created)
+        return Response(
+            {
+                'created': self.get_serializer(created, many=True).data,
+                'errors': errors,
+            },
+            status=HTTP_201_CREATED if created else HTTP_400_BAD_REQUEST
+        )
+
+
+class AdBulkDeactivateView(GenericAPIView):
+    """Endpoint для массового удаления объявлений."""
+
+    queryset = Ad.objects.all()
+    serializer_class = AdBulkDeactivateSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'ads_bulk_deactivate'
+
+    def post(self, request, *args, **kwargs):
+        """Выставление неактивного статуса своим объявлениям одним UPDATE."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        with transaction.atomic():
+            deactivated = self.get_queryset().filter(
+                id__in=ids, user=request.user
+            ).deactivate()
+            if deactivated:
+                ads_bulk_deactivated.send(
+                    sender=Ad,
+                    ids=[ad['id'] for ad in deactivated],
+                    ads=deactivated
+                )
+        return Response(
+            {'deactivated': len(deactivated)}, status=HTTP_200_OK
+        )
+
+
+class ExportView(APIView):
+    """Базовый endpoint потоковой выгрузки в NDJSON или CSV."""
+
+    permission_classes = [IsAdminUser]
+    queryset = None
+    filterset_class = None
+    export_fields = ()
+    export_chunk_size = EXPORT_CHUNK_SIZE
+    filename = None
+
+    def get(self, request, *args, **kwargs):
+        """Выгрузка отфильтрованных записей без загрузки в память."""
+        export_format = request.query_params.get(
+            EXPORT_FORMAT_QUERY_PARAM, EXPORT_FORMAT_DEFAULT
+        )
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({
+                EXPORT_FORMAT_QUERY_PARAM: (
+                    f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}"
+                )
+            })
+        filterset = self.filterset_class(
+            request.query_params, queryset=self.queryset.all()
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        _, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            self.get_content(filterset.qs, export_format),
+            content_type=f'{content_type}; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.filename}.{export_format}"'
+        )
+        return response
+
+    def get_content(self, queryset, export_format):
+        return export(
+            queryset, self.export_fields, export_format,
+            self.export_chunk_size
+        )
+
+
+class AdExportView(ExportView):
+    """Endpoint для выгрузки активных объявлений."""
+
+    queryset = Ad.objects.active()
+    filterset_class = AdFilter
+    export_fields = AD_EXPORT_FIELDS
+    filename = 'ads'
+
+
+class ExchangeProposalExportView(ExportView):
+    """Endpoint для выгрузки предложений обмена."""
+
+    queryset = ExchangeProposal.objects.all()
+    filterset_class = ExchangeProposalFilter
+    export_fields = PROPOSAL_EXPORT_FIELDS
+    filename = 'proposals'
+
+
+class AsyncExportMixin:
+    """Выгрузка асинхронным итератором для запуска через ASGI.
+
+    Синхронный итератор ASGI-обработчик Django собирает в список до
+    отправки первого байта.
+    """
+
+    def get_content(self, queryset, export_format):
+        return aexport(
+            queryset, self.export_fields, export_format,
+            self.export_chunk_size
+        )
+
+
+class AsyncAdExportView(AsyncExportMixin, AdExportView):
+    """Асинхронная выгрузка активных объявлений."""
+
+
+class AsyncExchangeProposalExportView(
+    AsyncExportMixin, ExchangeProposalExportView
+):
+    """Асинхронная выгрузка предложений обмена."""
+
+
+class AdRetrieveUpdateDestroyView(
+    ReplicaReadMixin, FastReadMixin, RetrieveUpdateDestroyAPIView
+):
+    """Endpoint для просмотра, обновления и удаления объявления."""
+
+    queryset = Ad.objects.with_related()
+    archive_queryset = ArchivedAd.objects.annotate(is_active=Value(False))
+    serializer_class = AdSerializer
+    read_serializer_class = AdReadSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    throttle_scope = 'ads'
+
+    def get_archive_queryset(self):
+        """Строки архива в формате быстрого сериализатора."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.read_serializer_class.prepare_queryset(
+            self.archive_queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        )
+
+    def get_object_or_archived(self):
+        """Объявление из основной таблицы, а если его там нет - из архива."""
+        try:
+            return self.get_object()
+        except Http404:
+            if not self.use_read_serializer():
+                raise
+        row = self.get_archive_queryset().first()
+        if row is None:
+            raise Http404
+        self.check_object_permissions(self.request, row)
+        return row
+
+    def retrieve(self, request, *args, **kwargs):
+        """Карточка объявления из кэша, из базы или из архива.
+
+        Если ETag или Last-Modified клиента актуальны, отдается 304
+        без сериализации.
+        """
+        pk = kwargs[self.lookup_field]
+        key = ad_cache.detail_key(pk)
+        entry = None if self.pinned else ad_cache.get(key)
+        if entry is None:
+            instance = self.get_object_or_archived()
+            validators = ad_validators(instance)
+            response = not_modified(request, validators)
+            if response is not None:
+                return response
+            entry = {**validators, 'data': self.get_serializer(instance).data}
+            ad_cache.set(key, entry)
+        return cached_response(request, entry)
 
     def perform_update(self, serializer):
         """Обновление объявления с проверкой прав доступа."""
@@ -66,6 +392,7 @@ class ExchangeProposalCreateView(CreateAPIView):
     queryset = ExchangeProposal.objects.all()
     serializer_class = ExchangeProposalSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'proposals'
 
     def perform_create(self, serializer):
         """Соаздние предложения обмена."""
@@ -75,34 +402,416 @@ class ExchangeProposalCreateView(CreateAPIView):
 class ExchangeProposalUpdateView(UpdateAPIView):
     """Endpoint для обновления статуса предложения обмена."""
 
-    queryset = ExchangeProposal.objects.all()
+    queryset = ExchangeProposal.objects.with_related()
     serializer_class = ExchangeProposaUpdatelSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'proposals'
 
     def perform_update(self, serializer):
-        """Обновление предложения обмена."""
-        instance = self.get_object()
-        if instance.ad_receiver.user != self.request.user:
+        """Атомарная смена статуса предложения обмена.
+
+        Принять или отклонить может получатель, отменить - отправитель.
+        """
+        instance = serializer.instance
+        status = serializer.validated_data['status']
+        if status in STATUS_SENDER_ACTIONS:
+            if instance.ad_sender.user != self.request.user:
+                self.permission_denied(
+                    self.request,
+                    message="Только отправитель может отменить предложение"
+                )
+        elif status in STATUS_RECEIVER_ACTIONS:
+            if instance.ad_receiver.user != self.request.user:
+                self.permission_denied(
+                    self.request,
+                    message=(
+                        "Только получатель может изменить статус предложения"
+                    )
+                )
+        else:
             self.permission_denied(
-                self.request,
-                message="Только получатель может изменить статус предложения"
+                self.request, message="Недопустимая смена статуса"
             )
-        serializer.save()
+        with transaction.atomic():
+            changes = ExchangeProposal.objects.transition(instance, status)
+            if not changes:
+                raise Conflict("Предложение уже не ожидает ответа")
+            proposal_status_changed.send(
+                sender=ExchangeProposal, changes=changes
+            )
+        instance.status = status
 
 
-class UserProposalsListView(ListAPIView):
+class UserProposalsListView(ReplicaReadMixin, FastReadMixin, ListAPIView):
     """Endpoint для просмотра предложений пользователя."""
 
     serializer_class = ExchangeProposalSerializer
+    read_serializer_class = ExchangeProposalReadSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status']
+    pagination_class = ProposalsPagination
+    directions = tuple(PROPOSAL_DIRECTIONS)
 
     def get_queryset(self):
         """Возвращает предложения, связанные с текущим пользователем."""
-        user = self.request.user
-        return ExchangeProposal.objects.filter(
-            ad_receiver__user=user
-        ) | ExchangeProposal.objects.filter(
-            ad_sender__user=user
-        ).select_related('ad_sender', 'ad_receiver')
+        return ExchangeProposal.objects.for_user(
+            self.request.user, *self.directions
+        ).with_related()
+
+    def get_feeds(self):
+        """Отфильтрованные выборки по каждому направлению."""
+        return [
+            ExchangeProposal.objects.for_user(
+                self.request.user, direction
+            ).with_related()
+            for direction in self.directions
+        ]
+
+    def list(self, request, *args, **kwargs):
+        """Страница предложений; в keyset-режиме слиянием направлений."""
+        if not self.paginator.is_keyset(request):
+            return super().list(request, *args, **kwargs)
+        page = self.paginator.paginate_querysets(
+            [self.filter_queryset(feed) for feed in self.get_feeds()],
+            request, view=self
+        )
+        data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
+
+
+class UserIncomingProposalsListView(UserProposalsListView):
+    """Endpoint для входящих предложений пользователя."""
+
+    pagination_class = ProposalsFeedPagination
+    directions = ('incoming',)
+
+
+class UserOutgoingProposalsListView(UserProposalsListView):
+    """Endpoint для исходящих предложений пользователя."""
+
+    pagination_class = ProposalsFeedPagination
+    directions = ('outgoing',)
+
+
+class MatchesView(APIView):
+    """Endpoint для подбора обменов текущему пользователю."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """Циклы обмена через пользователя и встречные подсказки."""
+        serializer = MatchQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        user_id = request.user.id
+        return Response({
+            'cycles': matching_engine.find_cycles(
+                user_id, max_depth=serializer.validated_data['depth']
+            ),
+            'suggestions': matching_engine.suggest(user_id),
+        })
+
+
+class RecommendationsView(APIView):
+    """Endpoint для ленты "на что можно обменяться"."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """Активные объявления других пользователей по убыванию оценки.
+
+        Порядок и оценки берутся из движка рекомендаций, строки
+        объявлений - одним запросом по id.
+        """
+        serializer = RecommendationQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        ranked = recommendation_engine.recommend(
+            request.user.id, serializer.validated_data['limit']
+        )
+        rows = {
+            row['id']: row for row in AdReadSerializer.prepare_queryset(
+                Ad.objects.active().filter(
+                    id__in=[ad_id for ad_id, _ in ranked]
+                )
+            )
+        }
+        ads = AdReadSerializer(
+            [rows[ad_id] for ad_id, _ in ranked if ad_id in rows], many=True
+        ).data
+        scores = dict(ranked)
+        for ad in ads:
+            ad['score'] = round(scores[ad['id']], 4)
+        return Response({'results': ads})
+
+
+class SummaryView(APIView):
+    """Endpoint для счетчиков-бейджей."""
+
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request, *args, **kwargs):
+        """Активные объявления по категориям и счетчики пользователей.
+
+        Значения берутся из таблиц счетчиков, без COUNT(*) по объявлениям
+        и предложениям. Ожидающие предложения видны только владельцу.
+        """
+        serializer = SummaryQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        categories = dict.fromkeys(
+            (value for value, _ in CATEGORY_CHOICES), 0
+        )
+        categories.update(
+            CategoryCounter.objects.values_list('category', 'active_ads')
+        )
+        data = {'categories': categories, 'me': None}
+        if request.user.is_authenticated:
+            counters = UserCounter.objects.filter(
+                user_id=request.user.id
+            ).values(*UserCounter.counter_fields).first()
+            data['me'] = counters or dict.fromkeys(
+                UserCounter.counter_fields, 0
+            )
+        user_id = serializer.validated_data.get('user')
+        if user_id is not None:
+            active_ads = UserCounter.objects.filter(
+                user_id=user_id
+            ).values_list('active_ads', flat=True).first()
+            data['user'] = {'id': user_id, 'active_ads': active_ads or 0}
+        return Response(data)
+
+
+class MetricsView(APIView):
+    """Endpoint для метрик производительности процесса."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        """Гистограммы и счетчики по view, статистика кэша и очередей."""
+        return Response({
+            'views': metrics_registry.snapshot(),
+            'ad_cache': ad_cache.stats(),
+            'auth_cache': token_cache.stats(),
+            'write_admission': write_admission.stats(),
+            'replicas': replica_set.stats(),
+            'events': {'subscribers': event_hub.subscriber_count()},
+            'thumbnails': thumbnail_pipeline.stats(),
+            'recommendations': recommendation_engine.stats(),
+        })
+
+
+class AsyncViewMixin:
+    """Асинхронный dispatch для view DRF.
+
+    Аутентификация, проверка прав и throttling выполняются в потоке
+    через sync_to_async, так как могут обращаться к базе. Асинхронные
+    обработчики вызываются напрямую, синхронные (запись) - в потоке,
+    поэтому view может совмещать оба вида обработчиков.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            method = request.method.lower()
+            handler = self.http_method_not_allowed
+            if method in self.http_method_names:
+                handler = getattr(self, method, handler)
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(
+                    request, *args, **kwargs
+                )
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+    async def afilter_queryset(self, queryset):
+        """filter_queryset в потоке: валидация фильтров обращается к базе."""
+        return await sync_to_async(self.filter_queryset)(queryset)
+
+    async def aget_object(self):
+        """Асинхронная версия get_object."""
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (
+            queryset.model.DoesNotExist, DjangoValidationError,
+            TypeError, ValueError
+        ):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(
+            self.request, obj
+        )
+        return obj
+
+    async def aserialize(self, instance, many=False):
+        """Данные сериализатора; ModelSerializer работает в потоке."""
+        serializer = self.get_serializer(instance, many=many)
+        if isinstance(serializer, ValuesSerializer):
+            return serializer.data
+        return await sync_to_async(lambda: serializer.data)()
+
+    async def alist(self, request, *args, **kwargs):
+        """Асинхронная версия ListModelMixin.list."""
+        queryset = await self.afilter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(
+                queryset, request, view=self
+            )
+            if page is not None:
+                return self.get_paginated_response(
+                    await self.aserialize(page, many=True)
+                )
+        rows = [row async for row in queryset]
+        return Response(await self.aserialize(rows, many=True))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """Асинхронная версия RetrieveModelMixin.retrieve."""
+        return Response(await self.aserialize(await self.aget_object()))
+
+
+class AsyncAdListCreateView(AsyncViewMixin, AdListCreateView):
+    """Асинхронный endpoint ленты объявлений."""
+
+    async def get(self, request, *args, **kwargs):
+        """Страница ленты из кэша или из базы."""
+        key = await sync_to_async(ad_cache.list_key)(request)
+        entry = None
+        if not self.pinned:
+            entry = await sync_to_async(ad_cache.get)(key)
+        if entry is None:
+            queryset = await self.afilter_queryset(self.get_queryset())
+            page = await self.paginator.apaginate_queryset(
+                queryset, request, view=self
+            )
+            facets = await sync_to_async(self.get_facets)(request)
+            validators = page_validators(self.get_page_state(facets), page)
+            response = not_modified(request, validators)
+            if response is not None:
+                return response
+            entry = self.get_page_entry(page, validators, facets)
+            await sync_to_async(ad_cache.set)(key, entry)
+        return cached_response(request, entry)
+
+
+class AsyncAdRetrieveUpdateDestroyView(
+    AsyncViewMixin, AdRetrieveUpdateDestroyView
+):
+    """Асинхронный endpoint карточки объявления."""
+
+    async def aget_object_or_archived(self):
+        try:
+            return await self.aget_object()
+        except Http404:
+            if not self.use_read_serializer():
+                raise
+        row = await self.get_archive_queryset().afirst()
+        if row is None:
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(
+            self.request, row
+        )
+        return row
+
+    async def get(self, request, *args, **kwargs):
+        """Карточка объявления из кэша, из базы или из архива."""
+        pk = kwargs[self.lookup_field]
+        key = await sync_to_async(ad_cache.detail_key)(pk)
+        entry = None
+        if not self.pinned:
+            entry = await sync_to_async(ad_cache.get)(key)
+        if entry is None:
+            instance = await self.aget_object_or_archived()
+            validators = ad_validators(instance)
+            response = not_modified(request, validators)
+            if response is not None:
+                return response
+            entry = {**validators, 'data': await self.aserialize(instance)}
+            await sync_to_async(ad_cache.set)(key, entry)
+        return cached_response(request, entry)
+
+
+class AsyncExchangeProposalCreateView(
+    AsyncViewMixin, ExchangeProposalCreateView
+):
+    """Асинхронный endpoint создания предложений обмена."""
+
+
+class AsyncExchangeProposalUpdateView(
+    AsyncViewMixin, ExchangeProposalUpdateView
+):
+    """Асинхронный endpoint смены статуса предложения обмена."""
+
+
+class AsyncUserProposalsListView(AsyncViewMixin, UserProposalsListView):
+    """Асинхронный endpoint предложений пользователя."""
+
+    async def get(self, request, *args, **kwargs):
+        if not self.paginator.is_keyset(request):
+            return await self.alist(request, *args, **kwargs)
+        page = await self.paginator.apaginate_querysets(
+            [await self.afilter_queryset(feed) for feed in self.get_feeds()],
+            request, view=self
+        )
+        return self.get_paginated_response(
+            await self.aserialize(page, many=True)
+        )
+
+
+class AsyncUserIncomingProposalsListView(
+    AsyncUserProposalsListView, UserIncomingProposalsListView
+):
+    """Асинхронный endpoint входящих предложений пользователя."""
+
+
+class AsyncUserOutgoingProposalsListView(
+    AsyncUserProposalsListView, UserOutgoingProposalsListView
+):
+    """Асинхронный endpoint исходящих предложений пользователя."""
+
+
+class ProposalEventsView(AsyncViewMixin, APIView):
+    """Endpoint потока событий предложений обмена (SSE).
+
+    Отправитель и получатель узнают о создании предложения и смене
+    его статуса без опроса /api/my-proposals/. После переподключения
+    поток продолжается с заголовка Last-Event-ID.
+    """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, EventStreamRenderer]
+
+    def get_last_event_id(self, request):
+        value = request.headers.get('Last-Event-ID') or (
+            request.query_params.get(EVENTS_LAST_ID_QUERY_PARAM)
+        )
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({
+                EVENTS_LAST_ID_QUERY_PARAM: "Ожидается целое число"
+            })
+
+    async def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            stream_events(request.user.id, self.get_last_event_id(request)),
+            content_type='text/event-stream; charset=utf-8'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barter_api.settings')
+os.environ.setdefault('ADS_ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
+
+from ads.engines import warm_engines  # noqa: E402
+
+warm_engines()
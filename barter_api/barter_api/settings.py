@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 
@@ -17,12 +18,16 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework.authtoken',
     'django_filters',
     'ads',
     'drf_yasg',
 ]
 
 MIDDLEWARE = [
+    'ads.middleware.PerformanceMiddleware',
+    'ads.middleware.WriteAdmissionMiddleware',
+    'ads.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,13 +56,135 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'barter_api.wsgi.application'
 
-DATABASES = {
-    'default': {
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+
+# Реплики задаются списком файлов SQLite в DB_REPLICAS (для локальной
+# проверки маршрутизации) или хостов PostgreSQL в POSTGRES_REPLICA_HOSTS.
+# Без них единственная реплика читает файл основной базы и не
+# используется для маршрутизации; в тестах она зеркалит default.
+if os.getenv('POSTGRES_DB'):
+    PRIMARY_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('POSTGRES_DB'),
+        'USER': os.getenv('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+        'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+        'PORT': os.getenv('POSTGRES_PORT', '5432'),
+    }
+    REPLICA_DATABASES = [
+        {**PRIMARY_DATABASE, 'HOST': host}
+        for host in os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',')
+        if host
+    ]
+else:
+    PRIMARY_DATABASE = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
+    REPLICA_DATABASES = [
+        {**PRIMARY_DATABASE, 'NAME': BASE_DIR / name}
+        for name in os.getenv('DB_REPLICAS', '').split(',')
+        if name
+    ]
+
+DATABASES = {
+    'default': PRIMARY_DATABASE,
+    **{
+        f'replica{index}': {**database, 'TEST': {'MIRROR': 'default'}}
+        for index, database in enumerate(
+            REPLICA_DATABASES or [PRIMARY_DATABASE], start=1
+        )
+    },
+}
+for database in DATABASES.values():
+    database.update({
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+DATABASE_ROUTERS = ['ads.routing.ReplicaRouter']
+
+# Кэш ленты, метки read-your-writes и счетчики записей должны быть
+# общими для процессов: Redis из REDIS_URL или каталог CACHE_DIR.
+# Кэш в памяти подходит только для одного процесса, с репликами
+# проверка ads.E001 его не допускает.
+if os.getenv('REDIS_URL'):
+    DEFAULT_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+elif os.getenv('CACHE_DIR'):
+    DEFAULT_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / os.getenv('CACHE_DIR'),
+    }
+else:
+    DEFAULT_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+
+CACHES = {
+    'default': DEFAULT_CACHE,
+}
+
+ADS_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+ADS_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'LOCAL_TIMEOUT': 30,
+    'TIMEOUT': 300,
+    'SHARED_ALIAS': None,
+}
+
+ADS_ENGINES = {
+    'CHECK_INTERVAL': 1,
+    'RELOAD_INTERVAL': 10,
+    'MAX_AGE': 600,
+    'WARM_ON_START': True,
+}
+
+ADS_EVENTS = {
+    'BACKEND': 'ads.events.LocalEventBackend',
+    'HISTORY': 1000,
+    'HISTORY_TTL': 3600,
+}
+
+ADS_ARCHIVE = {
+    'AGE_DAYS': 90,
+    'BATCH_SIZE': 500,
+}
+
+ADS_THUMBNAILS = {
+    'FETCHER': 'ads.thumbnails.HTTPFetcher',
+    'ROOT': BASE_DIR / 'media' / 'thumbnails',
+    'URL': '/media/thumbnails/',
+    'SIZE': (320, 320),
+    'WORKERS': 4,
 }
 
+ADS_THROTTLING = {
+    'STORE': 'ads.throttling.LocalRateStore',
+    'STORE_OPTIONS': {},
+    'WRITE_CONCURRENCY': 32,
+}
+
+ADS_DATABASE_ROUTING = {
+    'REPLICAS': [
+        f'replica{index}'
+        for index in range(1, len(REPLICA_DATABASES) + 1)
+    ],
+    'STICKY_SECONDS': 5,
+    'HEALTH_CHECK_INTERVAL': 10,
+}
+
+ADS_ASYNC_VIEWS = os.getenv('ADS_ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Без DEBUG замеряется 1% запросов и лог выключен.
+PERF_INSTRUMENTATION = {'SAMPLE_RATE': 1.0, 'LOG': True} if DEBUG else {}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -83,14 +210,37 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'ads.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'ads.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'ads.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'ads.throttling.UserWriteThrottle',
+        'ads.throttling.ScopedWriteThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'writes': '120/min',
+        'ads': '30/min',
+        'ads_bulk': '10/min',
+        'ads_bulk_deactivate': '10/min',
+        'proposals': '30/min',
+    },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barter_api.settings')
 
 application = get_wsgi_application()
+
+from ads.engines import warm_engines  # noqa: E402
+
+warm_engines()